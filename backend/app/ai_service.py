@@ -1,6 +1,7 @@
 """
 阿里云大模型服务
 """
+import hashlib
 import json
 import logging
 from typing import Dict, Optional
@@ -11,6 +12,7 @@ sys.path.append(str(Path(__file__).parent.parent))
 import dashscope
 from dashscope import Generation
 from config import settings
+from app.cache import ResponseCache, TTLCache
 
 logger = logging.getLogger(__name__)
 
@@ -27,12 +29,27 @@ def convert_decimal(obj):
     else:
         return obj
 
+def normalize_text(text: Optional[str]) -> str:
+    """小写并合并空白，用于生成缓存键"""
+    return ' '.join((text or '').lower().split())
+
 # 设置API Key
 dashscope.api_key = settings.DASHSCOPE_API_KEY
 
 class AIService:
     def __init__(self):
         self.model = settings.DASHSCOPE_MODEL
+        # 相同输入的模型响应在有效期内直接复用；只缓存成功解析的响应，失败时的默认结果不缓存
+        self.cache = ResponseCache(
+            maxsize=settings.AI_CACHE_MAX_ENTRIES,
+            ttl=settings.AI_CACHE_TTL,
+            path=settings.AI_CACHE_PATH,
+        )
+    
+    def _cache_key(self, kind: str, *parts) -> str:
+        """按模型、调用类型和规范化后的输入生成缓存键"""
+        payload = json.dumps([self.model, kind, *parts], ensure_ascii=False, sort_keys=True, default=str)
+        return f"{kind}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
     
     def generate_statistics_sql(self, statistics_data: Dict) -> Dict:
         """基于统计数据生成SQL查询语句"""
@@ -40,6 +57,12 @@ class AIService:
             # 转换 Decimal 类型为可序列化的类型
             converted_data = convert_decimal(statistics_data)
             
+            # 统计数据不变时复用上次的结果
+            cache_key = self._cache_key('statistics_sql', converted_data)
+            cached = self.cache.get(cache_key)
+            if cached is not TTLCache.MISSING:
+                return cached
+            
             prompt = f"""
 Based on the following file statistics, generate useful SQL queries and chart configurations.
 
@@ -87,22 +110,23 @@ Return JSON format:
                         result_text = result_text[json_start:json_end].strip()
                     
                     result = json.loads(result_text)
+                    self.cache.set(cache_key, result)
                     return result
                 except json.JSONDecodeError:
                     logger.warning("AI返回的不是有效JSON，使用默认格式")
-                    return self._default_statistics_result(converted_data)
+                    return self.default_statistics_result(converted_data)
             else:
                 logger.error(f"AI服务调用失败: {response.message}")
                 converted_data = convert_decimal(statistics_data)
-                return self._default_statistics_result(converted_data)
+                return self.default_statistics_result(converted_data)
         
         except Exception as e:
             logger.error(f"生成统计SQL失败: {e}")
             converted_data = convert_decimal(statistics_data)
-            return self._default_statistics_result(converted_data)
+            return self.default_statistics_result(converted_data)
     
-    def _default_statistics_result(self, statistics_data: Dict) -> Dict:
-        """默认统计结果"""
+    def default_statistics_result(self, statistics_data: Dict) -> Dict:
+        """默认统计结果（不调用大模型）"""
         # 确保统计数据已转换（处理 Decimal 类型）
         converted_data = convert_decimal(statistics_data)
         
@@ -147,12 +171,26 @@ Return JSON format:
             - file_size: BIGINT - file size in bytes
             - file_type: VARCHAR(100) - file type (image/video/document/code/etc)
             - file_extension: VARCHAR(50) - file extension
-            - mime_type: VARCHAR(200) - MIME type
+            - kind_id: INT - references file_kinds.id
+            - mime_type: VARCHAR(200) - only set on rows whose kind_id is NULL
+            - flags: TINYINT - bit flags (1 = symlink, 2 = readable)
             - created_time: DATETIME - file creation time
             - modified_time: DATETIME - file modification time
             - scan_time: DATETIME - scan time
+
+            Table: file_kinds
+            Columns:
+            - id: INT (primary key)
+            - file_type: VARCHAR(100)
+            - file_extension: VARCHAR(50)
+            - mime_type: VARCHAR(200) - MIME type (join files.kind_id = file_kinds.id)
             """
             
+            cache_key = self._cache_key('nl_sql', normalize_text(natural_language), normalize_text(schema_info))
+            cached = self.cache.get(cache_key)
+            if cached is not TTLCache.MISSING:
+                return cached
+            
             prompt = f"""
             User request in natural language: "{natural_language}"
             
@@ -191,6 +229,7 @@ Return JSON format:
                         result_text = result_text[json_start:json_end].strip()
                     
                     result = json.loads(result_text)
+                    self.cache.set(cache_key, result)
                     return result
                 except json.JSONDecodeError:
                     logger.warning("AI返回的不是有效JSON")
@@ -221,6 +260,12 @@ Return JSON format:
             if not files:
                 return {"enhanced": False, "suggestions": []}
             
+            # 提示词只包含关键词和结果数量，缓存键与之对应
+            cache_key = self._cache_key('search_enhancement', normalize_text(keyword), len(files))
+            cached = self.cache.get(cache_key)
+            if cached is not TTLCache.MISSING:
+                return cached
+            
             prompt = f"""
 User searched for keyword: "{keyword}"
 Found {len(files)} related files.
@@ -255,6 +300,7 @@ Return JSON format:
                     
                     result = json.loads(result_text)
                     result["enhanced"] = True
+                    self.cache.set(cache_key, result)
                     return result
                 except json.JSONDecodeError:
                     pass
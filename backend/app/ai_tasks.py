@@ -0,0 +1,124 @@
+"""
+大模型后台任务
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, Optional
+import logging
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+from config import settings
+from app.executors import ai_executor
+
+logger = logging.getLogger(__name__)
+
+class AITask:
+    """一次提交到大模型线程池的调用"""
+
+    def __init__(self, kind: str, key: Optional[Hashable]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.status = 'pending'
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.monotonic()
+        self.created_time = datetime.now()
+        self.finished_time: Optional[datetime] = None
+        self.future: Optional[Future] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'created_time': self.created_time.isoformat(),
+            'finished_time': self.finished_time.isoformat() if self.finished_time else None,
+        }
+
+class AITaskRegistry:
+    """把大模型调用移出请求路径：接口立即返回任务 ID，结果通过 GET /api/ai/tasks/{id} 获取
+
+    每个任务有独立的超时时间，超时后状态固定为 timeout，迟到的结果被丢弃（线程池中的调用无法中断）。
+    相同 kind 和 key 的任务在未过期前复用，重复的请求不会重复调用大模型。
+    结束的任务保留 ttl 秒后清除。
+    """
+
+    def __init__(self, executor: ThreadPoolExecutor, timeout: float = 30.0, ttl: float = 600.0):
+        self.executor = executor
+        self.timeout = max(1.0, timeout)
+        self.ttl = max(self.timeout, ttl)
+        self._tasks: Dict[str, AITask] = {}
+        self._by_key: Dict[tuple, str] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, func: Callable, *args, key: Optional[Hashable] = None, **kwargs) -> Dict:
+        """提交一次调用并返回任务信息；key 相同的任务仍有效时直接返回该任务"""
+        with self._lock:
+            self._expire()
+            if key is not None:
+                task_id = self._by_key.get((kind, key))
+                task = self._tasks.get(task_id) if task_id else None
+                if task is not None and task.status in ('pending', 'running', 'completed'):
+                    return task.to_dict()
+            task = AITask(kind, key)
+            self._tasks[task.id] = task
+            if key is not None:
+                self._by_key[(kind, key)] = task.id
+        task.future = self.executor.submit(self._run, task, func, args, kwargs)
+        return task.to_dict()
+
+    def get(self, task_id: str) -> Optional[Dict]:
+        """任务状态和结果；不存在或已过期时返回 None"""
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None:
+                return None
+            self._check_timeout(task)
+            return task.to_dict()
+
+    def _run(self, task: AITask, func: Callable, args: tuple, kwargs: Dict):
+        with self._lock:
+            if self._check_timeout(task):
+                # 在队列中等待时已经超时，不再调用
+                return
+            task.status = 'running'
+        try:
+            result, error, status = func(*args, **kwargs), None, 'completed'
+        except Exception as e:
+            logger.error(f"大模型任务 {task.kind} 失败: {e}")
+            result, error, status = None, str(e), 'failed'
+        with self._lock:
+            if task.status != 'running':
+                return
+            task.result, task.error, task.status = result, error, status
+            task.finished_time = datetime.now()
+
+    def _check_timeout(self, task: AITask) -> bool:
+        """未结束且超过超时时间的任务标记为 timeout；调用方持有锁"""
+        if task.status in ('pending', 'running') and time.monotonic() - task.created_at > self.timeout:
+            task.status = 'timeout'
+            task.error = f"AI task did not finish within {self.timeout:.0f}s"
+            task.finished_time = datetime.now()
+            logger.warning(f"大模型任务 {task.kind} 超时")
+        return task.status == 'timeout'
+
+    def _expire(self):
+        """清除创建超过 ttl 秒的任务；调用方持有锁"""
+        deadline = time.monotonic() - self.ttl
+        for task_id in [task_id for task_id, task in self._tasks.items() if task.created_at < deadline]:
+            task = self._tasks.pop(task_id)
+            if task.key is not None and self._by_key.get((task.kind, task.key)) == task_id:
+                del self._by_key[(task.kind, task.key)]
+
+ai_tasks = AITaskRegistry(
+    ai_executor,
+    timeout=settings.AI_TASK_TIMEOUT,
+    ttl=settings.AI_TASK_TTL,
+)
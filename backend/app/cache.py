@@ -0,0 +1,277 @@
+"""
+进程内缓存
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+class TTLCache:
+    """线程安全的 LRU + TTL 缓存
+
+    超过 ttl 秒的条目在读取时视为不存在；条目数超过 maxsize 时淘汰最久未使用的条目。
+    """
+
+    MISSING = object()
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """读取缓存，未命中或已过期时返回 default"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: float = None):
+        """写入缓存"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        """删除一个条目"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def metrics(self) -> Dict:
+        """条目数和命中统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+class ResponseCache:
+    """TTLCache 之前加一层可选的 SQLite 持久化，进程重启后缓存仍然有效
+
+    键为字符串，值需可以 JSON 序列化。内存中未命中时再查磁盘，命中后按剩余有效期放回内存；
+    磁盘上的条目按过期时间淘汰，超过 max_disk_entries 时删除最早过期的部分。
+    path 为空时只使用内存。
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0, path: Optional[str] = None,
+                 max_disk_entries: int = 100000):
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.ttl = ttl
+        self.path = path or None
+        self.max_disk_entries = max(1, max_disk_entries)
+        self.disk_hits = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        if self.path:
+            try:
+                directory = os.path.dirname(os.path.abspath(self.path))
+                os.makedirs(directory, exist_ok=True)
+                self._conn = sqlite3.connect(self.path, check_same_thread=False)
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                self._conn.execute("CREATE INDEX IF NOT EXISTS idx_expires_at ON cache (expires_at)")
+                self._conn.commit()
+            except Exception as e:
+                # 磁盘缓存不可用时退回纯内存缓存
+                logger.warning(f"打开缓存文件失败 {self.path}，只使用内存缓存: {e}")
+                self._conn = None
+
+    def get(self, key: str, default: Any = TTLCache.MISSING) -> Any:
+        """读取缓存，未命中或已过期时返回 default"""
+        value = self.memory.get(key)
+        if value is not TTLCache.MISSING or self._conn is None:
+            return default if value is TTLCache.MISSING else value
+        try:
+            with self._lock:
+                row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        except Exception as e:
+            logger.warning(f"读取缓存文件失败: {e}")
+            return default
+        if row is None or row[1] < time.time():
+            return default
+        value = json.loads(row[0])
+        self.memory.set(key, value, ttl=row[1] - time.time())
+        self.disk_hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: float = None):
+        """写入缓存"""
+        ttl = self.ttl if ttl is None else ttl
+        self.memory.set(key, value, ttl=ttl)
+        if self._conn is None:
+            return
+        try:
+            payload = json.dumps(value, ensure_ascii=False, default=str)
+            with self._lock:
+                self._conn.execute("INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                                   (key, payload, time.time() + ttl))
+                self._writes += 1
+                if self._writes % 100 == 0:
+                    self._evict()
+                self._conn.commit()
+        except Exception as e:
+            logger.warning(f"写入缓存文件失败: {e}")
+
+    def _evict(self):
+        """删除过期条目，条目仍然过多时删除最早过期的部分；调用方持有锁"""
+        self._conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+        count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if count > self.max_disk_entries:
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires_at LIMIT ?)",
+                (count - self.max_disk_entries,),
+            )
+
+    def clear(self):
+        """清空内存和磁盘缓存"""
+        self.memory.clear()
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute("DELETE FROM cache")
+                self._conn.commit()
+
+    def metrics(self) -> Dict:
+        """命中统计；磁盘命中同时计入内存未命中"""
+        metrics = self.memory.metrics()
+        metrics['disk_hits'] = self.disk_hits
+        metrics['persistent'] = self._conn is not None
+        return metrics
+
+    def close(self):
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+                self._conn = None
+
+def _paths_overlap(a: str, b: str) -> bool:
+    """两个路径相同或其中一个位于另一个之下"""
+    return a == b or a.startswith(b.rstrip('/') + '/') or b.startswith(a.rstrip('/') + '/')
+
+class QueryCache:
+    """查询结果缓存，写入数据时按路径范围失效
+
+    每个条目带一个路径范围（例如文件列表的 path_prefix），范围为 None 的条目（搜索、统计）与所有路径相关。
+    写入某个路径后，范围与它重叠的条目和所有无范围的条目失效。
+    条目数和结果总行数都有上限，超过时淘汰最久未使用的条目；ttl 兜底数据库被应用之外修改的情况。
+
+    查询开始前取 generation()，写入缓存时传回：查询期间发生过失效则不写入，避免缓存写入前读到的旧数据。
+    """
+
+    MISSING = TTLCache.MISSING
+
+    def __init__(self, maxsize: int = 512, max_rows: int = 200000, ttl: float = 300.0):
+        self.maxsize = max(1, maxsize)
+        self.max_rows = max(1, max_rows)
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._rows = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def generation(self) -> int:
+        with self._lock:
+            return self._generation
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """读取缓存，未命中或已过期时返回 default"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[3] < time.monotonic():
+                if item is not None:
+                    self._remove(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key: Hashable, value: Any, scope: Optional[str], rows: int, generation: int):
+        """写入缓存；rows 为结果行数，用于限制缓存总量"""
+        rows = max(1, rows)
+        if rows > self.max_rows:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, scope, rows, time.monotonic() + self.ttl)
+            self._rows += rows
+            while len(self._data) > self.maxsize or self._rows > self.max_rows:
+                self._remove(next(iter(self._data)))
+
+    def _remove(self, key: Hashable):
+        """调用方持有锁"""
+        self._rows -= self._data.pop(key)[2]
+
+    def invalidate(self, path: Optional[str] = None):
+        """路径下的数据发生变化：移除范围重叠的条目和所有无范围的条目；path 为 None 时清空"""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if path is None:
+                self._data.clear()
+                self._rows = 0
+                return
+            for key in [key for key, item in self._data.items()
+                        if item[1] is None or _paths_overlap(item[1], path)]:
+                self._remove(key)
+
+    def invalidate_unscoped(self):
+        """只影响无范围条目的变化（例如内容索引）"""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            for key in [key for key, item in self._data.items() if item[1] is None]:
+                self._remove(key)
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'rows': self._rows,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'invalidations': self.invalidations,
+            }
@@ -2,38 +2,234 @@
 数据库操作模块
 """
 import pymysql
-from typing import List, Dict, Optional
+import hashlib
+import json
+import math
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Dict, Optional
 from datetime import datetime
 import logging
 import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 from config import settings
+from app.indexer import tokenize
+from app.hasher import PARTIAL_SUFFIX
+from app.scanner import FLAG_READABLE, FLAG_SYMLINK
+from app.cache import QueryCache, TTLCache
+from app.pagination import encode_cursor, decode_cursor
 
 logger = logging.getLogger(__name__)
 
-class Database:
-    def __init__(self):
-        self.connection = None
-        self.connect()
+# 流式导出的列，不包含体积较大的 metadata
+EXPORT_COLUMNS = ['id', 'file_path', 'file_name', 'file_size', 'file_type', 'file_extension', 'mime_type',
+                  'created_time', 'modified_time', 'file_hash', 'hash_type', 'scan_time']
+
+class PoolExhaustedError(Exception):
+    """等待可用数据库连接超时"""
+    pass
+
+class ConnectionPool:
+    """有界数据库连接池
+    
+    连接按需创建，最多 max_size 个；归还的连接放回空闲栈，最近使用的优先被复用。
+    空闲超过 health_check_interval 秒的连接在借出前做一次 ping 检查，
+    不再对每次调用都 ping。
+    """
+    
+    def __init__(self, factory: Callable[[], pymysql.connections.Connection], max_size: int = 10,
+                 timeout: float = 30.0, health_check_interval: float = 30.0, recycle: float = 3600.0):
+        self._factory = factory
+        self.max_size = max(1, max_size)
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.recycle = recycle
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        # 空闲连接: (connection, created_at, last_used_at)
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._closed = False
+        
+        # 连接池指标
+        self._created = 0
+        self._closed_count = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._health_check_failures = 0
+        self._total_wait_time = 0.0
+        self._max_wait_time = 0.0
     
-    def _ensure_connection(self):
-        """确保数据库连接有效"""
+    def _discard(self, conn):
+        """关闭并丢弃连接"""
         try:
-            if self.connection is None:
-                self.connect()
-            else:
-                # 检查连接是否有效
-                self.connection.ping(reconnect=True)
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._closed_count += 1
+    
+    def _is_healthy(self, conn) -> bool:
+        """检查连接是否仍然可用"""
+        try:
+            conn.ping(reconnect=False)
+            return True
         except Exception as e:
-            logger.warning(f"数据库连接检查失败，重新连接: {e}")
-            self.connect()
+            logger.debug(f"连接健康检查失败: {e}")
+            with self._lock:
+                self._health_check_failures += 1
+            return False
+    
+    def acquire(self):
+        """借出一个连接，返回 (connection, created_at)"""
+        if self._closed:
+            raise PoolExhaustedError("数据库连接池已关闭")
+        
+        start = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._timeouts += 1
+            raise PoolExhaustedError(f"等待数据库连接超时（{self.timeout}s），连接池大小: {self.max_size}")
+        waited = time.monotonic() - start
+        
+        try:
+            while True:
+                try:
+                    conn, created_at, last_used_at = self._idle.get_nowait()
+                except queue.Empty:
+                    conn, created_at = self._factory(), time.monotonic()
+                    with self._lock:
+                        self._created += 1
+                    break
+                
+                now = time.monotonic()
+                if self.recycle and now - created_at > self.recycle:
+                    self._discard(conn)
+                    continue
+                if now - last_used_at > self.health_check_interval and not self._is_healthy(conn):
+                    self._discard(conn)
+                    continue
+                break
+        except Exception:
+            self._slots.release()
+            raise
+        
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._total_wait_time += waited
+            self._max_wait_time = max(self._max_wait_time, waited)
+        return conn, created_at
+    
+    def release(self, conn, created_at: float, discard: bool = False):
+        """归还连接；discard 为 True 或连接已断开时直接关闭"""
+        with self._lock:
+            self._in_use -= 1
+        try:
+            if discard or self._closed or not conn.open:
+                self._discard(conn)
+            else:
+                self._idle.put((conn, created_at, time.monotonic()))
+        finally:
+            self._slots.release()
+    
+    @contextmanager
+    def connection(self) -> Iterator[pymysql.connections.Connection]:
+        """借出连接的上下文管理器，异常时回滚，连接级错误时丢弃连接"""
+        conn, created_at = self.acquire()
+        discard = False
+        try:
+            yield conn
+        except BaseException as e:
+            discard = isinstance(e, (pymysql.err.OperationalError, pymysql.err.InterfaceError))
+            if not discard:
+                try:
+                    conn.rollback()
+                except Exception:
+                    discard = True
+            raise
+        finally:
+            self.release(conn, created_at, discard)
+    
+    def metrics(self) -> Dict:
+        """连接池指标"""
+        with self._lock:
+            return {
+                'max_size': self.max_size,
+                'open': self._created - self._closed_count,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+                'created': self._created,
+                'closed': self._closed_count,
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'health_check_failures': self._health_check_failures,
+                'avg_wait_ms': round(self._total_wait_time / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+                'max_wait_ms': round(self._max_wait_time * 1000, 3),
+            }
     
-    def connect(self):
-        """连接OceanBase数据库"""
+    def close(self):
+        """关闭所有空闲连接，借出中的连接在归还时关闭"""
+        self._closed = True
+        while True:
+            try:
+                conn, _, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+
+class Database:
+    # ngram 解析器的默认切分长度（ngram_token_size），更短的关键词无法走全文索引
+    NGRAM_TOKEN_SIZE = 2
+    
+    def __init__(self):
+        # init_tables 确认全文索引存在后置为 True
+        self.fulltext_enabled = False
+        # 列表、搜索和重复文件的总数缓存，翻页时不必每页重新 COUNT；与结果缓存一起在写入时按路径失效
+        self._count_cache = QueryCache(maxsize=1024, max_rows=1024, ttl=settings.COUNT_CACHE_TTL)
+        # BM25 的语料统计（文档数、平均长度、文档频率）只需近似值，不随写入失效
+        self._corpus_cache = TTLCache(maxsize=1024, ttl=settings.COUNT_CACHE_TTL)
+        # 文件列表、搜索和统计的结果缓存，写入时按路径失效
+        self.query_cache = QueryCache(
+            maxsize=settings.QUERY_CACHE_MAX_ENTRIES,
+            max_rows=settings.QUERY_CACHE_MAX_ROWS,
+            ttl=settings.QUERY_CACHE_TTL,
+        )
+        # 扫描根目录列表缓存（None 表示需要重新加载）
+        self._scan_roots: Optional[Dict[str, int]] = None
+        self._scan_roots_lock = threading.Lock()
+        # 每个扫描根目录一把进程内写锁（0 表示不在任何根目录下），见 _summary_write_lock
+        self._root_write_locks: Dict[int, threading.Lock] = {}
+        # 文件种类字典缓存：{kind_id: 行} 和 {(file_type, file_extension, mime_type): kind_id}
+        self._kinds: Dict[int, Dict] = {}
+        self._kind_ids: Dict[tuple, int] = {}
+        self._kinds_lock = threading.Lock()
+        # 目录路径 → 目录 ID 的 LRU 缓存；目录记录只增不删，缓存不会过期
+        self._dir_ids: 'OrderedDict[str, int]' = OrderedDict()
+        self._dir_ids_lock = threading.Lock()
+        # 所有文件记录都有 dir_id 后置为 True，此前路径前缀查询退回 LIKE
+        self.directories_ready = False
+        self.pool = ConnectionPool(
+            self._create_connection,
+            max_size=settings.DB_POOL_SIZE,
+            timeout=settings.DB_POOL_TIMEOUT,
+            health_check_interval=settings.DB_POOL_HEALTH_CHECK_INTERVAL,
+            recycle=settings.DB_POOL_RECYCLE,
+        )
+        # 启动时先建立一个连接，校验配置（数据库不存在时自动创建）
+        with self.pool.connection():
+            pass
+    
+    def _create_connection(self) -> pymysql.connections.Connection:
+        """创建一个OceanBase数据库连接"""
         try:
             # 先尝试连接指定数据库
-            self.connection = pymysql.connect(
+            connection = pymysql.connect(
                 host=settings.DB_HOST,
                 port=settings.DB_PORT,
                 user=settings.DB_USER,
@@ -42,14 +238,15 @@ class Database:
                 charset='utf8mb4',
                 cursorclass=pymysql.cursors.DictCursor
             )
-            logger.info("数据库连接成功")
+            logger.debug("数据库连接成功")
+            return connection
         except pymysql.err.OperationalError as e:
             # 如果数据库不存在，先创建数据库
             if e.args[0] == 1049:  # Unknown database
                 logger.info(f"数据库 {settings.DB_NAME} 不存在，正在创建...")
                 self._create_database()
                 # 重新连接
-                self.connection = pymysql.connect(
+                connection = pymysql.connect(
                     host=settings.DB_HOST,
                     port=settings.DB_PORT,
                     user=settings.DB_USER,
@@ -59,6 +256,7 @@ class Database:
                     cursorclass=pymysql.cursors.DictCursor
                 )
                 logger.info("数据库创建并连接成功")
+                return connection
             else:
                 logger.error(f"数据库连接失败: {e}")
                 raise
@@ -88,14 +286,19 @@ class Database:
             raise
     
     def close(self):
-        """关闭数据库连接"""
-        if self.connection:
-            self.connection.close()
+        """关闭数据库连接池"""
+        self.pool.close()
+    
+    def health_check(self) -> Dict:
+        """借出一个连接并执行 ping，返回连接池指标"""
+        with self.pool.connection() as conn:
+            conn.ping(reconnect=False)
+        return self.pool.metrics()
     
     def init_tables(self):
         """初始化数据库表"""
         try:
-            with self.connection.cursor() as cursor:
+            with self.pool.connection() as conn, conn.cursor() as cursor:
                 # 创建文件信息表
                 cursor.execute("""
                     CREATE TABLE IF NOT EXISTS files (
@@ -109,6 +312,7 @@ class Database:
                         created_time DATETIME,
                         modified_time DATETIME,
                         file_hash VARCHAR(64),
+                        hash_type VARCHAR(32),
                         metadata TEXT,
                         scan_time DATETIME DEFAULT CURRENT_TIMESTAMP,
                         INDEX idx_file_path (file_path(255)),
@@ -121,9 +325,9 @@ class Database:
                 # 尝试添加唯一索引（基于 file_path 的前 500 字符，因为 OceanBase 可能不支持超长唯一索引）
                 # 如果失败，说明表已存在或索引已存在，忽略错误
                 try:
-                    cursor.execute("""
+                    cursor.execute(f"""
                         ALTER TABLE files 
-                        ADD UNIQUE KEY uk_file_path (file_path(500))
+                        ADD UNIQUE KEY uk_file_path (file_path({self._UNIQUE_PATH_CHARS}))
                     """)
                     logger.info("已添加 file_path 唯一索引")
                 except Exception as e:
@@ -131,12 +335,106 @@ class Database:
                     logger.debug(f"唯一索引可能已存在或创建失败: {e}")
                     pass
                 
+                # 旧表补充 hash_type 列：记录 file_hash 使用的算法，部分哈希带 -partial 后缀
+                try:
+                    cursor.execute("ALTER TABLE files ADD COLUMN hash_type VARCHAR(32) AFTER file_hash")
+                    logger.info("已添加 hash_type 列")
+                except Exception as e:
+                    logger.debug(f"hash_type 列可能已存在: {e}")
+                
+                # 重复文件按 (file_size, file_hash) 分组，联合索引让分组只扫描索引
+                try:
+                    cursor.execute("ALTER TABLE files ADD INDEX idx_size_hash (file_size, file_hash)")
+                    logger.info("已添加 (file_size, file_hash) 索引")
+                except Exception as e:
+                    logger.debug(f"索引 idx_size_hash 可能已存在: {e}")
+                
+                # 紧凑目录格式：MIME 类型通过 kind_id 查字典，metadata JSON 改为 flags 位
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS file_kinds (
+                        id INT UNSIGNED PRIMARY KEY AUTO_INCREMENT,
+                        kind_key CHAR(32) NOT NULL,
+                        file_type VARCHAR(100),
+                        file_extension VARCHAR(50),
+                        mime_type VARCHAR(200),
+                        UNIQUE KEY uk_kind_key (kind_key)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+                """)
+                for column, definition in (('kind_id', 'INT UNSIGNED'),
+                                           ('flags', 'TINYINT UNSIGNED NOT NULL DEFAULT 0')):
+                    try:
+                        cursor.execute(f"ALTER TABLE files ADD COLUMN {column} {definition}")
+                        logger.info(f"已添加 {column} 列")
+                    except Exception as e:
+                        logger.debug(f"{column} 列可能已存在: {e}")
+                # 早期版本的种类 ID 为 SMALLINT，扩展名种类多时会用尽
+                try:
+                    cursor.execute("""
+                        SELECT DATA_TYPE FROM information_schema.COLUMNS
+                        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'file_kinds' AND COLUMN_NAME = 'id'
+                    """)
+                    column_type = cursor.fetchone()
+                    if column_type and column_type['DATA_TYPE'].lower() == 'smallint':
+                        cursor.execute("ALTER TABLE file_kinds MODIFY id INT UNSIGNED NOT NULL AUTO_INCREMENT")
+                        cursor.execute("ALTER TABLE files MODIFY kind_id INT UNSIGNED")
+                        logger.info("已将种类 ID 扩展为 INT")
+                except Exception as e:
+                    logger.warning(f"扩展种类 ID 失败: {e}")
+                self._load_kinds(cursor)
+                
+                # 目录表：files.dir_id 指向文件所在目录，directory_ancestors 保存每个目录的全部祖先（含自身），
+                # 子树查询变为按 ancestor_id 的等值查找，与路径长度和深度无关
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS directories (
+                        id BIGINT PRIMARY KEY AUTO_INCREMENT,
+                        path VARCHAR(2000) NOT NULL,
+                        path_hash CHAR(32) NOT NULL,
+                        parent_id BIGINT,
+                        depth SMALLINT NOT NULL DEFAULT 0,
+                        UNIQUE KEY uk_path_hash (path_hash),
+                        INDEX idx_parent_id (parent_id)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+                """)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS directory_ancestors (
+                        ancestor_id BIGINT NOT NULL,
+                        dir_id BIGINT NOT NULL,
+                        PRIMARY KEY (ancestor_id, dir_id),
+                        INDEX idx_dir_id (dir_id)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+                """)
+                try:
+                    cursor.execute("ALTER TABLE files ADD COLUMN dir_id BIGINT")
+                    logger.info("已添加 dir_id 列")
+                except Exception as e:
+                    logger.debug(f"dir_id 列可能已存在: {e}")
+                try:
+                    cursor.execute("ALTER TABLE files ADD INDEX idx_dir_id (dir_id)")
+                    logger.info("已添加 dir_id 索引")
+                except Exception as e:
+                    logger.debug(f"索引 idx_dir_id 可能已存在: {e}")
+                
+                # 文件名和路径的 n-gram 全文索引，子串搜索不再需要前导通配符 LIKE 全表扫描。
+                # ngram 解析器按字符切分，同样适用于中日韩文件名；数据库不支持时退回 LIKE 查询
+                for index_name, column in (('ft_file_name', 'file_name'), ('ft_file_path', 'file_path')):
+                    try:
+                        cursor.execute(f"ALTER TABLE files ADD FULLTEXT INDEX {index_name} ({column}) WITH PARSER ngram")
+                        logger.info(f"已添加 {column} 全文索引")
+                    except Exception as e:
+                        logger.debug(f"全文索引 {index_name} 可能已存在或创建失败: {e}")
+                cursor.execute("SHOW INDEX FROM files WHERE Index_type = 'FULLTEXT'")
+                fulltext_indexes = {row['Key_name'] for row in cursor.fetchall()}
+                self.fulltext_enabled = {'ft_file_name', 'ft_file_path'} <= fulltext_indexes
+                if not self.fulltext_enabled:
+                    logger.warning("数据库不支持 n-gram 全文索引，文件名搜索将使用 LIKE 查询")
+                
                 # 创建搜索索引表
                 cursor.execute("""
                     CREATE TABLE IF NOT EXISTS file_index (
                         id BIGINT PRIMARY KEY AUTO_INCREMENT,
                         file_id BIGINT NOT NULL,
                         keyword VARCHAR(500) NOT NULL,
+                        term_freq INT DEFAULT 0,
                         content_preview TEXT,
                         match_score FLOAT DEFAULT 0.0,
                         created_time DATETIME DEFAULT CURRENT_TIMESTAMP,
@@ -146,6 +444,80 @@ class Database:
                     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
                 """)
                 
+                # 旧版本的 file_index 没有词频列，尝试补上
+                try:
+                    cursor.execute("ALTER TABLE file_index ADD COLUMN term_freq INT DEFAULT 0")
+                    logger.info("已添加 file_index.term_freq 列")
+                except Exception as e:
+                    logger.debug(f"term_freq 列可能已存在: {e}")
+                
+                # 已建立内容索引的文件及其词项总数，用于计算 BM25 的文档长度归一化
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS file_index_docs (
+                        file_id BIGINT PRIMARY KEY,
+                        doc_length INT NOT NULL DEFAULT 0,
+                        FOREIGN KEY (file_id) REFERENCES files(id) ON DELETE CASCADE
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+                """)
+                
+                # 扫描根目录汇总表：每个扫描过的根目录一行，随文件写入增量更新
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS scan_roots (
+                        id BIGINT PRIMARY KEY AUTO_INCREMENT,
+                        root_path VARCHAR(2000) NOT NULL,
+                        path_hash CHAR(32) NOT NULL,
+                        file_count BIGINT NOT NULL DEFAULT 0,
+                        total_bytes BIGINT NOT NULL DEFAULT 0,
+                        last_scan_time DATETIME,
+                        watch_enabled BOOLEAN NOT NULL DEFAULT FALSE,
+                        UNIQUE KEY uk_path_hash (path_hash)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+                """)
+                
+                # 旧版本的 scan_roots 没有实时监听标记，尝试补上
+                try:
+                    cursor.execute("ALTER TABLE scan_roots ADD COLUMN watch_enabled BOOLEAN NOT NULL DEFAULT FALSE")
+                    logger.info("已添加 scan_roots.watch_enabled 列")
+                except Exception as e:
+                    logger.debug(f"watch_enabled 列可能已存在: {e}")
+                
+                # 文件统计汇总表：总数、按类型、按扩展名、按大小区间的文件数和字节数，随文件写入增量更新
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS file_stats (
+                        dimension VARCHAR(20) NOT NULL,
+                        dim_key VARCHAR(100) NOT NULL,
+                        file_count BIGINT NOT NULL DEFAULT 0,
+                        total_bytes BIGINT NOT NULL DEFAULT 0,
+                        PRIMARY KEY (dimension, dim_key)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+                """)
+                
+                # 创建扫描任务表：记录进度计数和遍历前沿，进程重启后可从断点继续
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS scan_jobs (
+                        id BIGINT PRIMARY KEY AUTO_INCREMENT,
+                        root_path VARCHAR(2000) NOT NULL,
+                        recursive_scan BOOLEAN NOT NULL DEFAULT TRUE,
+                        incremental BOOLEAN NOT NULL DEFAULT FALSE,
+                        status VARCHAR(20) NOT NULL,
+                        dirs_scanned BIGINT NOT NULL DEFAULT 0,
+                        files_scanned BIGINT NOT NULL DEFAULT 0,
+                        files_saved BIGINT NOT NULL DEFAULT 0,
+                        files_deleted BIGINT NOT NULL DEFAULT 0,
+                        bytes_scanned BIGINT NOT NULL DEFAULT 0,
+                        error_count BIGINT NOT NULL DEFAULT 0,
+                        files_per_second DOUBLE NOT NULL DEFAULT 0,
+                        frontier LONGTEXT,
+                        error_message TEXT,
+                        created_time DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        started_time DATETIME,
+                        finished_time DATETIME,
+                        checkpoint_time DATETIME,
+                        INDEX idx_status (status),
+                        INDEX idx_created_time (created_time)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+                """)
+                
                 # 创建统计记录表
                 cursor.execute("""
                     CREATE TABLE IF NOT EXISTS statistics (
@@ -160,11 +532,24 @@ class Database:
                     ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
                 """)
                 
-                self.connection.commit()
+                conn.commit()
                 logger.info("数据库表初始化成功")
+            
+            # 汇总表为空（新建或从旧版本升级）时，从现有文件记录一次性生成
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM file_stats WHERE dimension = 'total' LIMIT 1")
+                initialized = cursor.fetchone() is not None
+            if not initialized:
+                self.rebuild_file_stats()
+            
+            # 旧版本写入的记录没有 dir_id，在后台回填，完成前路径前缀查询仍使用 LIKE
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM files WHERE dir_id IS NULL LIMIT 1")
+                self.directories_ready = cursor.fetchone() is None
+            if not self.directories_ready:
+                threading.Thread(target=self.backfill_directories, name="dir-backfill", daemon=True).start()
         except Exception as e:
             logger.error(f"数据库表初始化失败: {e}")
-            self.connection.rollback()
             raise
     
     def _sanitize_file_info(self, file_info: Dict) -> Dict:
@@ -228,15 +613,23 @@ class Database:
         else:
             sanitized['file_hash'] = file_hash if file_hash else None
         
-        # metadata: TEXT
-        metadata = file_info.get('metadata')
-        if isinstance(metadata, dict):
-            import json
-            sanitized['metadata'] = json.dumps(metadata)
-        elif isinstance(metadata, str):
-            sanitized['metadata'] = metadata
-        else:
-            sanitized['metadata'] = None
+        # hash_type: VARCHAR(32)，没有哈希时留空
+        hash_type = file_info.get('hash_type') if sanitized['file_hash'] else None
+        sanitized['hash_type'] = str(hash_type)[:32] if hash_type else None
+        
+        # flags: TINYINT，取代 metadata JSON；旧格式的 metadata 仍可转换
+        flags = file_info.get('flags')
+        if flags is None:
+            metadata = file_info.get('metadata')
+            if isinstance(metadata, str):
+                try:
+                    metadata = json.loads(metadata)
+                except ValueError:
+                    metadata = None
+            if isinstance(metadata, dict):
+                flags = ((FLAG_SYMLINK if metadata.get('is_symlink') else 0)
+                         | (FLAG_READABLE if metadata.get('is_readable') else 0))
+        sanitized['flags'] = int(flags or 0)
         
         return sanitized
     
@@ -251,16 +644,16 @@ class Database:
             文件ID，如果更新已存在的文件，返回现有ID；如果是新插入，返回新ID；如果跳过，返回0
         """
         try:
-            # 确保数据库连接有效
-            self._ensure_connection()
-            
             # 清理和验证数据
             sanitized_info = self._sanitize_file_info(file_info)
             file_path = sanitized_info['file_path']
+            self._assign_kinds([sanitized_info])
+            self._assign_directories([sanitized_info])
             
-            with self.connection.cursor() as cursor:
-                # 先检查文件是否已存在
-                cursor.execute("SELECT id FROM files WHERE file_path = %s", (file_path,))
+            with self._summary_write_lock([file_path]), self.pool.connection() as conn, conn.cursor() as cursor:
+                # 先检查文件是否已存在；加锁读取，汇总增量按最新的旧记录计算
+                cursor.execute("SELECT id, file_path, file_size, file_type, file_extension FROM files WHERE file_path = %s FOR UPDATE",
+                               (file_path,))
                 existing_file = cursor.fetchone()
                 
                 if existing_file and update_if_exists:
@@ -272,10 +665,14 @@ class Database:
                             file_size = %s,
                             file_type = %s,
                             file_extension = %s,
+                            kind_id = %s,
+                            flags = %s,
+                            dir_id = %s,
                             mime_type = %s,
                             modified_time = %s,
                             file_hash = %s,
-                            metadata = %s,
+                            hash_type = %s,
+                            metadata = NULL,
                             scan_time = NOW()
                         WHERE id = %s
                     """
@@ -284,13 +681,18 @@ class Database:
                         sanitized_info['file_size'],
                         sanitized_info['file_type'],
                         sanitized_info['file_extension'],
-                        sanitized_info['mime_type'],
+                        sanitized_info['kind_id'],
+                        sanitized_info['flags'],
+                        sanitized_info['dir_id'],
+                        self._row_mime_type(sanitized_info),
                         sanitized_info['modified_time'],
                         sanitized_info['file_hash'],
-                        sanitized_info['metadata'],
+                        sanitized_info['hash_type'],
                         file_id
                     ))
-                    self.connection.commit()
+                    self._apply_file_changes(cursor, removed=[existing_file], added=[sanitized_info])
+                    conn.commit()
+                    self._invalidate(file_path)
                     return file_id
                 elif existing_file and not update_if_exists:
                     # 文件已存在但不更新，跳过
@@ -300,9 +702,9 @@ class Database:
                     sql = """
                         INSERT INTO files (
                             file_path, file_name, file_size, file_type,
-                            file_extension, mime_type, created_time, modified_time,
-                            file_hash, metadata, scan_time
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
+                            file_extension, kind_id, flags, dir_id, mime_type, created_time, modified_time,
+                            file_hash, hash_type, scan_time
+                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
                     """
                     cursor.execute(sql, (
                         sanitized_info['file_path'],
@@ -310,18 +712,23 @@ class Database:
                         sanitized_info['file_size'],
                         sanitized_info['file_type'],
                         sanitized_info['file_extension'],
-                        sanitized_info['mime_type'],
+                        sanitized_info['kind_id'],
+                        sanitized_info['flags'],
+                        sanitized_info['dir_id'],
+                        self._row_mime_type(sanitized_info),
                         sanitized_info['created_time'],
                         sanitized_info['modified_time'],
                         sanitized_info['file_hash'],
-                        sanitized_info['metadata']
+                        sanitized_info['hash_type']
                     ))
-                    self.connection.commit()
-                    return cursor.lastrowid
+                    file_id = cursor.lastrowid
+                    self._apply_file_changes(cursor, removed=[], added=[sanitized_info])
+                    conn.commit()
+                    self._invalidate(file_path)
+                    return file_id
         except pymysql.err.DataError as e:
             logger.error(f"插入文件信息失败（数据错误）: {e}, 文件: {file_info.get('file_path', 'unknown')}")
             logger.error(f"数据详情: path_len={len(str(file_info.get('file_path', '')))}, name_len={len(str(file_info.get('file_name', '')))}")
-            self.connection.rollback()
             raise
         except pymysql.err.IntegrityError as e:
             # 如果使用 INSERT IGNORE 且文件已存在，返回0
@@ -330,12 +737,10 @@ class Database:
                 return 0
             # 其他完整性错误
             logger.warning(f"文件插入完整性错误: {file_info.get('file_path', 'unknown')}, 错误: {e}")
-            self.connection.rollback()
             raise
         except Exception as e:
             logger.error(f"插入文件信息失败: {e}, 文件: {file_info.get('file_path', 'unknown')}")
             logger.error(f"错误类型: {type(e).__name__}, 错误详情: {str(e)}")
-            self.connection.rollback()
             raise
     
     def check_files_exist_by_path(self, path_prefix: str) -> bool:
@@ -348,14 +753,10 @@ class Database:
             如果存在文件记录返回True，否则返回False
         """
         try:
-            self._ensure_connection()
-            
-            with self.connection.cursor() as cursor:
-                normalized_prefix = path_prefix.rstrip('/') + '/'
-                sql = "SELECT COUNT(*) as count FROM files WHERE file_path LIKE %s OR file_path = %s"
-                cursor.execute(sql, (f"{normalized_prefix}%", path_prefix.rstrip('/')))
-                result = cursor.fetchone()
-                return result['count'] > 0 if result else False
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                condition, params = self._prefix_condition(path_prefix, cursor)
+                cursor.execute(f"SELECT 1 FROM files WHERE {condition} LIMIT 1", params)
+                return cursor.fetchone() is not None
         except Exception as e:
             logger.error(f"检查文件记录失败: {e}")
             return False
@@ -370,72 +771,784 @@ class Database:
             删除的记录数
         """
         try:
-            self._ensure_connection()
-            
-            with self.connection.cursor() as cursor:
-                # 规范化路径前缀（确保以 / 结尾，用于 LIKE 查询）
-                normalized_prefix = path_prefix.rstrip('/') + '/'
+            with self._summary_write_lock(prefix=path_prefix.rstrip('/') or '/'), \
+                    self.pool.connection() as conn, conn.cursor() as cursor:
+                condition, params = self._prefix_condition(path_prefix, cursor)
+                self._apply_prefix_removal(cursor, path_prefix, (condition, params))
                 
-                sql = "DELETE FROM files WHERE file_path LIKE %s OR file_path = %s"
-                cursor.execute(sql, (f"{normalized_prefix}%", path_prefix.rstrip('/')))
+                cursor.execute(f"DELETE FROM files WHERE {condition}", params)
                 deleted_count = cursor.rowcount
-                self.connection.commit()
+                conn.commit()
+                self._invalidate(path_prefix.rstrip('/') or '/')
                 
                 logger.info(f"删除了 {deleted_count} 个路径前缀为 '{path_prefix}' 的文件记录")
                 return deleted_count
         except Exception as e:
             logger.error(f"删除文件记录失败: {e}")
-            self.connection.rollback()
             raise
     
-    def get_all_files(self, file_type: Optional[str] = None, path_prefix: Optional[str] = None, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+    # ---------------------------------------------------------------
+    # 文件种类字典
+    # ---------------------------------------------------------------
+    
+    @staticmethod
+    def _kind_key(kind: tuple) -> str:
+        """(file_type, file_extension, mime_type) 的唯一键；列可能为 NULL，不能直接建唯一索引"""
+        return hashlib.md5('\0'.join(part or '' for part in kind).encode('utf-8')).hexdigest()
+    
+    def _load_kinds(self, cursor, column: Optional[str] = None, values: Optional[List] = None):
+        """读取种类字典；指定 column（id 或 kind_key）和 values 时只读取这些行，否则读取全部（启动时）
+        
+        种类数随扩展名的种类增长（日志轮转后缀、带哈希的缓存文件等），不一定很小，运行期间只按需读取新增的行。
+        """
+        sql = "SELECT id, file_type, file_extension, mime_type FROM file_kinds"
+        if column is not None:
+            if not values:
+                return
+            sql += f" WHERE {column} IN ({', '.join(['%s'] * len(values))})"
+        cursor.execute(sql, values)
+        rows = cursor.fetchall()
+        with self._kinds_lock:
+            for row in rows:
+                self._kinds[row['id']] = row
+                self._kind_ids[(row['file_type'], row['file_extension'], row['mime_type'])] = row['id']
+    
+    def _assign_kinds(self, infos: List[Dict]):
+        """为清理后的文件信息填入 kind_id；字典中还没有的组合先在独立事务中登记
+        
+        登记不放在写入文件的事务里，文件写入失败回滚时缓存中也不会留下不存在的 id。
+        仍然没有 id 的组合（登记失败）kind_id 为 None，写入时 mime_type 保存在行上，不会丢失。
+        """
+        kinds = [(info['file_type'], info['file_extension'], info['mime_type']) for info in infos]
+        with self._kinds_lock:
+            missing = sorted({kind for kind in kinds if kind not in self._kind_ids}, key=self._kind_key)
+        if missing:
+            try:
+                with self.pool.connection() as conn, conn.cursor() as cursor:
+                    cursor.executemany(
+                        "INSERT IGNORE INTO file_kinds (kind_key, file_type, file_extension, mime_type) VALUES (%s, %s, %s, %s)",
+                        [(self._kind_key(kind), *kind) for kind in missing],
+                    )
+                    conn.commit()
+                    self._load_kinds(cursor, 'kind_key', [self._kind_key(kind) for kind in missing])
+            except Exception as e:
+                logger.error(f"登记文件种类失败: {e}")
+                raise
+        with self._kinds_lock:
+            for info, kind in zip(infos, kinds):
+                info['kind_id'] = self._kind_ids.get(kind)
+            unassigned = len(set(missing) - self._kind_ids.keys()) if missing else 0
+        if unassigned:
+            logger.warning(f"{unassigned} 个文件种类未能登记，MIME 类型直接保存在文件记录中")
+    
+    @staticmethod
+    def _row_mime_type(info: Dict) -> Optional[str]:
+        """写入文件行的 mime_type：有 kind_id 时由字典提供，行上留空"""
+        return info['mime_type'] if info.get('kind_id') is None else None
+    
+    def _fill_mime_types(self, rows: List[Dict], cursor=None):
+        """新记录不再逐行保存 mime_type，按 kind_id 从字典补上
+        
+        遇到其他进程登记的未知 id 时只读取这些行；未提供 cursor 时向连接池另借一个连接。
+        """
+        unknown = sorted({row['kind_id'] for row in rows if row.get('kind_id') and row['kind_id'] not in self._kinds})
+        if unknown:
+            if cursor is not None:
+                self._load_kinds(cursor, 'id', unknown)
+            else:
+                with self.pool.connection() as conn, conn.cursor() as own_cursor:
+                    self._load_kinds(own_cursor, 'id', unknown)
+        for row in rows:
+            if row.get('mime_type') is None and row.get('kind_id'):
+                kind = self._kinds.get(row['kind_id'])
+                row['mime_type'] = kind['mime_type'] if kind else None
+        return rows
+    
+    # ---------------------------------------------------------------
+    # 目录层级
+    # ---------------------------------------------------------------
+    
+    def _cached_directory(self, path: str) -> Optional[int]:
+        with self._dir_ids_lock:
+            dir_id = self._dir_ids.get(path)
+            if dir_id is not None:
+                self._dir_ids.move_to_end(path)
+            return dir_id
+    
+    def _cache_directory(self, path: str, dir_id: int):
+        with self._dir_ids_lock:
+            self._dir_ids[path] = dir_id
+            self._dir_ids.move_to_end(path)
+            while len(self._dir_ids) > settings.DIRECTORY_CACHE_SIZE:
+                self._dir_ids.popitem(last=False)
+    
+    def _lookup_directory(self, path: str, cursor=None) -> Optional[int]:
+        """目录 ID；目录表中没有该路径时返回 None（不缓存未命中，目录之后可能被登记）"""
+        dir_id = self._cached_directory(path)
+        if dir_id is not None:
+            return dir_id
+        sql, params = "SELECT id FROM directories WHERE path_hash = %s", (self._root_hash(path),)
+        if cursor is None:
+            with self.pool.connection() as conn, conn.cursor() as own_cursor:
+                own_cursor.execute(sql, params)
+                row = own_cursor.fetchone()
+        else:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        self._cache_directory(path, row['id'])
+        return row['id']
+    
+    def _ensure_directory(self, cursor, path: str) -> int:
+        """登记目录及其所有上级目录，返回目录 ID；调用方负责提交"""
+        dir_id = self._cached_directory(path)
+        if dir_id is not None:
+            return dir_id
+        
+        parent = os.path.dirname(path) if path != '/' else None
+        parent_id = self._ensure_directory(cursor, parent) if parent else None
+        path_hash = self._root_hash(path)
+        # 已存在时 LAST_INSERT_ID(id) 让 lastrowid 返回已有记录的 ID，并发登记同一目录也不需要再查一次
+        cursor.execute("""
+            INSERT INTO directories (path, path_hash, parent_id, depth) VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id)
+        """, (path, path_hash, parent_id, 0 if parent is None else path.count('/')))
+        dir_id = cursor.lastrowid
+        # 祖先表：父目录的全部祖先加上自身；重复登记时 INSERT IGNORE 不产生重复行
+        if parent_id is not None:
+            cursor.execute(
+                "INSERT IGNORE INTO directory_ancestors (ancestor_id, dir_id) SELECT ancestor_id, %s FROM directory_ancestors WHERE dir_id = %s",
+                (dir_id, parent_id),
+            )
+        cursor.execute("INSERT IGNORE INTO directory_ancestors (ancestor_id, dir_id) VALUES (%s, %s)", (dir_id, dir_id))
+        self._cache_directory(path, dir_id)
+        return dir_id
+    
+    def _assign_directories(self, infos: List[Dict]):
+        """为清理后的文件信息填入 dir_id；新目录在独立事务中登记，与 _assign_kinds 相同"""
+        dirs = [os.path.dirname(info['file_path']) or '/' for info in infos]
+        dir_ids = {path: self._cached_directory(path) for path in set(dirs)}
+        missing = [path for path, dir_id in dir_ids.items() if dir_id is None]
+        if missing:
+            try:
+                with self.pool.connection() as conn, conn.cursor() as cursor:
+                    # 浅层目录先登记，并发批次按相同顺序加锁
+                    for path in sorted(missing, key=lambda p: (p.count('/'), p)):
+                        dir_ids[path] = self._ensure_directory(cursor, path)
+                    conn.commit()
+            except Exception:
+                # 回滚后缓存中可能留有未提交的目录 ID
+                with self._dir_ids_lock:
+                    self._dir_ids.clear()
+                raise
+        for info, path in zip(infos, dirs):
+            info['dir_id'] = dir_ids[path]
+    
+    def _prefix_condition(self, path_prefix: str, cursor=None):
+        """路径前缀（该路径本身或其下任意深度）的过滤条件，返回 (SQL 片段, 参数)
+        
+        目录表就绪后按祖先表做等值查找：dir_id 属于该目录的子树，或记录本身就是该路径（前缀指向文件时）。
+        不受路径长度影响，也不依赖 file_path 的 255 字符前缀索引。旧记录的 dir_id 回填完成前退回 LIKE。
+        """
+        prefix = path_prefix.rstrip('/') or '/'
+        if not self.directories_ready:
+            normalized_prefix = prefix.rstrip('/') + '/'
+            return "(file_path LIKE %s OR file_path = %s)", [f"{normalized_prefix}%", prefix]
+        dir_id = self._lookup_directory(prefix, cursor)
+        if dir_id is None:
+            return "file_path = %s", [prefix]
+        return ("(dir_id IN (SELECT dir_id FROM directory_ancestors WHERE ancestor_id = %s) OR file_path = %s)",
+                [dir_id, prefix])
+    
+    def backfill_directories(self, batch_size: Optional[int] = None) -> int:
+        """为旧版本写入的记录回填 dir_id，完成后路径前缀查询改用目录表，返回回填的记录数"""
+        batch_size = max(1, batch_size or settings.DIRECTORY_BACKFILL_BATCH)
+        total = 0
+        try:
+            while True:
+                with self.pool.connection() as conn, conn.cursor() as cursor:
+                    cursor.execute("SELECT id, file_path FROM files WHERE dir_id IS NULL ORDER BY id LIMIT %s", (batch_size,))
+                    rows = cursor.fetchall()
+                if not rows:
+                    break
+                self._assign_directories(rows)
+                by_dir: Dict[int, List[int]] = {}
+                for row in rows:
+                    by_dir.setdefault(row['dir_id'], []).append(row['id'])
+                with self.pool.connection() as conn, conn.cursor() as cursor:
+                    for dir_id, file_ids in by_dir.items():
+                        placeholders = ", ".join(["%s"] * len(file_ids))
+                        cursor.execute(f"UPDATE files SET dir_id = %s WHERE id IN ({placeholders})", [dir_id, *file_ids])
+                    conn.commit()
+                total += len(rows)
+                logger.info(f"已回填 {total} 条记录的 dir_id")
+        except Exception as e:
+            logger.error(f"回填 dir_id 失败，路径前缀查询继续使用 LIKE: {e}")
+            return total
+        
+        self.directories_ready = True
+        # 结果相同，但之后的查询走目录表
+        self._invalidate()
+        logger.info(f"目录表已就绪，共回填 {total} 条记录")
+        return total
+    
+    # ---------------------------------------------------------------
+    # 写入时的增量维护
+    # ---------------------------------------------------------------
+    
+    def _invalidate(self, path: Optional[str] = None):
+        """写入提交后让结果缓存和总数缓存失效，规则见 QueryCache.invalidate"""
+        self.query_cache.invalidate(path)
+        self._count_cache.invalidate(path)
+    
+    def _invalidate_unscoped(self):
+        """只影响无范围条目的变化（例如内容索引、统计汇总）"""
+        self.query_cache.invalidate_unscoped()
+        self._count_cache.invalidate_unscoped()
+    
+    def _invalidate_paths(self, file_paths: List[str]):
+        """写入提交后让相关的查询缓存失效；一批路径按它们的公共父目录处理"""
+        if not file_paths:
+            return
+        try:
+            common = os.path.commonpath(file_paths) if len(file_paths) > 1 else file_paths[0]
+        except ValueError:
+            common = None
+        self._invalidate(common or None)
+    
+    def _root_write_lock(self, root_id: int) -> threading.Lock:
+        with self._scan_roots_lock:
+            return self._root_write_locks.setdefault(root_id, threading.Lock())
+    
+    @contextmanager
+    def _summary_write_lock(self, file_paths: List[str] = (), prefix: Optional[str] = None):
+        """串行化同一扫描根目录下按旧记录计算汇总增量的写事务
+        
+        实时监听和扫描任务可能同时写入同一路径，两边读到相同的旧记录时增量会被重复计入。
+        _fetch_existing_files 的 FOR UPDATE 只能锁住已存在的行，两边都把同一路径当作新文件插入时仍会重复，
+        因此再按路径所在的扫描根目录加进程内锁：同一路径需要的锁相同，锁按编号顺序获取。
+        删除整个前缀时还要锁住前缀下的扫描根目录和不在任何根目录下的记录。
+        加锁期间根目录列表发生变化（登记了新的根目录）时重新计算需要的锁。
+        """
+        while True:
+            roots = self._get_scan_roots()
+            keys = set()
+            for path in file_paths:
+                keys.update(self._roots_containing(roots, path) or (0,))
+            if prefix is not None:
+                keys.update(self._roots_containing(roots, prefix))
+                keys.update(root_id for root_path, root_id in roots.items() if self._path_in(root_path, prefix))
+                keys.add(0)
+            locks = [self._root_write_lock(key) for key in sorted(keys)]
+            for lock in locks:
+                lock.acquire()
+            if self._get_scan_roots() is roots:
+                break
+            for lock in reversed(locks):
+                lock.release()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+    
+    def _fetch_existing_files(self, cursor, file_paths: List[str]) -> Dict[str, Dict]:
+        """在当前事务中加锁读取即将被覆盖或删除的记录，用于计算汇总增量；调用方持有 _summary_write_lock"""
+        if not file_paths:
+            return {}
+        placeholders = ", ".join(["%s"] * len(file_paths))
+        cursor.execute(
+            f"SELECT file_path, file_size, file_type, file_extension FROM files WHERE file_path IN ({placeholders}) FOR UPDATE",
+            file_paths,
+        )
+        return {row['file_path']: row for row in cursor.fetchall()}
+    
+    def _apply_file_changes(self, cursor, removed: List[Dict], added: List[Dict]):
+        """在写入文件记录的同一事务中更新扫描根目录汇总和文件统计汇总
+        
+        Args:
+            removed: 被删除或被覆盖的旧记录（file_path, file_size, file_type, file_extension）
+            added: 新写入的记录（file_path, file_size, file_type, file_extension）
+        """
+        self._apply_stats_changes(cursor, removed, added)
+        roots = self._get_scan_roots(cursor)
+        if not roots:
+            return
+        
+        deltas: Dict[int, List[int]] = {}
+        for rows, sign in ((removed, -1), (added, 1)):
+            for row in rows:
+                for root_id in self._roots_containing(roots, row['file_path']):
+                    delta = deltas.setdefault(root_id, [0, 0])
+                    delta[0] += sign
+                    delta[1] += sign * int(row['file_size'] or 0)
+        
+        updates = [(count, size, root_id) for root_id, (count, size) in deltas.items() if count or size]
+        if updates:
+            cursor.executemany(
+                "UPDATE scan_roots SET file_count = file_count + %s, total_bytes = total_bytes + %s WHERE id = %s",
+                updates,
+            )
+    
+    def _apply_prefix_removal(self, cursor, path_prefix: str, prefix_condition: Optional[tuple] = None):
+        """删除整个路径前缀之前，从文件统计汇总和相关扫描根目录汇总中扣除该前缀下的记录"""
+        prefix = path_prefix.rstrip('/') or '/'
+        condition, params = prefix_condition or self._prefix_condition(prefix, cursor)
+        cursor.execute(f"""
+            SELECT file_type, file_extension, {self._SIZE_RANGE_SQL} AS size_range,
+                   COUNT(*) AS count, COALESCE(SUM(file_size), 0) AS total_bytes
+            FROM files WHERE {condition}
+            GROUP BY file_type, file_extension, size_range
+        """, params)
+        groups = cursor.fetchall()
+        deltas: Dict[tuple, List[int]] = {}
+        for group in groups:
+            for key in self._stats_keys(group['file_type'], group['file_extension'], group['size_range']):
+                delta = deltas.setdefault(key, [0, 0])
+                delta[0] -= int(group['count'])
+                delta[1] -= int(group['total_bytes'])
+        self._write_stats_deltas(cursor, deltas)
+        
+        roots = self._get_scan_roots(cursor)
+        if not roots:
+            return
+        
+        ancestors = self._roots_containing(roots, prefix)
+        # 位于被删除前缀之下的扫描根目录会被整体清空
+        descendants = [root_id for root_path, root_id in roots.items()
+                       if root_path != prefix and self._path_in(root_path, prefix)]
+        
+        if ancestors:
+            removed_count = sum(int(group['count']) for group in groups)
+            removed_bytes = sum(int(group['total_bytes']) for group in groups)
+            cursor.executemany(
+                "UPDATE scan_roots SET file_count = file_count - %s, total_bytes = total_bytes - %s WHERE id = %s",
+                [(removed_count, removed_bytes, root_id) for root_id in ancestors],
+            )
+        if descendants:
+            placeholders = ", ".join(["%s"] * len(descendants))
+            cursor.execute(f"UPDATE scan_roots SET file_count = 0, total_bytes = 0 WHERE id IN ({placeholders})", descendants)
+    
+    # ---------------------------------------------------------------
+    # 文件统计汇总
+    # ---------------------------------------------------------------
+    
+    # 文件大小区间（上界不含，字节）；与 _SIZE_RANGE_SQL 保持一致
+    _SIZE_RANGES = ((1024, '0-1KB'), (1048576, '1KB-1MB'), (104857600, '1MB-100MB'))
+    _SIZE_RANGE_SQL = """CASE
+                WHEN file_size < 1024 THEN '0-1KB'
+                WHEN file_size < 1048576 THEN '1KB-1MB'
+                WHEN file_size < 104857600 THEN '1MB-100MB'
+                ELSE '100MB+'
+            END"""
+    
+    @classmethod
+    def _size_range(cls, file_size: int) -> str:
+        for upper, label in cls._SIZE_RANGES:
+            if file_size < upper:
+                return label
+        return '100MB+'
+    
+    @staticmethod
+    def _stats_keys(file_type: Optional[str], file_extension: Optional[str], size_range: str) -> List[tuple]:
+        """一条文件记录计入的汇总行 (dimension, dim_key)；没有扩展名的文件不计入扩展名统计"""
+        keys = [('total', ''), ('type', file_type or ''), ('size', size_range)]
+        if file_extension is not None:
+            keys.append(('extension', file_extension))
+        return keys
+    
+    def _apply_stats_changes(self, cursor, removed: List[Dict], added: List[Dict]):
+        """在写入文件记录的同一事务中更新文件统计汇总"""
+        deltas: Dict[tuple, List[int]] = {}
+        for rows, sign in ((removed, -1), (added, 1)):
+            for row in rows:
+                file_size = int(row.get('file_size') or 0)
+                for key in self._stats_keys(row.get('file_type'), row.get('file_extension'), self._size_range(file_size)):
+                    delta = deltas.setdefault(key, [0, 0])
+                    delta[0] += sign
+                    delta[1] += sign * file_size
+        self._write_stats_deltas(cursor, deltas)
+    
+    @staticmethod
+    def _write_stats_deltas(cursor, deltas: Dict[tuple, List[int]]):
+        # 按主键顺序写入，并发事务以相同顺序加锁，避免死锁
+        rows = [(dimension, dim_key, count, size)
+                for (dimension, dim_key), (count, size) in sorted(deltas.items()) if count or size]
+        if rows:
+            cursor.executemany("""
+                INSERT INTO file_stats (dimension, dim_key, file_count, total_bytes) VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE file_count = file_count + VALUES(file_count),
+                                        total_bytes = total_bytes + VALUES(total_bytes)
+            """, rows)
+    
+    def rebuild_file_stats(self):
+        """从 files 表重新生成文件统计汇总（全表聚合，只在初始化或修复时使用）"""
+        try:
+            with self.pool.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("DELETE FROM file_stats")
+                    cursor.execute("""
+                        INSERT INTO file_stats (dimension, dim_key, file_count, total_bytes)
+                        SELECT 'total', '', COUNT(*), COALESCE(SUM(file_size), 0) FROM files
+                    """)
+                    cursor.execute("""
+                        INSERT INTO file_stats (dimension, dim_key, file_count, total_bytes)
+                        SELECT 'type', COALESCE(file_type, ''), COUNT(*), COALESCE(SUM(file_size), 0)
+                        FROM files GROUP BY COALESCE(file_type, '')
+                    """)
+                    cursor.execute("""
+                        INSERT INTO file_stats (dimension, dim_key, file_count, total_bytes)
+                        SELECT 'extension', file_extension, COUNT(*), COALESCE(SUM(file_size), 0)
+                        FROM files WHERE file_extension IS NOT NULL GROUP BY file_extension
+                    """)
+                    cursor.execute(f"""
+                        INSERT INTO file_stats (dimension, dim_key, file_count, total_bytes)
+                        SELECT 'size', size_range, COUNT(*), COALESCE(SUM(file_size), 0)
+                        FROM (SELECT {self._SIZE_RANGE_SQL} AS size_range, file_size FROM files) sized
+                        GROUP BY size_range
+                    """)
+                conn.commit()
+            self._invalidate_unscoped()
+            logger.info("文件统计汇总已重新生成")
+        except Exception as e:
+            logger.error(f"重新生成文件统计汇总失败: {e}")
+            raise
+    
+    # ---------------------------------------------------------------
+    # 扫描根目录汇总
+    # ---------------------------------------------------------------
+    
+    @staticmethod
+    def _path_in(path: str, root_path: str) -> bool:
+        """判断 path 是否等于 root_path 或位于其下"""
+        return path == root_path or path.startswith(root_path.rstrip('/') + '/')
+    
+    def _roots_containing(self, roots: Dict[str, int], path: str) -> List[int]:
+        """返回包含 path 的所有扫描根目录ID"""
+        return [root_id for root_path, root_id in roots.items() if self._path_in(path, root_path)]
+    
+    def _get_scan_roots(self, cursor=None) -> Dict[str, int]:
+        """已登记的扫描根目录 {root_path: id}，表很小，缓存在进程内
+        
+        在写事务内调用时传入当前游标，避免在持有连接的情况下再向连接池借第二个连接。
+        """
+        roots = self._scan_roots
+        if roots is None:
+            with self._scan_roots_lock:
+                if self._scan_roots is None:
+                    if cursor is not None:
+                        cursor.execute("SELECT id, root_path FROM scan_roots")
+                        self._scan_roots = {row['root_path']: row['id'] for row in cursor.fetchall()}
+                    else:
+                        with self.pool.connection() as conn, conn.cursor() as own_cursor:
+                            own_cursor.execute("SELECT id, root_path FROM scan_roots")
+                            self._scan_roots = {row['root_path']: row['id'] for row in own_cursor.fetchall()}
+                roots = self._scan_roots
+        return roots
+    
+    @staticmethod
+    def _root_hash(root_path: str) -> str:
+        return hashlib.md5(root_path.encode('utf-8')).hexdigest()
+    
+    def register_scan_root(self, root_path: str):
+        """登记扫描根目录；首次登记时用一次聚合查询初始化汇总，之后由写入增量维护"""
+        root_path = root_path.rstrip('/') or '/'
+        if root_path in self._get_scan_roots():
+            return
+        
+        # 持有该路径下所有写入会用到的锁：聚合之后、新根目录对写入可见之前提交的记录不会被漏计，
+        # 之后的写入按新的根目录列表重新加锁，由增量计入
+        with self._summary_write_lock(prefix=root_path):
+            try:
+                with self.pool.connection() as conn:
+                    with conn.cursor() as cursor:
+                        condition, params = self._prefix_condition(root_path, cursor)
+                        cursor.execute(
+                            f"SELECT COUNT(*) AS count, COALESCE(SUM(file_size), 0) AS total_bytes FROM files WHERE {condition}",
+                            params,
+                        )
+                        summary = cursor.fetchone()
+                        cursor.execute("""
+                            INSERT INTO scan_roots (root_path, path_hash, file_count, total_bytes)
+                            VALUES (%s, %s, %s, %s)
+                            ON DUPLICATE KEY UPDATE file_count = VALUES(file_count), total_bytes = VALUES(total_bytes)
+                        """, (root_path, self._root_hash(root_path), summary['count'], summary['total_bytes']))
+                    conn.commit()
+                logger.info(f"已登记扫描根目录: {root_path}")
+            except Exception as e:
+                logger.error(f"登记扫描根目录失败: {e}")
+                raise
+            finally:
+                # 重新加载根目录列表；在释放锁之前进行
+                self._scan_roots = None
+    
+    def finish_scan_root(self, root_path: str):
+        """记录扫描根目录的最近扫描时间"""
+        root_path = root_path.rstrip('/') or '/'
+        try:
+            with self.pool.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("UPDATE scan_roots SET last_scan_time = NOW() WHERE path_hash = %s",
+                                   (self._root_hash(root_path),))
+                conn.commit()
+        except Exception as e:
+            logger.error(f"更新扫描时间失败: {e}")
+            raise
+    
+    def get_scan_root_summary(self, root_path: str) -> Optional[Dict]:
+        """按主键读取扫描根目录汇总（文件数、总字节数、最近扫描时间），未登记时返回 None"""
+        root_path = root_path.rstrip('/') or '/'
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT root_path, file_count, total_bytes, last_scan_time
+                    FROM scan_roots WHERE path_hash = %s
+                """, (self._root_hash(root_path),))
+                summary = cursor.fetchone()
+                if summary and isinstance(summary.get('last_scan_time'), datetime):
+                    summary['last_scan_time'] = summary['last_scan_time'].isoformat()
+                return summary
+        except Exception as e:
+            logger.error(f"读取扫描根目录汇总失败: {e}")
+            raise
+    
+    def set_scan_root_watch(self, root_path: str, enabled: bool):
+        """设置扫描根目录是否实时监听，进程重启后据此恢复监听"""
+        root_path = root_path.rstrip('/') or '/'
+        try:
+            with self.pool.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("UPDATE scan_roots SET watch_enabled = %s WHERE path_hash = %s",
+                                   (enabled, self._root_hash(root_path)))
+                conn.commit()
+        except Exception as e:
+            logger.error(f"更新监听状态失败: {e}")
+            raise
+    
+    def get_watched_roots(self) -> List[str]:
+        """需要实时监听的扫描根目录"""
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                cursor.execute("SELECT root_path FROM scan_roots WHERE watch_enabled = TRUE")
+                return [row['root_path'] for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"读取监听目录失败: {e}")
+            raise
+    
+    # ---------------------------------------------------------------
+    # 扫描任务
+    # ---------------------------------------------------------------
+    
+    # 允许 update_scan_job 更新的列
+    _SCAN_JOB_FIELDS = (
+        'status', 'dirs_scanned', 'files_scanned', 'files_saved', 'files_deleted', 'bytes_scanned',
+        'error_count', 'files_per_second', 'frontier', 'error_message',
+        'started_time', 'finished_time', 'checkpoint_time',
+    )
+    
+    def create_scan_job(self, root_path: str, recursive: bool, incremental: bool, status: str = 'pending') -> int:
+        """创建扫描任务记录，返回任务 ID"""
+        try:
+            with self.pool.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        INSERT INTO scan_jobs (root_path, recursive_scan, incremental, status)
+                        VALUES (%s, %s, %s, %s)
+                    """, (root_path, recursive, incremental, status))
+                    job_id = cursor.lastrowid
+                conn.commit()
+            return job_id
+        except Exception as e:
+            logger.error(f"创建扫描任务失败: {e}")
+            raise
+    
+    def update_scan_job(self, job_id: int, **fields):
+        """更新扫描任务的状态、计数或断点；frontier 传 FileScanner.checkpoint() 的结果，None 表示清除断点"""
+        fields = {k: v for k, v in fields.items() if k in self._SCAN_JOB_FIELDS}
+        if not fields:
+            return
+        if 'frontier' in fields and fields['frontier'] is not None:
+            fields['frontier'] = json.dumps(fields['frontier'], ensure_ascii=False)
+        
+        assignments = ", ".join(f"{column} = %s" for column in fields)
+        try:
+            with self.pool.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(f"UPDATE scan_jobs SET {assignments} WHERE id = %s",
+                                   list(fields.values()) + [job_id])
+                conn.commit()
+        except Exception as e:
+            logger.error(f"更新扫描任务失败: {e}")
+            raise
+    
+    @staticmethod
+    def _format_scan_job(row: Dict, include_frontier: bool) -> Dict:
+        """把扫描任务记录转换为接口返回格式"""
+        frontier = row.pop('frontier', None)
+        row['recursive'] = bool(row.pop('recursive_scan'))
+        row['incremental'] = bool(row['incremental'])
+        row['resumable'] = frontier is not None
+        if include_frontier:
+            row['frontier'] = json.loads(frontier) if frontier is not None else None
+        for key in ('created_time', 'started_time', 'finished_time', 'checkpoint_time'):
+            if isinstance(row.get(key), datetime):
+                row[key] = row[key].isoformat()
+        return row
+    
+    def get_scan_job(self, job_id: int, include_frontier: bool = False) -> Optional[Dict]:
+        """读取扫描任务记录，不存在时返回 None"""
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                cursor.execute("SELECT * FROM scan_jobs WHERE id = %s", (job_id,))
+                row = cursor.fetchone()
+                return self._format_scan_job(row, include_frontier) if row else None
+        except Exception as e:
+            logger.error(f"读取扫描任务失败: {e}")
+            raise
+    
+    def list_scan_jobs(self, status: Optional[str] = None, limit: int = 20,
+                       include_frontier: bool = False) -> List[Dict]:
+        """按创建时间倒序列出扫描任务"""
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                where = "WHERE status = %s" if status else ""
+                params = [status] if status else []
+                cursor.execute(f"SELECT * FROM scan_jobs {where} ORDER BY id DESC LIMIT %s", params + [limit])
+                return [self._format_scan_job(row, include_frontier) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"读取扫描任务列表失败: {e}")
+            raise
+    
+    def get_file_signatures(self, path_prefix: str) -> Dict[str, Dict]:
+        """加载路径前缀下已有文件的签名，用于增量扫描比对
+        
+        Args:
+            path_prefix: 路径前缀
+        
+        Returns:
+            {file_path: {'file_size': ..., 'modified_time': ..., 'file_hash': ...}}
+        """
+        try:
+            signatures = {}
+            condition, params = self._prefix_condition(path_prefix)
+            # 使用非缓冲游标逐行读取，避免客户端同时持有完整结果集和字典
+            with self.pool.connection() as conn, conn.cursor(pymysql.cursors.SSCursor) as cursor:
+                sql = f"""
+                    SELECT file_path, file_size, modified_time, file_hash
+                    FROM files
+                    WHERE {condition}
+                """
+                cursor.execute(sql, params)
+                for file_path, file_size, modified_time, file_hash in cursor:
+                    signatures[file_path] = {
+                        'file_size': file_size,
+                        'modified_time': modified_time,
+                        'file_hash': file_hash,
+                    }
+            
+            return signatures
+        except Exception as e:
+            logger.error(f"加载文件签名失败: {e}")
+            raise
+    
+    def delete_files_by_paths(self, file_paths: List[str], batch_size: Optional[int] = None) -> int:
+        """按完整路径删除文件记录
+        
+        Args:
+            file_paths: 需要删除的文件路径列表
+            batch_size: 每条 DELETE 语句包含的路径数（默认 settings.DB_BATCH_SIZE）
+        
+        Returns:
+            删除的记录数
+        """
+        if not file_paths:
+            return 0
+        
+        batch_size = max(1, batch_size or settings.DB_BATCH_SIZE)
+        try:
+            deleted_count = 0
+            with self._summary_write_lock(file_paths), self.pool.connection() as conn:
+                with conn.cursor() as cursor:
+                    for i in range(0, len(file_paths), batch_size):
+                        chunk = file_paths[i:i + batch_size]
+                        existing = self._fetch_existing_files(cursor, chunk)
+                        placeholders = ", ".join(["%s"] * len(chunk))
+                        cursor.execute(f"DELETE FROM files WHERE file_path IN ({placeholders})", chunk)
+                        deleted_count += cursor.rowcount
+                        self._apply_file_changes(cursor, removed=list(existing.values()), added=[])
+                conn.commit()
+            self._invalidate_paths(file_paths)
+            
+            return deleted_count
+        except Exception as e:
+            logger.error(f"删除文件记录失败: {e}")
+            raise
+    
+    def _files_conditions(self, file_type: Optional[str], path_prefix: str):
+        """构建文件列表的过滤条件"""
+        conditions = []
+        params = []
+        
+        if file_type:
+            conditions.append("file_type = %s")
+            params.append(file_type)
+        
+        prefix_condition, prefix_params = self._prefix_condition(path_prefix)
+        conditions.append(prefix_condition)
+        params.extend(prefix_params)
+        
+        return conditions, params
+    
+    def get_all_files(self, file_type: Optional[str] = None, path_prefix: Optional[str] = None, limit: Optional[int] = None, offset: int = 0,
+                      page_cursor: Optional[str] = None) -> List[Dict]:
         """获取文件列表
         
+        结果按 (scan_time, id) 降序排列。提供 cursor 时使用键集分页（从上一页最后一行之后继续），
+        忽略 offset，深分页不会随页码变慢。
+        
         Args:
             file_type: 文件类型过滤（可选）
             path_prefix: 路径前缀过滤（可选，但强烈建议提供以确保数据准确性）
             limit: 返回数量限制（None表示不限制）
             offset: 偏移量
+            page_cursor: 上一页返回的续页游标（可选）
         """
+        # 路径前缀过滤是必需的，如果没有提供则返回空列表
+        if not path_prefix:
+            # 如果没有提供路径前缀，返回空列表（安全策略）
+            logger.warning("get_all_files called without path_prefix, returning empty list for safety")
+            return []
+        
+        conditions, params = self._files_conditions(file_type, path_prefix)
+        if page_cursor:
+            scan_time, last_id = decode_cursor('files', page_cursor, 2)
+            scan_time = datetime.fromisoformat(scan_time) if scan_time else None
+            if scan_time is None:
+                conditions.append("(scan_time IS NULL AND id < %s)")
+                params.append(last_id)
+            else:
+                conditions.append("(scan_time < %s OR (scan_time = %s AND id < %s) OR scan_time IS NULL)")
+                params.extend([scan_time, scan_time, last_id])
+            offset = 0
+        
         try:
-            # 确保数据库连接有效
-            self._ensure_connection()
-            
-            with self.connection.cursor() as cursor:
-                conditions = []
-                params = []
-                
-                if file_type:
-                    conditions.append("file_type = %s")
-                    params.append(file_type)
-                
-                # 路径前缀过滤是必需的，如果没有提供则返回空列表
-                if path_prefix:
-                    # 规范化路径前缀
-                    normalized_prefix = path_prefix.rstrip('/') + '/'
-                    conditions.append("(file_path LIKE %s OR file_path = %s)")
-                    params.append(f"{normalized_prefix}%")
-                    params.append(path_prefix.rstrip('/'))
-                else:
-                    # 如果没有提供路径前缀，返回空列表（安全策略）
-                    logger.warning("get_all_files called without path_prefix, returning empty list for safety")
-                    return []
-                
-                where_clause = " AND ".join(conditions) if conditions else "1=1"
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                where_clause = " AND ".join(conditions)
                 
                 # 构建SQL，如果limit为None则不添加LIMIT子句
+                sql = f"SELECT * FROM files WHERE {where_clause} ORDER BY scan_time DESC, id DESC"
                 if limit is not None:
-                    sql = f"SELECT * FROM files WHERE {where_clause} ORDER BY scan_time DESC LIMIT %s OFFSET %s"
+                    sql += " LIMIT %s OFFSET %s"
                     params.extend([limit, offset])
-                else:
-                    sql = f"SELECT * FROM files WHERE {where_clause} ORDER BY scan_time DESC"
-                    if offset > 0:
-                        sql += f" LIMIT 999999 OFFSET %s"
-                        params.append(offset)
+                elif offset > 0:
+                    # MySQL 没有单独的 OFFSET 语法，使用最大行数作为 LIMIT
+                    sql += " LIMIT 18446744073709551615 OFFSET %s"
+                    params.append(offset)
                 
                 cursor.execute(sql, params)
                 
-                files = cursor.fetchall()
+                files = self._fill_mime_types(cursor.fetchall(), cursor)
                 
                 # 转换datetime对象为字符串
                 for file in files:
@@ -448,132 +1561,743 @@ class Database:
                 
                 return files
         except pymysql.err.OperationalError as e:
+            # 出错的连接已被连接池丢弃，下次请求会拿到新的连接
             logger.error(f"获取文件列表失败（数据库操作错误）: {e}")
-            # 尝试重新连接
-            try:
-                self.connect()
-                # 重试一次
-                return self.get_all_files(file_type, limit, offset)
-            except Exception as retry_e:
-                logger.error(f"重试获取文件列表失败: {retry_e}")
-                raise
+            raise
         except Exception as e:
             logger.error(f"获取文件列表失败: {e}")
             logger.error(f"错误类型: {type(e).__name__}, 错误详情: {str(e)}")
             raise
     
-    def search_files(self, keyword: str, limit: int = 100, offset: int = 0) -> List[Dict]:
-        """搜索文件"""
+    def get_files_page(self, file_type: Optional[str], path_prefix: str, limit: Optional[int], offset: int = 0,
+                       page_cursor: Optional[str] = None) -> Dict:
+        """获取一页文件，附带下一页游标（没有更多数据时为 None）；结果缓存到该路径下有写入为止"""
+        cache_key = ('files', file_type, path_prefix, limit, offset, page_cursor)
+        page = self.query_cache.get(cache_key)
+        if page is not QueryCache.MISSING:
+            return page
+        generation = self.query_cache.generation()
+        
+        files = self.get_all_files(file_type, path_prefix, limit, offset, page_cursor)
+        next_cursor = None
+        if limit is not None and len(files) == limit:
+            last = files[-1]
+            next_cursor = encode_cursor('files', [last.get('scan_time'), last['id']])
+        page = {'files': files, 'next_cursor': next_cursor}
+        self.query_cache.set(cache_key, page, scope=path_prefix, rows=len(files), generation=generation)
+        return page
+    
+    def iter_files(self, file_type: Optional[str], path_prefix: str,
+                   batch_size: Optional[int] = None) -> Iterator[List[Dict]]:
+        """逐批读取路径前缀下的全部文件，用于流式导出
+        
+        使用服务端游标（SSDictCursor），数据库一边返回行一边产出，内存占用只与 batch_size 有关。
+        不排序，按数据库读取的顺序返回，排序会让数据库先物化全部结果才能返回第一行。
+        生成器存续期间一直占用一个连接；导出结束或中途关闭后连接都直接丢弃，
+        不在连接上读完剩余的结果，也不把改过会话变量的连接还回连接池。
+        """
+        batch_size = max(1, batch_size or settings.EXPORT_FETCH_SIZE)
+        conditions, params = self._files_conditions(file_type, path_prefix)
+        sql = f"SELECT {', '.join(EXPORT_COLUMNS)}, kind_id FROM files WHERE {' AND '.join(conditions)}"
+        
+        conn, created_at = self.pool.acquire()
+        try:
+            # 非缓冲游标读取期间连接上不能再执行其他查询，遇到未知的种类 id 时由 _fill_mime_types 另借连接读取
+            cursor = conn.cursor(pymysql.cursors.SSDictCursor)
+            try:
+                # 客户端读取较慢时服务端会阻塞在写网络上，放宽写超时，避免长时间导出被服务端中断
+                cursor.execute("SET SESSION net_write_timeout = 3600")
+            except pymysql.err.MySQLError as e:
+                logger.debug(f"设置 net_write_timeout 失败: {e}")
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                self._fill_mime_types(rows)
+                for row in rows:
+                    del row['kind_id']
+                    for key in ('created_time', 'modified_time', 'scan_time'):
+                        if isinstance(row.get(key), datetime):
+                            row[key] = row[key].isoformat()
+                yield rows
+        except GeneratorExit:
+            logger.info(f"文件导出中途结束: {path_prefix}")
+            raise
+        except Exception as e:
+            logger.error(f"导出文件列表失败: {e}")
+            raise
+        finally:
+            self.pool.release(conn, created_at, discard=True)
+    
+    def count_files(self, file_type: Optional[str], path_prefix: str) -> int:
+        """统计路径前缀下的文件数，结果缓存 COUNT_CACHE_TTL 秒，写入该路径时失效"""
+        cache_key = ('files', file_type, path_prefix)
+        count = self._count_cache.get(cache_key)
+        if count is not TTLCache.MISSING:
+            return count
+        generation = self._count_cache.generation()
+        
+        conditions, params = self._files_conditions(file_type, path_prefix)
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(f"SELECT COUNT(*) AS count FROM files WHERE {' AND '.join(conditions)}", params)
+                count = cursor.fetchone()['count']
+        except Exception as e:
+            logger.error(f"统计文件数失败: {e}")
+            raise
+        
+        self._count_cache.set(cache_key, count, scope=path_prefix, rows=1, generation=generation)
+        return count
+    
+    def _bm25_weights(self, terms: List[str]) -> Dict:
+        """查询词项的 BM25 参数：{'idf': {term: idf}, 'avgdl': 平均文档长度}，结果缓存 COUNT_CACHE_TTL 秒
+        
+        文档频率直接从 file_index 统计（搜索时本来就要读取这些词项的倒排记录），
+        不单独维护计数表，文件被级联删除时也不会出现计数偏差。
+        """
+        cache_key = ('bm25', tuple(terms))
+        weights = self._corpus_cache.get(cache_key)
+        if weights is not TTLCache.MISSING:
+            return weights
+        
+        placeholders = ", ".join(["%s"] * len(terms))
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                cursor.execute("SELECT COUNT(*) AS docs, AVG(doc_length) AS avgdl FROM file_index_docs")
+                corpus = cursor.fetchone()
+                cursor.execute(f"""
+                    SELECT keyword, COUNT(*) AS df FROM file_index
+                    WHERE keyword IN ({placeholders})
+                    GROUP BY keyword
+                """, terms)
+                doc_freqs = {row['keyword']: row['df'] for row in cursor.fetchall()}
+        except Exception as e:
+            logger.error(f"读取词项统计失败: {e}")
+            raise
+        
+        # 升级前建立索引的文件没有 file_index_docs 记录，文档数至少取最大的文档频率
+        docs = max(int(corpus['docs'] or 0), max(doc_freqs.values(), default=0), 1)
+        idf = {}
+        for term in terms:
+            df = doc_freqs.get(term, 0)
+            idf[term] = math.log(1 + (docs - df + 0.5) / (df + 0.5))
+        weights = {'idf': idf, 'avgdl': float(corpus['avgdl'] or 0) or 1.0}
+        self._corpus_cache.set(cache_key, weights)
+        return weights
+    
+    def _build_search_query(self, keyword: str, weights: Optional[Dict] = None):
+        """构建搜索查询，返回 (带 relevance_score 列的结果集 SQL, 参数)
+        
+        weights 为 _bm25_weights 的结果，未提供时按当前语料统计计算。
+        
+        文件名和路径通过 n-gram 全文索引做子串匹配；内容通过 file_index 倒排索引查找，
+        关键词切分出的所有词项都出现在文件中才算内容匹配。
+        相关性分数：文件名完全匹配 +10，文件名匹配 +5、路径匹配 +2（全文索引时按全文得分加权），
+        加上内容的 BM25 分数，分数和排序、分页都在数据库中完成。
+        """
+        keyword = keyword.strip()
+        terms = sorted(set(tokenize(keyword)))
+        # 布尔模式下用双引号包裹为短语查询，ngram 解析器会把短语展开为连续的 n-gram，即子串匹配
+        phrase = keyword.replace('"', ' ').strip()
+        use_fulltext = self.fulltext_enabled and len(phrase) >= self.NGRAM_TOKEN_SIZE
+        
+        # 候选集：名称/路径匹配的文件 ∪ 内容包含全部词项的文件
+        candidates = []
+        params = []
+        if use_fulltext:
+            candidates.append("SELECT id FROM files WHERE MATCH(file_path) AGAINST (%s IN BOOLEAN MODE)")
+            params.append(f'"{phrase}"')
+        else:
+            # 没有全文索引或关键词短于 n-gram 长度（单字符）时做子串匹配，名称或路径任意位置包含即命中
+            candidates.append("SELECT id FROM files WHERE file_name LIKE %s OR file_path LIKE %s")
+            params.extend([f"%{self._escape_like(keyword)}%"] * 2)
+        
+        postings = None
+        posting_params = []
+        if terms:
+            placeholders = ", ".join(["%s"] * len(terms))
+            candidates.append(f"""
+                SELECT file_id FROM file_index
+                WHERE keyword IN ({placeholders})
+                GROUP BY file_id
+                HAVING COUNT(DISTINCT keyword) = %s
+            """)
+            params.extend([*terms, len(terms)])
+            
+            # BM25：idf × tf × (k1 + 1) / (tf + k1 × (1 - b + b × dl / avgdl))，idf 按词项以 CASE 传入
+            weights = weights or self._bm25_weights(terms)
+            k1, b, avgdl = settings.BM25_K1, settings.BM25_B, weights['avgdl']
+            idf_cases = " ".join(["WHEN %s THEN %s"] * len(terms))
+            postings = f"""
+                SELECT fi.file_id,
+                       SUM((CASE fi.keyword {idf_cases} ELSE 0 END) * fi.term_freq * %s
+                           / (fi.term_freq + %s * (1 - %s + %s * COALESCE(d.doc_length, %s) / %s))) AS match_score,
+                       MAX(fi.content_preview) AS content_preview
+                FROM file_index fi
+                LEFT JOIN file_index_docs d ON d.file_id = fi.file_id
+                WHERE fi.keyword IN ({placeholders})
+                GROUP BY fi.file_id
+                HAVING COUNT(DISTINCT fi.keyword) = %s
+            """
+            posting_params = [
+                *(value for term in terms for value in (term, weights['idf'][term])),
+                k1 + 1, k1, b, b, avgdl, avgdl,
+                *terms, len(terms),
+            ]
+        
+        if use_fulltext:
+            name_score = "MATCH(f.file_name) AGAINST (%s IN BOOLEAN MODE) * 5 + MATCH(f.file_path) AGAINST (%s IN BOOLEAN MODE) * 2"
+            score_params = [f'"{phrase}"', f'"{phrase}"']
+        else:
+            name_score = "(CASE WHEN f.file_name LIKE %s THEN 5 ELSE 0 END) + (CASE WHEN f.file_path LIKE %s THEN 2 ELSE 0 END)"
+            score_params = [f"%{self._escape_like(keyword)}%"] * 2
+        
+        if postings:
+            content_join = f"LEFT JOIN ({postings}) fi ON fi.file_id = f.id"
+            content_columns = "fi.match_score, fi.content_preview"
+            content_score = "COALESCE(fi.match_score, 0)"
+        else:
+            content_join = ""
+            content_columns = "NULL AS match_score, NULL AS content_preview"
+            content_score = "0"
+        
+        # 分数保留 6 位小数，续页游标中的分数可以精确比较
+        sql = f"""
+            SELECT f.*, {content_columns},
+                   ROUND((CASE WHEN f.file_name = %s THEN 10 ELSE 0 END)
+                         + {name_score}
+                         + {content_score}, 6) AS relevance_score
+            FROM ({" UNION ".join(candidates)}) c
+            JOIN files f ON f.id = c.id
+            {content_join}
+        """
+        return sql, [keyword, *score_params, *params, *posting_params]
+    
+    def _page_weights(self, keyword: str, page_cursor: Optional[str] = None) -> Optional[Dict]:
+        """本页使用的 BM25 参数；没有可索引的词项时为 None
+        
+        分数依赖文档数、平均长度和文档频率，这些统计在翻页之间可能变化（缓存过期、写入）。
+        续页沿用游标中第一页的参数，分数不变，键集边界才不会移动。
+        """
+        terms = sorted(set(tokenize(keyword.strip())))
+        if page_cursor:
+            weights = decode_cursor('search', page_cursor, 3)[2]
+            if not terms:
+                if weights is not None:
+                    raise ValueError("无效的分页游标")
+                return None
+            try:
+                idf = {term: float(weights['idf'][term]) for term in terms}
+                avgdl = float(weights['avgdl'])
+            except (TypeError, KeyError, ValueError):
+                raise ValueError("无效的分页游标")
+            if not (avgdl > 0 and all(math.isfinite(value) for value in (*idf.values(), avgdl))):
+                raise ValueError("无效的分页游标")
+            return {'idf': idf, 'avgdl': avgdl}
+        return self._bm25_weights(terms) if terms else None
+    
+    def search_files(self, keyword: str, limit: int = 100, offset: int = 0, page_cursor: Optional[str] = None,
+                     weights: Optional[Dict] = None) -> List[Dict]:
+        """搜索文件
+        
+        结果按相关性分数降序排列，分数相同时按 id 排序，保证分页结果稳定。
+        提供 page_cursor 时使用键集分页，忽略 offset；weights 为 _page_weights 的结果，未提供时在这里计算。
+        """
         try:
-            # 确保数据库连接有效
-            self._ensure_connection()
+            if weights is None:
+                weights = self._page_weights(keyword, page_cursor)
+            sql, params = self._build_search_query(keyword, weights)
+            where_clause = ""
+            if page_cursor:
+                score, last_id, _ = decode_cursor('search', page_cursor, 3)
+                where_clause = "WHERE r.relevance_score < %s OR (r.relevance_score = %s AND r.id > %s)"
+                params.extend([score, score, last_id])
+                offset = 0
             
-            with self.connection.cursor() as cursor:
-                sql = """
-                    SELECT f.*, fi.match_score, fi.content_preview
-                    FROM files f
-                    LEFT JOIN file_index fi ON f.id = fi.file_id
-                    WHERE f.file_name LIKE %s 
-                       OR f.file_path LIKE %s
-                       OR fi.keyword LIKE %s
-                    ORDER BY fi.match_score DESC, f.file_name
-                    LIMIT %s OFFSET %s
-                """
-                pattern = f"%{keyword}%"
-                cursor.execute(sql, (pattern, pattern, pattern, limit, offset))
-                return cursor.fetchall()
+            sql = f"""
+                SELECT * FROM ({sql}) r
+                {where_clause}
+                ORDER BY r.relevance_score DESC, r.id
+                LIMIT %s OFFSET %s
+            """
+            params.extend([limit, offset])
+            
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(sql, params)
+                return self._fill_mime_types(cursor.fetchall(), cursor)
+        except ValueError:
+            raise
         except Exception as e:
             logger.error(f"搜索文件失败: {e}")
             raise
     
-    def get_file_statistics(self) -> Dict:
-        """获取文件统计信息"""
+    def search_files_page(self, keyword: str, limit: int = 100, offset: int = 0, page_cursor: Optional[str] = None) -> Dict:
+        """搜索一页文件，附带下一页游标（没有更多数据时为 None）；结果缓存到下一次写入为止"""
+        cache_key = ('search', keyword, limit, offset, page_cursor)
+        page = self.query_cache.get(cache_key)
+        if page is not QueryCache.MISSING:
+            return page
+        generation = self.query_cache.generation()
+        
+        weights = self._page_weights(keyword, page_cursor)
+        results = self.search_files(keyword, limit, offset, page_cursor, weights)
+        next_cursor = None
+        if len(results) == limit:
+            last = results[-1]
+            # 游标带上本页的 BM25 参数，之后的页面按相同的分数继续
+            next_cursor = encode_cursor('search', [float(last['relevance_score'] or 0), last['id'], weights])
+        page = {'results': results, 'next_cursor': next_cursor}
+        self.query_cache.set(cache_key, page, scope=None, rows=len(results), generation=generation)
+        return page
+    
+    def count_search_results(self, keyword: str) -> Dict:
+        """统计搜索结果数，超过 SEARCH_COUNT_LIMIT 时只返回估计值，结果缓存 COUNT_CACHE_TTL 秒，任何写入都会使其失效
+        
+        Returns:
+            {'total': 数量, 'estimated': 是否为估计值}
+        """
+        cache_key = ('search', keyword.strip().lower())
+        result = self._count_cache.get(cache_key)
+        if result is not TTLCache.MISSING:
+            return result
+        generation = self._count_cache.generation()
+        
+        sql, params = self._build_search_query(keyword)
+        cap = settings.SEARCH_COUNT_LIMIT
         try:
-            # 确保数据库连接有效
-            self._ensure_connection()
-            
-            with self.connection.cursor() as cursor:
-                stats = {}
-                
-                # 总文件数
-                cursor.execute("SELECT COUNT(*) as total FROM files")
-                stats['total_files'] = cursor.fetchone()['total']
-                
-                # 按类型统计
-                cursor.execute("""
-                    SELECT file_type, COUNT(*) as count, SUM(file_size) as total_size
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(f"SELECT COUNT(*) AS count FROM (SELECT r.id FROM ({sql}) r LIMIT %s) t", [*params, cap + 1])
+                count = cursor.fetchone()['count']
+        except Exception as e:
+            logger.error(f"统计搜索结果失败: {e}")
+            raise
+        
+        result = {'total': min(count, cap), 'estimated': count > cap}
+        self._count_cache.set(cache_key, result, scope=None, rows=1, generation=generation)
+        return result
+    
+    @staticmethod
+    def _escape_like(value: str) -> str:
+        """转义 LIKE 模式中的通配符"""
+        return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    
+    def get_file_ids(self, file_paths: List[str]) -> Dict[str, int]:
+        """按完整路径查询文件ID
+        
+        Returns:
+            {file_path: id}
+        """
+        if not file_paths:
+            return {}
+        
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                placeholders = ", ".join(["%s"] * len(file_paths))
+                cursor.execute(f"SELECT id, file_path FROM files WHERE file_path IN ({placeholders})", file_paths)
+                return {row['file_path']: row['id'] for row in cursor.fetchall()}
+        except Exception as e:
+            logger.error(f"查询文件ID失败: {e}")
+            raise
+    
+    def replace_file_index(self, postings_by_file: Dict[int, List[Dict]]):
+        """替换文件的倒排索引记录和文档长度
+        
+        Args:
+            postings_by_file: {file_id: [{'keyword', 'term_freq', 'match_score', 'content_preview', 'doc_length'}]}
+        """
+        if not postings_by_file:
+            return
+        
+        rows = [
+            (file_id, posting['keyword'], posting['term_freq'], posting['match_score'], posting['content_preview'])
+            for file_id, postings in postings_by_file.items()
+            for posting in postings
+        ]
+        doc_rows = [
+            (file_id, postings[0].get('doc_length', 0) if postings else 0)
+            for file_id, postings in postings_by_file.items()
+        ]
+        
+        try:
+            with self.pool.connection() as conn:
+                with conn.cursor() as cursor:
+                    file_ids = list(postings_by_file)
+                    placeholders = ", ".join(["%s"] * len(file_ids))
+                    cursor.execute(f"DELETE FROM file_index WHERE file_id IN ({placeholders})", file_ids)
+                    
+                    sql = """
+                        INSERT INTO file_index (file_id, keyword, term_freq, match_score, content_preview)
+                        VALUES (%s, %s, %s, %s, %s)
+                    """
+                    for i in range(0, len(rows), settings.DB_BATCH_SIZE):
+                        cursor.executemany(sql, rows[i:i + settings.DB_BATCH_SIZE])
+                    
+                    cursor.executemany("""
+                        INSERT INTO file_index_docs (file_id, doc_length) VALUES (%s, %s)
+                        ON DUPLICATE KEY UPDATE doc_length = VALUES(doc_length)
+                    """, doc_rows)
+                conn.commit()
+            # 倒排索引只影响搜索结果
+            self._invalidate_unscoped()
+        except Exception as e:
+            logger.error(f"写入倒排索引失败: {e}")
+            raise
+    
+    # ---------------------------------------------------------------
+    # 重复文件
+    # ---------------------------------------------------------------
+    
+    def _duplicate_conditions(self, min_size: int, path_prefix: Optional[str]):
+        """重复文件查询的公共过滤条件：最小文件大小和可选的路径前缀"""
+        conditions = ["file_size >= %s"]
+        params: List = [max(1, min_size)]
+        if path_prefix:
+            prefix_conditions, prefix_params = self._files_conditions(None, path_prefix)
+            conditions.extend(prefix_conditions)
+            params.extend(prefix_params)
+        return conditions, params
+    
+    # 只有完整哈希才能判定内容相同；旧数据没有 hash_type，都是完整的 MD5
+    _FULL_HASH_CONDITION = "file_hash IS NOT NULL AND file_hash <> '' AND (hash_type IS NULL OR hash_type NOT LIKE %s)"
+    
+    def get_duplicate_groups(self, min_size: int = 1, path_prefix: Optional[str] = None,
+                             limit: int = 100, offset: int = 0) -> List[Dict]:
+        """在数据库中按 (file_size, file_hash) 分组找出重复文件，按可回收字节数降序
+        
+        Returns:
+            [{'file_size', 'file_hash', 'file_count', 'reclaimable_bytes'}]
+        """
+        conditions, params = self._duplicate_conditions(min_size, path_prefix)
+        conditions.append(self._FULL_HASH_CONDITION)
+        params.append('%' + PARTIAL_SUFFIX)
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT file_size, file_hash, COUNT(*) AS file_count,
+                           file_size * (COUNT(*) - 1) AS reclaimable_bytes
                     FROM files
-                    GROUP BY file_type
-                    ORDER BY count DESC
-                """)
-                stats['by_type'] = cursor.fetchall()
-                
-                # 按扩展名统计
-                cursor.execute("""
-                    SELECT file_extension, COUNT(*) as count
+                    WHERE {' AND '.join(conditions)}
+                    GROUP BY file_size, file_hash
+                    HAVING COUNT(*) > 1
+                    ORDER BY reclaimable_bytes DESC, file_size DESC, file_hash
+                    LIMIT %s OFFSET %s
+                """, params + [limit, offset])
+                groups = cursor.fetchall()
+                for group in groups:
+                    group['file_count'] = int(group['file_count'])
+                    group['reclaimable_bytes'] = int(group['reclaimable_bytes'])
+                return groups
+        except Exception as e:
+            logger.error(f"查询重复文件分组失败: {e}")
+            raise
+    
+    def get_duplicate_summary(self, min_size: int = 1, path_prefix: Optional[str] = None) -> Dict:
+        """统计重复文件分组数、多余副本数和可回收总字节数，结果缓存 COUNT_CACHE_TTL 秒，写入该路径时失效"""
+        cache_key = ('duplicates', min_size, path_prefix)
+        summary = self._count_cache.get(cache_key)
+        if summary is not TTLCache.MISSING:
+            return summary
+        generation = self._count_cache.generation()
+        
+        conditions, params = self._duplicate_conditions(min_size, path_prefix)
+        conditions.append(self._FULL_HASH_CONDITION)
+        params.append('%' + PARTIAL_SUFFIX)
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT COUNT(*) AS group_count,
+                           COALESCE(SUM(file_count - 1), 0) AS redundant_files,
+                           COALESCE(SUM(file_size * (file_count - 1)), 0) AS reclaimable_bytes
+                    FROM (
+                        SELECT file_size, COUNT(*) AS file_count
+                        FROM files
+                        WHERE {' AND '.join(conditions)}
+                        GROUP BY file_size, file_hash
+                        HAVING COUNT(*) > 1
+                    ) AS duplicate_groups
+                """, params)
+                row = cursor.fetchone()
+                summary = {key: int(row[key] or 0) for key in ('group_count', 'redundant_files', 'reclaimable_bytes')}
+        except Exception as e:
+            logger.error(f"统计重复文件失败: {e}")
+            raise
+        
+        self._count_cache.set(cache_key, summary, scope=path_prefix, rows=1, generation=generation)
+        return summary
+    
+    def get_duplicate_files(self, groups: List[Dict], path_prefix: Optional[str] = None) -> List[Dict]:
+        """读取若干 (file_size, file_hash) 分组中的文件"""
+        if not groups:
+            return []
+        keys = " OR ".join(["(file_size = %s AND file_hash = %s)"] * len(groups))
+        params: List = [value for group in groups for value in (group['file_size'], group['file_hash'])]
+        where = f"({keys})"
+        if path_prefix:
+            prefix_conditions, prefix_params = self._files_conditions(None, path_prefix)
+            where += " AND " + " AND ".join(prefix_conditions)
+            params.extend(prefix_params)
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT id, file_path, file_name, file_size, file_hash, hash_type, modified_time
+                    FROM files WHERE {where}
+                    ORDER BY file_size DESC, file_hash, file_path
+                """, params)
+                files = cursor.fetchall()
+                for file in files:
+                    if isinstance(file.get('modified_time'), datetime):
+                        file['modified_time'] = file['modified_time'].isoformat()
+                return files
+        except Exception as e:
+            logger.error(f"读取重复文件失败: {e}")
+            raise
+    
+    def get_unverified_size_groups(self, min_size: int = 1, path_prefix: Optional[str] = None,
+                                   limit: int = 100, before_size: Optional[int] = None) -> List[int]:
+        """找出至少两个文件大小相同、且其中有文件缺少完整哈希的文件大小，按大小降序
+        
+        这些是还需要在磁盘上确认的重复候选，例如部分哈希的大文件或没有哈希的旧记录。
+        before_size 用于接着上一次的结果继续，只返回更小的文件大小。
+        """
+        conditions, params = self._duplicate_conditions(min_size, path_prefix)
+        if before_size is not None:
+            conditions.append("file_size < %s")
+            params.append(before_size)
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT file_size
                     FROM files
-                    WHERE file_extension IS NOT NULL
-                    GROUP BY file_extension
-                    ORDER BY count DESC
-                    LIMIT 20
-                """)
-                stats['by_extension'] = cursor.fetchall()
-                
-                # 文件大小分布
+                    WHERE {' AND '.join(conditions)}
+                    GROUP BY file_size
+                    HAVING COUNT(*) > 1
+                       AND SUM(CASE WHEN file_hash IS NULL OR file_hash = '' OR hash_type LIKE %s THEN 1 ELSE 0 END) > 0
+                    ORDER BY file_size DESC
+                    LIMIT %s
+                """, params + ['%' + PARTIAL_SUFFIX, limit])
+                return [int(row['file_size']) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"查询待确认的重复候选失败: {e}")
+            raise
+    
+    def get_files_by_size(self, file_size: int, path_prefix: Optional[str] = None) -> List[Dict]:
+        """读取指定大小的所有文件（走 idx_size_hash 索引）"""
+        conditions, params = ["file_size = %s"], [file_size]
+        if path_prefix:
+            prefix_conditions, prefix_params = self._files_conditions(None, path_prefix)
+            conditions.extend(prefix_conditions)
+            params.extend(prefix_params)
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                cursor.execute(f"""
+                    SELECT id, file_path, file_size, file_hash, hash_type
+                    FROM files WHERE {' AND '.join(conditions)}
+                """, params)
+                return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"按大小读取文件失败: {e}")
+            raise
+    
+    def update_file_hashes(self, updates: List[tuple]) -> int:
+        """回写在磁盘上补算的哈希
+        
+        Args:
+            updates: [(file_hash, hash_type, file_id)]
+        """
+        if not updates:
+            return 0
+        try:
+            with self.pool.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.executemany("UPDATE files SET file_hash = %s, hash_type = %s WHERE id = %s", updates)
+                    updated = cursor.rowcount
+                conn.commit()
+            # 只有文件 ID，无法确定路径范围
+            self._invalidate()
+            return updated
+        except Exception as e:
+            logger.error(f"回写文件哈希失败: {e}")
+            raise
+    
+    def get_file_statistics(self) -> Dict:
+        """获取文件统计信息（读取增量维护的 file_stats 汇总表，不扫描 files 表）"""
+        stats = self.query_cache.get(('statistics',))
+        if stats is not QueryCache.MISSING:
+            return stats
+        generation = self.query_cache.generation()
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cursor:
                 cursor.execute("""
-                    SELECT 
-                        CASE 
-                            WHEN file_size < 1024 THEN '0-1KB'
-                            WHEN file_size < 1048576 THEN '1KB-1MB'
-                            WHEN file_size < 104857600 THEN '1MB-100MB'
-                            ELSE '100MB+'
-                        END as size_range,
-                        COUNT(*) as count
-                    FROM files
-                    GROUP BY size_range
+                    SELECT dimension, dim_key, file_count, total_bytes
+                    FROM file_stats WHERE file_count > 0 OR dimension = 'total'
                 """)
-                stats['by_size'] = cursor.fetchall()
-                
-                return stats
+                rows = cursor.fetchall()
         except Exception as e:
             logger.error(f"获取统计信息失败: {e}")
             raise
+        
+        by_dimension: Dict[str, List[Dict]] = {}
+        for row in rows:
+            by_dimension.setdefault(row['dimension'], []).append(row)
+        
+        def by_count(dimension: str) -> List[Dict]:
+            return sorted(by_dimension.get(dimension, []), key=lambda row: row['file_count'], reverse=True)
+        
+        total = by_dimension.get('total')
+        stats = {
+            'total_files': int(total[0]['file_count']) if total else 0,
+            'by_type': [
+                {'file_type': row['dim_key'] or None, 'count': int(row['file_count']), 'total_size': int(row['total_bytes'])}
+                for row in by_count('type')
+            ],
+            'by_extension': [
+                {'file_extension': row['dim_key'], 'count': int(row['file_count'])}
+                for row in by_count('extension')[:20]
+            ],
+            'by_size': [
+                {'size_range': row['dim_key'], 'count': int(row['file_count'])}
+                for row in by_count('size')
+            ],
+        }
+        self.query_cache.set(('statistics',), stats, scope=None, rows=len(rows), generation=generation)
+        return stats
     
     def save_statistics(self, stat_type: str, stat_data: str, sql_query: str = None, chart_config: str = None):
         """保存统计结果"""
         try:
-            with self.connection.cursor() as cursor:
+            with self.pool.connection() as conn, conn.cursor() as cursor:
                 sql = """
                     INSERT INTO statistics (stat_type, stat_data, sql_query, chart_config)
                     VALUES (%s, %s, %s, %s)
                 """
                 cursor.execute(sql, (stat_type, stat_data, sql_query, chart_config))
-                self.connection.commit()
+                conn.commit()
         except Exception as e:
             logger.error(f"保存统计结果失败: {e}")
-            self.connection.rollback()
             raise
     
-    def insert_files_batch(self, files: List[Dict]) -> int:
-        """批量插入文件信息"""
+    # 多行 upsert：VALUES 中只能包含占位符，pymysql 才会把 executemany 改写成单条多行 INSERT
+    _UPSERT_FILES_SQL = """
+        INSERT INTO files (
+            file_path, file_name, file_size, file_type,
+            file_extension, kind_id, flags, dir_id, mime_type, created_time, modified_time,
+            file_hash, hash_type, scan_time
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            file_name = VALUES(file_name),
+            file_size = VALUES(file_size),
+            file_type = VALUES(file_type),
+            file_extension = VALUES(file_extension),
+            kind_id = VALUES(kind_id),
+            flags = VALUES(flags),
+            dir_id = VALUES(dir_id),
+            mime_type = VALUES(mime_type),
+            modified_time = VALUES(modified_time),
+            file_hash = VALUES(file_hash),
+            hash_type = VALUES(hash_type),
+            metadata = NULL,
+            scan_time = VALUES(scan_time)
+    """
+    
+    def insert_files_batch(self, files: List[Dict], batch_size: Optional[int] = None) -> int:
+        """批量插入或更新文件信息
+        
+        每个批次使用一条多行 INSERT ... ON DUPLICATE KEY UPDATE（基于 uk_file_path）并只提交一次。
+        批次失败时对半拆分重试，最终只有出错的行才退回到逐条处理。
+        uk_file_path 只覆盖路径的前 _UNIQUE_PATH_CHARS 个字符，达到该长度的路径逐条写入，
+        避免前缀相同的两个路径在 ON DUPLICATE KEY UPDATE 中互相覆盖。
+        
+        Args:
+            files: 文件信息列表
+            batch_size: 每条语句写入的行数（默认 settings.DB_BATCH_SIZE）
+        
+        Returns:
+            成功写入的文件数
+        """
         if not files:
             return 0
         
+        batch_size = max(1, batch_size or settings.DB_BATCH_SIZE)
         saved_count = 0
-        for file_info in files:
-            try:
-                self.insert_file(file_info)
-                saved_count += 1
-            except Exception as e:
-                logger.warning(f"批量插入中跳过文件: {file_info.get('file_path', 'unknown')}, 错误: {e}")
-                continue
+        for i in range(0, len(files), batch_size):
+            saved_count += self._upsert_files(files[i:i + batch_size])
         
         return saved_count
     
+    # 由个别行的数据引起的错误，批量写入时二分定位并跳过出错的行；
+    # 连接断开、连接池超时等其他错误与具体行无关，直接抛出，让扫描任务失败并从断点续扫
+    _ROW_ERRORS = (pymysql.err.DataError, pymysql.err.IntegrityError, pymysql.err.InternalError, ValueError, TypeError)
+    
+    # uk_file_path 的前缀长度
+    _UNIQUE_PATH_CHARS = 500
+    
+    def _upsert_files(self, files: List[Dict]) -> int:
+        """写入一个批次，数据错误时二分定位出错的行"""
+        if len(files) > 1:
+            # 长路径按完整路径查找后逐条写入（insert_file），前缀冲突时报错而不是覆盖另一条记录
+            long_files = [f for f in files if len(str(f.get('file_path') or '')) >= self._UNIQUE_PATH_CHARS]
+            if long_files:
+                files = [f for f in files if len(str(f.get('file_path') or '')) < self._UNIQUE_PATH_CHARS]
+                saved = sum(self._upsert_files([f]) for f in long_files)
+                return saved + (self._upsert_files(files) if files else 0)
+        if len(files) == 1:
+            try:
+                self.insert_file(files[0])
+                return 1
+            except self._ROW_ERRORS as e:
+                logger.warning(f"批量插入中跳过文件: {files[0].get('file_path', 'unknown')}, 错误: {e}")
+                return 0
+        
+        scan_time = datetime.now()
+        try:
+            infos = [self._sanitize_file_info(file_info) for file_info in files]
+            # 同一路径在批次中出现多次时只写入最后一条，否则汇总增量会重复计入
+            infos = list({info['file_path']: info for info in infos}.values())
+            self._assign_kinds(infos)
+            self._assign_directories(infos)
+            rows = []
+            for info in infos:
+                rows.append((
+                    info['file_path'],
+                    info['file_name'],
+                    info['file_size'],
+                    info['file_type'],
+                    info['file_extension'],
+                    info['kind_id'],
+                    info['flags'],
+                    info['dir_id'],
+                    self._row_mime_type(info),
+                    info['created_time'],
+                    info['modified_time'],
+                    info['file_hash'],
+                    info['hash_type'],
+                    scan_time,
+                ))
+            
+            with self._summary_write_lock([row[0] for row in rows]), self.pool.connection() as conn:
+                with conn.cursor() as cursor:
+                    # 汇总表按增量维护，需要知道被覆盖的旧记录
+                    existing = self._fetch_existing_files(cursor, [row[0] for row in rows])
+                    cursor.executemany(self._UPSERT_FILES_SQL, rows)
+                    self._apply_file_changes(
+                        cursor,
+                        removed=list(existing.values()),
+                        added=[{'file_path': row[0], 'file_size': row[2], 'file_type': row[3], 'file_extension': row[4]}
+                               for row in rows],
+                    )
+                conn.commit()
+            self._invalidate_paths([row[0] for row in rows])
+            return len(rows)
+        except self._ROW_ERRORS as e:
+            logger.debug(f"批量写入 {len(files)} 行失败，拆分重试: {e}")
+            middle = len(files) // 2
+            return self._upsert_files(files[:middle]) + self._upsert_files(files[middle:])
+    
     def execute_sql(self, sql_query: str) -> List[Dict]:
         """执行SQL查询"""
         try:
-            with self.connection.cursor() as cursor:
+            with self.pool.connection() as conn, conn.cursor() as cursor:
                 # 只允许 SELECT 查询
                 sql_query = sql_query.strip()
                 if not sql_query.upper().startswith('SELECT'):
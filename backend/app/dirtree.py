@@ -0,0 +1,136 @@
+"""
+目录树浏览服务
+"""
+import os
+import stat as stat_module
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import logging
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+from config import settings
+from app.scanner import FileScanner
+
+logger = logging.getLogger(__name__)
+
+class DirectoryTreeCache:
+    """按层展开的目录树：每次只读取一个目录的直接子目录，结果缓存
+
+    目录中增删或重命名子项会更新该目录的修改时间，命中缓存前先 stat 一次目录比对修改时间，
+    因此展开一个节点最多一次 stat 加一次 scandir。子目录数量来自子目录自身的硬链接数
+    （ext4/xfs 上为 2 + 子目录数，不需要再读取子目录），它不随当前目录的修改时间变化，由 ttl 限制过期时间。
+    """
+
+    def __init__(self, ttl: float = 30.0, max_entries: int = 10000):
+        self.ttl = max(0.0, ttl)
+        self.max_entries = max(1, max_entries)
+        self._entries: 'OrderedDict[tuple, Dict]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._euid, self._groups = FileScanner._process_credentials()
+
+    @staticmethod
+    def _node(name: str, path: str, st: os.stat_result) -> Dict:
+        # 硬链接数小于 2 的文件系统（btrfs、部分网络文件系统）无法据此判断，子目录数留空
+        subdir_count = st.st_nlink - 2 if st.st_nlink >= 2 else None
+        return {
+            'name': name,
+            'path': path,
+            'type': 'directory',
+            'subdir_count': subdir_count,
+            'has_children': subdir_count > 0 if subdir_count is not None else None,
+        }
+
+    def _read(self, dir_path: str, show_hidden: bool) -> List[Dict]:
+        """读取一个目录的直接子目录，按名称排序"""
+        children = []
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                try:
+                    if not entry.is_dir(follow_symlinks=False):
+                        continue
+                    if entry.name.startswith('.') and not show_hidden:
+                        continue
+                    if FileScanner._is_system_path(entry.path):
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                    if not FileScanner._is_readable(st, self._euid, self._groups):
+                        continue
+                    children.append(self._node(entry.name, entry.path, st))
+                except OSError as e:
+                    logger.debug(f"读取目录项失败 {entry.path}: {e}")
+        children.sort(key=lambda node: node['name'].lower())
+        return children
+
+    def list_children(self, dir_path: str, show_hidden: bool = False) -> Dict:
+        """返回目录的直接子目录；目录不存在或不可读时抛出 ValueError/PermissionError"""
+        dir_path = str(Path(dir_path).resolve())
+        try:
+            st = os.stat(dir_path)
+        except FileNotFoundError:
+            raise ValueError(f"路径不存在: {dir_path}")
+        if not stat_module.S_ISDIR(st.st_mode):
+            raise ValueError(f"路径不是目录: {dir_path}")
+
+        key = (dir_path, show_hidden)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['mtime_ns'] == st.st_mtime_ns and now < entry['expires']:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return {'path': dir_path, 'children': entry['children'], 'cached': True}
+            self.misses += 1
+
+        children = self._read(dir_path, show_hidden)
+        with self._lock:
+            self._entries[key] = {'mtime_ns': st.st_mtime_ns, 'expires': now + self.ttl, 'children': children}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return {'path': dir_path, 'children': children, 'cached': False}
+
+    def build_tree(self, root_path: str, max_depth: int = 1, show_hidden: bool = False) -> Dict:
+        """从根目录向下展开 max_depth 层，更深的节点不带 children，由前端按需展开"""
+        root_path = str(Path(root_path).resolve())
+        root = {
+            'name': Path(root_path).name or root_path,
+            'path': root_path,
+            'type': 'directory',
+        }
+
+        def expand(node: Dict, depth: int):
+            try:
+                children = self.list_children(node['path'], show_hidden)['children']
+            except (OSError, ValueError) as e:
+                logger.debug(f"读取目录失败 {node['path']}: {e}")
+                children = []
+            node['children'] = [dict(child) for child in children]
+            node['has_children'] = bool(children)
+            node['subdir_count'] = len(children)
+            if depth + 1 < max_depth:
+                for child in node['children']:
+                    if child['has_children'] is not False:
+                        expand(child, depth + 1)
+
+        if max_depth > 0:
+            expand(root, 0)
+        return root
+
+    def invalidate(self, dir_path: Optional[str] = None):
+        """清除某个目录或全部缓存"""
+        with self._lock:
+            if dir_path is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[0] == dir_path]:
+                del self._entries[key]
+
+directory_tree = DirectoryTreeCache(
+    ttl=settings.DIR_CACHE_TTL,
+    max_entries=settings.DIR_CACHE_MAX_ENTRIES,
+)
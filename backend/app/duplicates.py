@@ -0,0 +1,112 @@
+"""
+重复文件查找服务
+"""
+from collections import defaultdict
+from typing import Dict, List, Optional
+import logging
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+from config import settings
+from app.database import db
+from app.hasher import PARTIAL_SUFFIX, file_hasher
+
+logger = logging.getLogger(__name__)
+
+def is_full_hash(row: Dict) -> bool:
+    """记录中的哈希是否覆盖了整个文件"""
+    return bool(row.get('file_hash')) and not (row.get('hash_type') or '').endswith(PARTIAL_SUFFIX)
+
+class DuplicateFinder:
+    """按 文件大小 → 部分哈希 → 完整哈希 逐级缩小重复候选
+
+    扫描时写入的完整哈希已经足够判定重复，分组直接在数据库中按 (file_size, file_hash) 索引完成。
+    部分哈希的大文件和没有哈希的旧记录需要先在磁盘上确认：同一大小的文件先比较开头和结尾，
+    只有仍然相同的才读取全文，算出的完整哈希回写数据库，之后同样由数据库分组。
+    """
+
+    def __init__(self, database, hasher=None, partial_bytes: int = 64 * 1024, max_files_per_group: int = 100):
+        self.database = database
+        self.hasher = hasher or file_hasher
+        self.partial_bytes = max(4096, partial_bytes)
+        self.max_files_per_group = max_files_per_group
+
+    def find(self, min_size: int = 1, path_prefix: Optional[str] = None,
+             limit: int = 100, offset: int = 0) -> Dict:
+        """返回一页重复文件分组（按可回收字节数降序）和全部分组的汇总"""
+        groups = self.database.get_duplicate_groups(min_size, path_prefix, limit, offset)
+        files_by_group = defaultdict(list)
+        for file in self.database.get_duplicate_files(groups, path_prefix):
+            files_by_group[(file['file_size'], file['file_hash'])].append(file)
+
+        for group in groups:
+            files = files_by_group.get((group['file_size'], group['file_hash']), [])
+            group['files'] = files[:self.max_files_per_group]
+            group['files_truncated'] = len(files) > self.max_files_per_group
+
+        return {
+            'groups': groups,
+            'summary': self.database.get_duplicate_summary(min_size, path_prefix),
+        }
+
+    def verify_candidates(self, min_size: int = 1, path_prefix: Optional[str] = None,
+                          max_groups: int = 100, before_size: Optional[int] = None) -> Dict:
+        """在磁盘上确认缺少完整哈希的重复候选，把算出的完整哈希回写数据库
+
+        按文件大小降序每次处理最多 max_groups 个相同大小的分组；
+        返回的 next_before_size 作为下一次调用的 before_size 继续处理更小的分组，为 None 时表示已处理完。
+        """
+        sizes = self.database.get_unverified_size_groups(min_size, path_prefix, max_groups, before_size)
+        stats = {'size_groups': len(sizes), 'partial_hashed': 0, 'full_hashed': 0, 'updated': 0}
+
+        for file_size in sizes:
+            rows = self.database.get_files_by_size(file_size, path_prefix)
+            updates = self._verify_size_group(rows, stats)
+            if updates:
+                stats['updated'] += self.database.update_file_hashes(updates)
+
+        stats['next_before_size'] = sizes[-1] if len(sizes) >= max_groups else None
+        logger.info(f"重复候选确认完成: {stats}")
+        return stats
+
+    def _verify_size_group(self, rows: List[Dict], stats: Dict) -> List[tuple]:
+        """处理一组大小相同的文件，返回需要回写的 (file_hash, hash_type, id)"""
+        # 第二级：比较开头和结尾
+        partials = self.hasher.hash_many([row['file_path'] for row in rows],
+                                         partial_threshold=1, partial_bytes=self.partial_bytes)
+        stats['partial_hashed'] += len(partials)
+
+        buckets = defaultdict(list)
+        for row in rows:
+            result = partials.get(row['file_path'])
+            if result is not None:
+                buckets[result[0]].append((row, result))
+
+        updates, to_hash = [], []
+        for bucket in buckets.values():
+            if all(is_full_hash(row) for row, _ in bucket):
+                continue
+            for row, (digest, hash_type) in bucket:
+                # 同一组里哈希算法不同（例如旧的 MD5 记录）时也要重新计算，数据库才能按哈希分组
+                if is_full_hash(row) and row.get('hash_type') == self.hasher.algorithm:
+                    continue
+                if not hash_type.endswith(PARTIAL_SUFFIX):
+                    # 不超过两倍 partial_bytes 的文件，第二级算出的就是完整哈希
+                    updates.append((digest, hash_type, row['id']))
+                elif len(bucket) > 1:
+                    # 第三级：开头结尾都相同的候选才读取全文
+                    to_hash.append(row)
+
+        if to_hash:
+            fulls = self.hasher.hash_many([row['file_path'] for row in to_hash], partial_threshold=0)
+            stats['full_hashed'] += len(fulls)
+            for row in to_hash:
+                result = fulls.get(row['file_path'])
+                if result is not None:
+                    updates.append((result[0], result[1], row['id']))
+        return updates
+
+duplicate_finder = DuplicateFinder(
+    db,
+    partial_bytes=settings.DUPLICATE_PARTIAL_BYTES,
+)
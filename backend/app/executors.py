@@ -0,0 +1,67 @@
+"""
+阻塞调用的线程池调度
+
+FastAPI 处理函数都是 async def，直接调用同步的数据库、大模型或文件系统方法会阻塞事件循环。
+这里为每类阻塞调用提供独立的线程池，处理函数通过 run_db / run_ai / run_io 显式地把调用卸载出去，
+慢查询或慢模型请求只会占用各自线程池中的线程。
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+from config import settings
+
+# 数据库调用：线程数与连接池大小一致，多出的线程只会空等连接
+db_executor = ThreadPoolExecutor(max_workers=settings.DB_POOL_SIZE, thread_name_prefix="db")
+
+# 大模型调用：远程请求耗时长，与数据库线程隔离
+ai_executor = ThreadPoolExecutor(max_workers=settings.AI_WORKERS, thread_name_prefix="ai")
+
+# 文件系统调用（目录树、健康检查等轻量请求）
+io_executor = ThreadPoolExecutor(max_workers=settings.IO_WORKERS, thread_name_prefix="io")
+
+# 实时搜索：每个请求占用一个线程逐个取出结果，结果稀少时可能阻塞数分钟；线程数即同时进行的实时搜索数
+search_executor = ThreadPoolExecutor(max_workers=settings.LIVE_SEARCH_WORKERS, thread_name_prefix="live-search")
+
+# 开启、停止实时监听：为整棵目录树逐个目录添加 inotify 监听，大目录上耗时很长
+watch_executor = ThreadPoolExecutor(max_workers=settings.WATCH_WORKERS, thread_name_prefix="watch")
+
+# 确认重复候选：读取并哈希大量文件，一次请求可能持续数分钟，不能占用上面的轻量请求线程
+duplicate_executor = ThreadPoolExecutor(max_workers=settings.DUPLICATE_VERIFY_WORKERS, thread_name_prefix="dup")
+
+async def run_in_executor(executor: ThreadPoolExecutor, func: Callable, *args, **kwargs) -> Any:
+    """在指定线程池中执行阻塞函数并等待结果"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+async def run_db(func: Callable, *args, **kwargs) -> Any:
+    """在数据库线程池中执行"""
+    return await run_in_executor(db_executor, func, *args, **kwargs)
+
+async def run_ai(func: Callable, *args, **kwargs) -> Any:
+    """在大模型线程池中执行"""
+    return await run_in_executor(ai_executor, func, *args, **kwargs)
+
+async def run_io(func: Callable, *args, **kwargs) -> Any:
+    """在文件系统线程池中执行"""
+    return await run_in_executor(io_executor, func, *args, **kwargs)
+
+async def run_search(func: Callable, *args, **kwargs) -> Any:
+    """在实时搜索线程池中执行"""
+    return await run_in_executor(search_executor, func, *args, **kwargs)
+
+async def run_watch(func: Callable, *args, **kwargs) -> Any:
+    """在实时监听线程池中执行"""
+    return await run_in_executor(watch_executor, func, *args, **kwargs)
+
+async def run_duplicates(func: Callable, *args, **kwargs) -> Any:
+    """在重复候选确认线程池中执行"""
+    return await run_in_executor(duplicate_executor, func, *args, **kwargs)
+
+def shutdown_executors():
+    """关闭所有线程池，不等待进行中的任务"""
+    for executor in (db_executor, ai_executor, io_executor, search_executor, watch_executor, duplicate_executor):
+        executor.shutdown(wait=False)
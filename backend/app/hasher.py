@@ -0,0 +1,191 @@
+"""
+文件哈希服务
+"""
+import hashlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+import logging
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import xxhash
+except ImportError:  # 可选依赖
+    xxhash = None
+
+# 内置算法；blake2b 截断为 32 字节，十六进制结果正好放进 file_hash VARCHAR(64)
+_HASHLIB_ALGORITHMS = {
+    'blake2b': lambda: hashlib.blake2b(digest_size=32),
+    'blake2s': lambda: hashlib.blake2s(),
+    'sha256': hashlib.sha256,
+    'sha1': hashlib.sha1,
+    'md5': hashlib.md5,
+}
+_XXHASH_ALGORITHMS = ('xxh3_128', 'xxh3_64', 'xxh64')
+
+# 部分哈希的 hash_type 后缀，结果只能说明文件“可能相同”
+PARTIAL_SUFFIX = '-partial'
+
+def resolve_algorithm(algorithm: str) -> str:
+    """校验算法名称，xxhash 未安装时退回 blake2b"""
+    algorithm = (algorithm or 'blake2b').lower()
+    if algorithm in _XXHASH_ALGORITHMS:
+        if xxhash is not None:
+            return algorithm
+        logger.warning(f"未安装 xxhash，哈希算法 {algorithm} 退回 blake2b")
+        return 'blake2b'
+    if algorithm not in _HASHLIB_ALGORITHMS:
+        logger.warning(f"不支持的哈希算法 {algorithm}，使用 blake2b")
+        return 'blake2b'
+    return algorithm
+
+def _new_hasher(algorithm: str):
+    if algorithm in _XXHASH_ALGORITHMS:
+        return getattr(xxhash, algorithm)()
+    return _HASHLIB_ALGORITHMS[algorithm]()
+
+def hash_file(file_path: str, algorithm: str = 'blake2b', chunk_size: int = 1024 * 1024,
+              partial_threshold: int = 0, partial_bytes: int = 1024 * 1024) -> Tuple[str, str]:
+    """计算文件哈希，返回 (十六进制摘要, hash_type)
+
+    使用可复用的大缓冲区 readinto 顺序读取。文件大小超过 partial_threshold（大于 0 时）
+    只哈希文件大小、开头和结尾各 partial_bytes 字节，hash_type 带 -partial 后缀。
+    在进程池中执行，因此只依赖参数，不读取全局状态。
+    """
+    digest = _new_hasher(algorithm)
+    with open(file_path, 'rb', buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        if 0 < partial_threshold < size and size > 2 * partial_bytes:
+            digest.update(size.to_bytes(8, 'little'))
+            digest.update(f.read(partial_bytes))
+            f.seek(size - partial_bytes)
+            digest.update(f.read(partial_bytes))
+            return digest.hexdigest(), algorithm + PARTIAL_SUFFIX
+
+        buffer = bytearray(chunk_size)
+        view = memoryview(buffer)
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            digest.update(view[:n])
+    return digest.hexdigest(), algorithm
+
+class FileHasher:
+    """哈希阶段：小文件由遍历线程直接计算，其余文件交给进程池
+
+    进程池绕开 GIL，多个进程并行读取可以把磁盘吞吐跑满，遍历线程只负责 stat。
+    逐个文件提交进程池有进程间通信开销，不超过 inline_max_size 的小文件一次读取即可完成，直接就地计算。
+    """
+
+    def __init__(self, workers: int = 4, algorithm: str = 'blake2b', chunk_size: int = 1024 * 1024,
+                 partial_threshold: int = 0, partial_bytes: int = 1024 * 1024,
+                 inline_max_size: int = 64 * 1024):
+        self.workers = max(1, workers)
+        self.algorithm = resolve_algorithm(algorithm)
+        self.chunk_size = max(64 * 1024, chunk_size)
+        self.partial_threshold = max(0, partial_threshold)
+        self.partial_bytes = max(4096, partial_bytes)
+        self.inline_max_size = max(0, inline_max_size)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # 服务进程里有多个线程，使用 spawn 避免 fork 复制线程持有的锁
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+                logger.info(f"哈希进程池已启动: {self.workers} 个进程，算法 {self.algorithm}")
+            return self._pool
+
+    def _args(self, file_path: str, partial_threshold: Optional[int] = None, partial_bytes: Optional[int] = None):
+        """hash_file 的参数；partial_threshold 为 0 时强制完整哈希"""
+        return (file_path, self.algorithm, self.chunk_size,
+                self.partial_threshold if partial_threshold is None else partial_threshold,
+                partial_bytes or self.partial_bytes)
+
+    def hash_now(self, file_path: str, partial_threshold: Optional[int] = None,
+                 partial_bytes: Optional[int] = None) -> Tuple[str, str]:
+        """在当前线程中计算哈希"""
+        return hash_file(*self._args(file_path, partial_threshold, partial_bytes))
+
+    def is_inline(self, file_size: int) -> bool:
+        """小文件由遍历线程就地计算，不经过进程池"""
+        return file_size <= self.inline_max_size
+
+    def _reset_pool(self, pool: ProcessPoolExecutor):
+        """子进程异常退出后进程池不可再用，丢弃它，下次提交时重新创建"""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+        logger.warning("哈希进程池异常，已重建")
+
+    def submit(self, file_path: str, partial_threshold: Optional[int] = None,
+               partial_bytes: Optional[int] = None) -> Future:
+        """把一个文件的哈希计算提交给进程池，返回结果为 (file_hash, hash_type) 的 Future"""
+        args = self._args(file_path, partial_threshold, partial_bytes)
+        pool = self._get_pool()
+        try:
+            return pool.submit(hash_file, *args)
+        except BrokenProcessPool:
+            self._reset_pool(pool)
+            return self._get_pool().submit(hash_file, *args)
+
+    def hash_many(self, file_paths: List[str], partial_threshold: Optional[int] = None,
+                  partial_bytes: Optional[int] = None) -> Dict[str, Tuple[str, str]]:
+        """用进程池并行计算一组文件的哈希，无法读取的文件不出现在结果中"""
+        futures = {path: self.submit(path, partial_threshold, partial_bytes) for path in file_paths}
+        results = {}
+        for path, future in futures.items():
+            try:
+                results[path] = self._result(future, path, partial_threshold, partial_bytes)
+            except Exception as e:
+                logger.debug(f"计算文件哈希失败 {path}: {e}")
+        return results
+
+    def _result(self, future: Future, file_path: str, partial_threshold: Optional[int] = None,
+                partial_bytes: Optional[int] = None) -> Tuple[str, str]:
+        """取出 Future 的结果；进程池崩溃时在当前线程补算，不让整批文件缺少哈希"""
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            with self._lock:
+                pool = self._pool
+            if pool is not None:
+                self._reset_pool(pool)
+            return self.hash_now(file_path, partial_threshold, partial_bytes)
+
+    def apply(self, file_info: Dict, future: Future) -> Dict:
+        """把哈希结果写回文件信息；读取失败时哈希留空"""
+        try:
+            file_info['file_hash'], file_info['hash_type'] = self._result(future, file_info['file_path'])
+        except Exception as e:
+            logger.warning(f"计算文件哈希失败 {file_info.get('file_path')}: {e}")
+            file_info['file_hash'], file_info['hash_type'] = '', None
+        return file_info
+
+    def shutdown(self):
+        """关闭进程池"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+file_hasher = FileHasher(
+    workers=settings.HASH_WORKERS,
+    algorithm=settings.HASH_ALGORITHM,
+    chunk_size=settings.HASH_CHUNK_SIZE,
+    partial_threshold=settings.HASH_PARTIAL_THRESHOLD,
+    partial_bytes=settings.HASH_PARTIAL_BYTES,
+    inline_max_size=settings.HASH_INLINE_MAX_SIZE,
+)
@@ -0,0 +1,124 @@
+"""
+文件内容索引服务
+"""
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional
+import logging
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+from config import settings
+from app.search import search_service
+
+logger = logging.getLogger(__name__)
+
+# 拉丁字母/数字词：至少 2 个字符
+_WORD_PATTERN = re.compile(r'[0-9a-z_]{2,64}')
+# 中日韩文字连续片段，按二元组切分
+_CJK_PATTERN = re.compile(r'[㐀-䶿一-鿿豈-﫿぀-ヿ가-힯]+')
+
+def tokenize(text: str) -> List[str]:
+    """把文本切分为索引词项
+
+    英文和数字按单词切分并转为小写；中日韩文字没有空格分词，按相邻两个字符的二元组切分，
+    单个字的片段保留为一元词项。查询关键词使用同一个函数切分，保证索引和查询一致。
+    """
+    text = text.lower()
+    terms = _WORD_PATTERN.findall(text)
+    for run in _CJK_PATTERN.findall(text):
+        if len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+class ContentIndexer:
+    """把文本文件切分为词项并生成 file_index 倒排记录"""
+
+    def __init__(self, text_file_extensions=None, max_file_size: int = 5 * 1024 * 1024,
+                 max_terms_per_file: int = 500, preview_context: int = 50):
+        self.text_file_extensions = text_file_extensions or search_service.text_file_extensions
+        self.max_file_size = max_file_size
+        self.max_terms_per_file = max_terms_per_file
+        self.preview_context = preview_context
+
+    def is_indexable(self, file_info: Dict) -> bool:
+        """只索引扩展名属于文本类型且大小不超过上限的文件"""
+        extension = file_info.get('file_extension') or ''
+        if extension and not extension.startswith('.'):
+            extension = '.' + extension
+        return (extension.lower() in self.text_file_extensions
+                and 0 < int(file_info.get('file_size') or 0) <= self.max_file_size)
+
+    def _preview(self, content: str, lowered: str, term: str) -> str:
+        """截取词项第一次出现位置附近的内容作为预览"""
+        position = lowered.find(term)
+        if position < 0:
+            return ''
+        start = max(0, position - self.preview_context)
+        end = min(len(content), position + len(term) + self.preview_context)
+        return content[start:end]
+
+    def build_postings(self, file_path: str) -> Optional[List[Dict]]:
+        """读取文件并生成倒排记录
+
+        Returns:
+            [{'keyword', 'term_freq', 'match_score', 'content_preview', 'doc_length'}]，按词频降序，
+            最多 max_terms_per_file 条；doc_length 是文件的词项总数（截断前），每条相同；
+            文件无法读取时返回 None
+        """
+        try:
+            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                content = f.read(self.max_file_size)
+        except Exception as e:
+            logger.debug(f"读取待索引文件失败 {file_path}: {e}")
+            return None
+
+        counts = Counter(tokenize(content))
+        if not counts:
+            return []
+
+        # lower() 可能改变个别字符的长度，预览位置基于同长度时才可靠，否则退回到小写内容
+        lowered = content.lower()
+        source = content if len(lowered) == len(content) else lowered
+
+        doc_length = sum(counts.values())
+        top_terms = counts.most_common(self.max_terms_per_file)
+        max_freq = top_terms[0][1]
+        return [
+            {
+                'keyword': term,
+                'term_freq': freq,
+                'match_score': freq / max_freq,
+                'content_preview': self._preview(source, lowered, term),
+                'doc_length': doc_length,
+            }
+            for term, freq in top_terms
+        ]
+
+    def index_files(self, database, file_infos: List[Dict]) -> int:
+        """为一批已入库的文件重建倒排记录，返回建立索引的文件数"""
+        candidates = [info for info in file_infos if self.is_indexable(info)]
+        if not candidates:
+            return 0
+
+        file_ids = database.get_file_ids([info['file_path'] for info in candidates])
+        postings_by_file = {}
+        for info in candidates:
+            file_id = file_ids.get(info['file_path'])
+            if file_id is None:
+                continue
+            postings = self.build_postings(info['file_path'])
+            if postings is not None:
+                postings_by_file[file_id] = postings
+
+        if postings_by_file:
+            database.replace_file_index(postings_by_file)
+        return len(postings_by_file)
+
+content_indexer = ContentIndexer(
+    max_file_size=settings.INDEX_MAX_FILE_SIZE,
+    max_terms_per_file=settings.INDEX_MAX_TERMS_PER_FILE,
+)
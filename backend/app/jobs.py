@@ -0,0 +1,344 @@
+"""
+扫描任务管理
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import logging
+import sys
+sys.path.append(str(Path(__file__).parent.parent))
+from config import settings
+from app.database import db
+from app.scanner import FileScanner
+from app.pipeline import BatchWriter
+from app.indexer import content_indexer
+
+logger = logging.getLogger(__name__)
+
+# 可以从断点继续的任务状态
+RESUMABLE_STATUSES = ('interrupted', 'cancelled', 'failed')
+
+class ScanJob:
+    """一个正在运行的扫描任务，持有扫描器和写入器以提供实时进度"""
+
+    def __init__(self, job_id: int, root_path: str, recursive: bool, incremental: bool,
+                 frontier: Optional[Dict[str, List[str]]] = None, base: Optional[Dict] = None):
+        self.id = job_id
+        self.root_path = root_path
+        self.recursive = recursive
+        self.incremental = incremental
+        # 续扫时的遍历前沿（FileScanner.checkpoint() 的结果）；None 表示从根目录开始的新扫描
+        self.frontier = frontier
+        # 续扫前已累计的计数
+        self.base = base or {}
+        self.status = 'running'
+        self.cancel_event = threading.Event()
+        # 进程退出导致的停止记为 interrupted，下次启动时自动续扫
+        self.interrupting = False
+        self.scanner = FileScanner(
+            max_file_size=settings.MAX_FILE_SIZE,
+            workers=settings.SCAN_WORKERS,
+            queue_size=settings.SCAN_QUEUE_SIZE,
+            max_pending_hashes=settings.HASH_MAX_PENDING,
+        )
+        self.writer: Optional[BatchWriter] = None
+        self.deleted_count = 0
+        self.started_at = time.monotonic()
+        self.last_checkpoint = self.started_at
+        self.thread: Optional[threading.Thread] = None
+
+    def counters(self) -> Dict:
+        """当前累计计数（包含续扫前的部分）"""
+        scanner = self.scanner
+        saved = self.writer.saved_count if self.writer else 0
+        elapsed = time.monotonic() - self.started_at
+        # 按写入阶段已接收的数量计，断点保存的计数与已落库的进度一致
+        received = self.writer.received_count if self.writer else 0
+        files = received + scanner.unchanged_count
+        return {
+            'dirs_scanned': self.base.get('dirs_scanned', 0) + scanner.dir_count,
+            'files_scanned': self.base.get('files_scanned', 0) + files,
+            'files_saved': self.base.get('files_saved', 0) + saved,
+            'files_deleted': self.base.get('files_deleted', 0) + self.deleted_count,
+            'bytes_scanned': self.base.get('bytes_scanned', 0) + scanner.bytes_count,
+            'error_count': self.base.get('error_count', 0) + scanner.error_count,
+            'files_per_second': round(files / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+class ScanJobManager:
+    """在后台线程中运行扫描任务，持久化进度和遍历断点
+
+    写入器每写完一个批次，已产出的文件全部落库，此时按 checkpoint_interval 保存扫描器的遍历前沿。
+    进程中断后从前沿目录重新遍历即可补齐剩余部分，已完成的目录不再重复扫描。
+    """
+
+    def __init__(self, database, indexer=None, batch_size: int = 1000, checkpoint_interval: float = 30.0,
+                 on_finished: Optional[Callable[[], None]] = None):
+        self.database = database
+        self.indexer = indexer
+        self.batch_size = batch_size
+        self.checkpoint_interval = checkpoint_interval
+        # 扫描改变了数据时的回调（例如重新生成统计信息）
+        self.on_finished = on_finished
+        self._jobs: Dict[int, ScanJob] = {}
+        self._lock = threading.Lock()
+
+    def _active_job_for(self, root_path: str) -> Optional[ScanJob]:
+        """同一根目录上运行中的任务；调用方需持有 self._lock"""
+        for job in self._jobs.values():
+            if job.root_path == root_path:
+                return job
+        return None
+
+    def start(self, root_path: str, recursive: bool = True, incremental: bool = False) -> Dict:
+        """创建并启动扫描任务；同一根目录已有运行中的任务时直接返回该任务"""
+        root = Path(root_path)
+        if not root.exists():
+            raise ValueError(f"路径不存在: {root_path}")
+        if not root.is_dir():
+            raise ValueError(f"路径不是目录: {root_path}")
+        root_path = str(root.resolve())
+
+        # 检查和登记在同一把锁内完成，并发请求不会为同一根目录启动两个任务
+        with self._lock:
+            active = self._active_job_for(root_path)
+            if active is None:
+                job_id = self.database.create_scan_job(root_path, recursive, incremental, status='running')
+                job = ScanJob(job_id, root_path, recursive, incremental)
+                self._jobs[job_id] = job
+        if active is not None:
+            logger.info(f"目录 {root_path} 已有运行中的扫描任务 {active.id}")
+            return self.get(active.id)
+
+        self._launch(job)
+        return self.get(job_id)
+
+    def resume(self, job_id: int) -> Dict:
+        """从保存的断点继续一个已中断、已取消或失败的任务"""
+        # 读取状态、检查和切换为 running 在同一把锁内完成，并发的续扫请求只有一个会启动线程，
+        # 也不会读到另一个请求已经续扫并结束的任务的旧状态
+        with self._lock:
+            if job_id in self._jobs:
+                running = True
+            else:
+                running = False
+                record = self.database.get_scan_job(job_id, include_frontier=True)
+                if record is None:
+                    raise KeyError(job_id)
+                if record['status'] not in RESUMABLE_STATUSES or record['frontier'] is None:
+                    raise ValueError(f"任务 {job_id} 状态为 {record['status']}，没有可恢复的断点")
+                if self._active_job_for(record['root_path']) is not None:
+                    raise ValueError(f"目录 {record['root_path']} 已有运行中的扫描任务")
+
+                job = ScanJob(job_id, record['root_path'], record['recursive'], record['incremental'],
+                              frontier=record['frontier'], base=record)
+                self.database.update_scan_job(job_id, status='running', finished_time=None, error_message=None)
+                self._jobs[job_id] = job
+        if running:
+            return self.get(job_id)
+
+        logger.info(f"从断点继续扫描任务 {job_id}: {job.root_path}，剩余目录 "
+                    f"{len(job.frontier.get('dirs', [])) + len(job.frontier.get('listed', []))} 个")
+        self._launch(job)
+        return self.get(job_id)
+
+    def resume_interrupted(self) -> int:
+        """启动时处理上次进程退出时仍在运行的任务，返回续扫的任务数"""
+        # 数据库里仍为 running 的任务不属于当前进程，说明进程曾异常退出
+        for record in self.database.list_scan_jobs(status='running', limit=1000):
+            self.database.update_scan_job(record['id'], status='interrupted')
+
+        if not settings.SCAN_RESUME_ON_STARTUP:
+            return 0
+        resumed = 0
+        for record in self.database.list_scan_jobs(status='interrupted', limit=1000):
+            if not record['resumable']:
+                continue
+            try:
+                self.resume(record['id'])
+                resumed += 1
+            except Exception as e:
+                logger.warning(f"续扫任务 {record['id']} 失败: {e}")
+        return resumed
+
+    def cancel(self, job_id: int) -> bool:
+        """请求取消运行中的任务，任务不在运行时返回 False"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return False
+        job.cancel_event.set()
+        return True
+
+    def get(self, job_id: int) -> Optional[Dict]:
+        """读取任务信息，运行中的任务附带实时计数"""
+        record = self.database.get_scan_job(job_id)
+        if record is None:
+            return None
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            record.update(job.counters())
+            record['status'] = job.status
+        return record
+
+    def list_jobs(self, status: Optional[str] = None, limit: int = 20) -> List[Dict]:
+        """列出最近的任务，运行中的任务附带实时计数"""
+        records = self.database.list_scan_jobs(status=status, limit=limit)
+        with self._lock:
+            active = dict(self._jobs)
+        for record in records:
+            job = active.get(record['id'])
+            if job is not None:
+                record.update(job.counters())
+                record['status'] = job.status
+        return records
+
+    def shutdown(self, timeout: float = 10.0):
+        """进程退出前停止所有任务并保存断点，下次启动时续扫"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.interrupting = True
+            job.cancel_event.set()
+        deadline = time.monotonic() + timeout
+        for job in jobs:
+            if job.thread is not None:
+                job.thread.join(max(0.0, deadline - time.monotonic()))
+
+    def _launch(self, job: ScanJob):
+        """为已登记到 self._jobs 的任务启动后台线程"""
+        job.thread = threading.Thread(target=self._run, args=(job,), name=f"scan-job-{job.id}", daemon=True)
+        job.thread.start()
+
+    def _checkpoint(self, job: ScanJob, **fields):
+        """保存计数和遍历前沿；只能在已产出的文件全部写入数据库之后调用"""
+        job.last_checkpoint = time.monotonic()
+        self.database.update_scan_job(job.id, frontier=job.scanner.checkpoint(),
+                                      checkpoint_time=datetime.now(), **job.counters(), **fields)
+
+    def _on_flush(self, job: ScanJob):
+        if time.monotonic() - job.last_checkpoint >= self.checkpoint_interval:
+            try:
+                self._checkpoint(job)
+            except Exception as e:
+                # 断点保存失败不影响扫描本身
+                logger.warning(f"保存扫描任务 {job.id} 断点失败: {e}")
+
+    def _load_known_files(self, job: ScanJob) -> Dict[str, Dict]:
+        """增量模式下加载需要比对的已有记录，续扫时只保留将要重新遍历的目录下的记录"""
+        known_files = self.database.get_file_signatures(job.root_path)
+        if job.frontier is not None:
+            # 已登记子目录的断点目录只重新处理直接包含的文件，其余断点目录整棵子树重新遍历
+            listed = set(job.frontier.get('listed', []))
+            subtrees = set(job.frontier.get('dirs', []))
+
+            def will_rescan(path: str) -> bool:
+                directory = os.path.dirname(path)
+                if directory in listed or directory in subtrees:
+                    return True
+                if not job.recursive:
+                    return False
+                while True:
+                    if directory in subtrees:
+                        return True
+                    parent = os.path.dirname(directory)
+                    if parent == directory:
+                        return False
+                    directory = parent
+
+            known_files = {p: sig for p, sig in known_files.items() if will_rescan(p)}
+        elif not job.recursive:
+            known_files = {p: sig for p, sig in known_files.items() if os.path.dirname(p) == job.root_path}
+        return known_files
+
+    def _run(self, job: ScanJob):
+        """后台扫描并保存文件
+
+        incremental 为 True 时不清空旧记录：只对新增或大小/修改时间变化的文件重新计算哈希并写入，
+        并只删除已经不存在的文件记录。
+        """
+        database = self.database
+        try:
+            logger.info(f"扫描任务 {job.id} 开始: {job.root_path}，增量模式: {job.incremental}")
+            if job.frontier is None:
+                database.update_scan_job(job.id, started_time=datetime.now())
+
+            # 登记扫描根目录，之后的写入会增量更新它的文件数和总字节数
+            database.register_scan_root(job.root_path)
+
+            known_files = None
+            if job.incremental:
+                # 加载已有记录的签名，扫描时只对比 stat 信息
+                known_files = self._load_known_files(job)
+                logger.info(f"已加载 {len(known_files)} 条已有记录用于增量比对")
+            elif job.frontier is None:
+                # 在扫描前，先删除该路径下的旧记录，避免显示历史扫描结果；续扫时已清理过
+                logger.info(f"清理路径 '{job.root_path}' 下的旧记录...")
+                job.deleted_count = database.delete_files_by_path_prefix(job.root_path)
+                logger.info(f"已删除 {job.deleted_count} 条旧记录")
+
+            # 流式扫描：遍历线程通过有界队列产出文件信息，写入阶段按批次入库
+            job.writer = BatchWriter(database, batch_size=self.batch_size, indexer=self.indexer,
+                                     on_flush=lambda writer: self._on_flush(job))
+            files = job.scanner.iter_directory(job.root_path, recursive=job.recursive,
+                                               known_files=known_files, frontier=job.frontier,
+                                               cancel_event=job.cancel_event)
+            try:
+                for file_info in files:
+                    if job.cancel_event.is_set():
+                        break
+                    job.writer.add(file_info)
+                job.writer.flush()
+            finally:
+                files.close()
+
+            if job.cancel_event.is_set():
+                # 生成器已关闭，遍历前沿不再变化，保存后可从断点继续
+                job.status = 'interrupted' if job.interrupting else 'cancelled'
+                self._checkpoint(job, status=job.status, finished_time=datetime.now())
+                logger.info(f"扫描任务 {job.id} 已停止（{job.status}），已保存断点")
+                return
+
+            if job.incremental:
+                # 扫描中没有再出现的记录即为已删除的文件；扫描未完整结束时不做删除
+                if job.scanner.completed:
+                    job.deleted_count += database.delete_files_by_paths(list(known_files))
+                    logger.info(f"已删除 {job.deleted_count} 条已不存在的文件记录")
+                else:
+                    logger.warning("扫描未完整结束，跳过已消失文件的清理")
+
+            database.finish_scan_root(job.root_path)
+            job.status = 'completed'
+            database.update_scan_job(job.id, status='completed', frontier=None, finished_time=datetime.now(),
+                                **job.counters())
+            counters = job.counters()
+            logger.info(f"扫描任务 {job.id} 完成: 写入 {counters['files_saved']} 个，"
+                        f"未变化 {job.scanner.unchanged_count} 个，删除 {counters['files_deleted']} 个，"
+                        f"索引 {job.writer.indexed_count} 个，错误 {counters['error_count']} 个")
+
+            if self.on_finished is not None and (counters['files_saved'] > 0 or counters['files_deleted'] > 0):
+                self.on_finished()
+
+        except Exception as e:
+            logger.error(f"扫描任务 {job.id} 失败: {e}")
+            job.status = 'failed'
+            try:
+                # 保留最近一次保存的断点，未写入的批次会在续扫时重新遍历
+                database.update_scan_job(job.id, status='failed', error_message=str(e)[:2000],
+                                    finished_time=datetime.now())
+            except Exception as update_error:
+                logger.error(f"更新扫描任务 {job.id} 状态失败: {update_error}")
+        finally:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+
+scan_job_manager = ScanJobManager(
+    db,
+    indexer=content_indexer,
+    batch_size=settings.SCAN_BATCH_SIZE,
+    checkpoint_interval=settings.SCAN_CHECKPOINT_INTERVAL,
+)
@@ -1,20 +1,29 @@
 """
 FastAPI主应用
 """
-from fastapi import FastAPI, HTTPException, Query, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from typing import List, Dict, Optional
+import csv
+import io
+import json
 import logging
 from datetime import datetime
 
 import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
-from app.database import db
-from app.scanner import FileScanner
+from app.database import EXPORT_COLUMNS, db
+from app.dirtree import directory_tree
+from app.jobs import scan_job_manager
+from app.hasher import file_hasher
+from app.duplicates import duplicate_finder
+from app.watcher import file_watcher
 from app.ai_service import ai_service
+from app.ai_tasks import ai_tasks
 from app.search import search_service
+from app.executors import run_db, run_ai, run_io, run_search, run_watch, run_duplicates, shutdown_executors
 from config import settings
 
 # 配置日志
@@ -43,13 +52,29 @@ app.add_middleware(
 @app.on_event("startup")
 async def startup_event():
     try:
-        db.init_tables()
+        await run_db(db.init_tables)
+        # 上次进程退出时未完成的扫描任务从断点继续
+        resumed = await run_db(scan_job_manager.resume_interrupted)
+        if resumed:
+            logger.info(f"已从断点恢复 {resumed} 个扫描任务")
+        if settings.WATCH_RESTORE_ON_STARTUP:
+            # 恢复实时监听，停机期间的变化由随后的增量扫描补齐
+            watched = await run_watch(file_watcher.restore)
+            if watched:
+                logger.info(f"已恢复 {watched} 个目录的实时监听")
         logger.info("应用启动成功")
     except Exception as e:
         logger.error(f"应用启动失败: {e}")
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    await run_watch(file_watcher.shutdown)
+    # 停止扫描任务并保存断点，下次启动时继续
+    await run_db(scan_job_manager.shutdown)
+    file_hasher.shutdown()
+    search_service.shutdown()
+    shutdown_executors()
+    ai_service.cache.close()
     db.close()
 
 @app.get("/")
@@ -61,83 +86,140 @@ async def scan_directory(
     path: str = Query(..., description="Directory path to scan"),
     recursive: bool = Query(True, description="Whether to scan subdirectories recursively"),
     force_rescan: bool = Query(False, description="Force rescan even if data exists in database"),
-    background_tasks: BackgroundTasks = None
+    incremental: bool = Query(False, description="Only rehash and upsert new or changed files, and delete vanished ones, instead of clearing the path first")
 ):
     """Scan directory files and store in database (smart scan: check database first, then decide whether to scan)"""
     try:
         from pathlib import Path
         scan_path = str(Path(path).resolve())
-        logger.info(f"Scan request: {scan_path}, force rescan: {force_rescan}")
+        logger.info(f"Scan request: {scan_path}, force rescan: {force_rescan}, incremental: {incremental}")
         
         # Check if data already exists in database for this path
         if not force_rescan:
-            has_data = db.check_files_exist_by_path(scan_path)
-            if has_data:
+            # Scanned roots keep a summary row maintained by the scan pipeline, read by key
+            summary = await run_db(db.get_scan_root_summary, scan_path)
+            if summary is not None:
+                file_count = summary["file_count"]
+            elif await run_db(db.check_files_exist_by_path, scan_path):
+                # Not a scanned root (e.g. a subdirectory of one): decide with an uncached existence check,
+                # then report the total (invalidated by writes under the path)
+                file_count = await run_db(db.count_files, None, scan_path)
+            else:
+                file_count = 0
+            
+            if file_count > 0:
                 logger.info(f"Data already exists in database for path '{scan_path}', skipping scan and returning cached data")
-                # Return existing data
-                files = db.get_all_files(path_prefix=scan_path, limit=None)
                 return {
                     "success": True,
-                    "message": f"Using cached data from database ({len(files)} files found)",
+                    "message": f"Using cached data from database ({file_count} files found)",
                     "status": "cached",
-                    "file_count": len(files),
+                    "file_count": file_count,
+                    "total_bytes": summary["total_bytes"] if summary else None,
+                    "last_scan_time": summary["last_scan_time"] if summary else None,
                     "path": scan_path
                 }
         
-        # Data doesn't exist in database or force rescan, execute scan task
+        # Data doesn't exist in database or force rescan, start a scan job
         logger.info(f"Starting scan for directory: {scan_path}")
-        background_tasks.add_task(scan_and_save_files, scan_path, recursive)
+        job = await run_db(scan_job_manager.start, scan_path, recursive, incremental)
         
         return {
             "success": True,
             "message": f"Scan task started, processing path in background: {scan_path}",
             "status": "processing",
+            "job_id": job["id"],
+            "job": job,
             "path": scan_path
         }
     
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Failed to start scan task: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-def scan_and_save_files(path: str, recursive: bool):
-    """后台扫描并保存文件"""
+@app.get("/api/scan/jobs")
+async def list_scan_jobs(
+    status: Optional[str] = Query(None, description="Filter by status: running, completed, failed, cancelled or interrupted"),
+    limit: int = Query(20, ge=1, le=200, description="Maximum number of jobs to return")
+):
+    """List recent scan jobs, newest first, with live counters for running jobs"""
     try:
-        scanner = FileScanner(max_file_size=settings.MAX_FILE_SIZE)
-        logger.info(f"开始扫描目录: {path}")
-        
-        # 规范化路径（转换为绝对路径）
-        from pathlib import Path
-        scan_path = str(Path(path).resolve())
-        
-        # 在扫描前，先删除该路径下的旧记录，避免显示历史扫描结果
-        logger.info(f"清理路径 '{scan_path}' 下的旧记录...")
-        deleted_count = db.delete_files_by_path_prefix(scan_path)
-        logger.info(f"已删除 {deleted_count} 条旧记录")
-        
-        files = scanner.scan_directory(scan_path, recursive=recursive)
-        logger.info(f"扫描完成，共找到 {len(files)} 个文件")
-        
-        # 分批存储到数据库，避免一次性插入太多
-        saved_count = 0
-        batch_size = 100
-        for i in range(0, len(files), batch_size):
-            batch = files[i:i + batch_size]
-            # 使用批量插入方法
-            batch_saved = db.insert_files_batch(batch)
-            saved_count += batch_saved
-            
-            # 每处理一批记录一次日志
-            if (i + batch_size) % 1000 == 0 or i + batch_size >= len(files):
-                logger.info(f"已保存 {saved_count}/{len(files)} 个文件...")
-        
-        logger.info(f"扫描任务完成: 成功 {saved_count} 个，错误 {scanner.error_count} 个")
-        
-        # 异步生成统计信息
-        if saved_count > 0:
-            generate_statistics_async()
-    
+        jobs = await run_db(scan_job_manager.list_jobs, status, limit)
+        return {"success": True, "jobs": jobs, "count": len(jobs)}
+    except Exception as e:
+        logger.error(f"Failed to list scan jobs: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/scan/jobs/{job_id}")
+async def get_scan_job(job_id: int):
+    """Get a scan job's status and progress counters (dirs/files/bytes/errors/rate)"""
+    try:
+        job = await run_db(scan_job_manager.get, job_id)
+    except Exception as e:
+        logger.error(f"Failed to get scan job: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Scan job {job_id} not found")
+    return {"success": True, "job": job}
+
+@app.post("/api/scan/jobs/{job_id}/cancel")
+async def cancel_scan_job(job_id: int):
+    """Cancel a running scan job; its walk frontier is checkpointed so it can be resumed later"""
+    if not scan_job_manager.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"Scan job {job_id} is not running")
+    return {"success": True, "message": f"Cancellation requested for scan job {job_id}", "job_id": job_id}
+
+@app.post("/api/scan/jobs/{job_id}/resume")
+async def resume_scan_job(job_id: int):
+    """Resume a cancelled, interrupted or failed scan job from its last checkpoint"""
+    try:
+        job = await run_db(scan_job_manager.resume, job_id)
+        return {"success": True, "message": f"Scan job {job_id} resumed", "job": job}
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Scan job {job_id} not found")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to resume scan job: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/watch")
+async def start_watch(
+    path: str = Query(..., description="Directory to keep indexed in real time"),
+    sync: bool = Query(True, description="Run an incremental scan after the watches are in place to catch changes made before watching started")
+):
+    """Watch a directory with inotify and apply file changes to the index as they happen, without rescanning"""
+    try:
+        root = await run_watch(file_watcher.start, path, sync)
+        return {"success": True, "message": f"Watching {root['root_path']}", "watch": root}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OSError as e:
+        logger.error(f"Failed to start watcher: {e}")
+        raise HTTPException(status_code=501, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to start watcher: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/api/watch")
+async def stop_watch(
+    path: str = Query(..., description="Watched directory")
+):
+    """Stop watching a directory"""
+    try:
+        stopped = await run_watch(file_watcher.stop, path)
     except Exception as e:
-        logger.error(f"扫描任务失败: {e}")
+        logger.error(f"Failed to stop watcher: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if not stopped:
+        raise HTTPException(status_code=404, detail=f"{path} is not being watched")
+    return {"success": True, "message": f"Stopped watching {path}"}
+
+@app.get("/api/watch")
+async def list_watches():
+    """List watched directories with watch counts, pending changes and applied-change counters"""
+    return {"success": True, **file_watcher.list_roots()}
 
 def generate_statistics_async():
     """异步生成统计信息"""
@@ -156,11 +238,16 @@ def generate_statistics_async():
     except Exception as e:
         logger.error(f"生成统计信息失败: {e}")
 
+# 扫描任务写入或删除了记录后重新生成统计信息
+scan_job_manager.on_finished = generate_statistics_async
+
 @app.get("/api/search")
 async def search_files(
     keyword: str = Query(..., description="Search keyword"),
     limit: int = Query(100, ge=1, le=1000, description="Limit for number of results"),
-    offset: int = Query(0, ge=0, description="Result offset")
+    offset: int = Query(0, ge=0, description="Result offset (ignored when cursor is provided)"),
+    cursor: Optional[str] = Query(None, description="Continuation token returned as next_cursor by the previous page"),
+    ai: bool = Query(True, description="Start an AI enhancement task for this page; poll /api/ai/tasks/{ai_task_id} for its result")
 ):
     """Search files by keyword"""
     try:
@@ -168,50 +255,117 @@ async def search_files(
             raise HTTPException(status_code=400, detail="Keyword cannot be empty")
         
         # Search from database
-        results = db.search_files(keyword, limit=limit, offset=offset)
+        try:
+            page = await run_db(db.search_files_page, keyword, limit=limit, offset=offset, page_cursor=cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        results = page["results"]
+        count = await run_db(db.count_search_results, keyword)
         
-        # AI-enhanced search results
-        ai_enhancement = ai_service.enhance_search_results(keyword, results)
+        # AI 增强在后台执行，搜索结果立即返回
+        ai_task = None
+        if ai and results:
+            key = (keyword, tuple(row.get("id") for row in results))
+            ai_task = ai_tasks.submit("search_enhancement", ai_service.enhance_search_results, keyword, results, key=key)
         
         return {
             "success": True,
             "keyword": keyword,
-            "total": len(results),
+            "total": count["total"],
+            "total_is_estimate": count["estimated"],
             "results": results,
-            "ai_enhancement": ai_enhancement
+            "next_cursor": page["next_cursor"],
+            "ai_enhancement": ai_task["result"] if ai_task else None,
+            "ai_task_id": ai_task["id"] if ai_task else None
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Search failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/search/live")
+async def search_live(
+    keyword: str = Query(..., description="Search keyword (matched against file name, path and text file content)"),
+    path: str = Query(..., description="Directory to search on disk; the index is not used"),
+    limit: Optional[int] = Query(None, ge=1, le=100000, description="Stop after this many results (defaults to LIVE_SEARCH_MAX_RESULTS)")
+):
+    """Search a directory on disk, streaming matches as NDJSON while they are found (unsorted)"""
+    if not keyword:
+        raise HTTPException(status_code=400, detail="Keyword cannot be empty")
+    
+    from pathlib import Path
+    search_path = Path(path).resolve()
+    if not search_path.is_dir():
+        raise HTTPException(status_code=400, detail=f"Path is not a directory: {search_path}")
+    
+    results = search_service.iter_search(keyword, str(search_path), limit)
+    
+    async def body():
+        try:
+            while True:
+                result = await run_search(next, results, None)
+                if result is None:
+                    break
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        finally:
+            # Client disconnects close this generator; stop walking and cancel queued content reads
+            await run_search(results.close)
+    
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
 @app.get("/api/statistics")
 async def get_statistics():
     """获取文件统计信息"""
     try:
-        stats = db.get_file_statistics()
+        stats = await run_db(db.get_file_statistics)
         
-        # 使用AI生成SQL和图表
-        ai_result = ai_service.generate_statistics_sql(stats)
+        # 先返回默认的查询和图表，AI 生成的结果在后台完成后通过 ai_task_id 获取
+        ai_task = ai_tasks.submit("statistics_sql", ai_service.generate_statistics_sql, stats,
+                                  key=json.dumps(stats, sort_keys=True, default=str))
+        ai_result = ai_task["result"] or ai_service.default_statistics_result(stats)
         
         return {
             "success": True,
             "statistics": stats,
             "sql_queries": ai_result.get("sql_queries", []),
             "charts": ai_result.get("charts", []),
-            "insights": ai_result.get("insights", [])
+            "insights": ai_result.get("insights", []),
+            "ai_task_id": ai_task["id"],
+            "ai_status": ai_task["status"]
         }
     
     except Exception as e:
         logger.error(f"获取统计信息失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/ai/tasks/{task_id}")
+async def get_ai_task(task_id: str):
+    """Get the status (pending, running, completed, failed or timeout) and result of a background AI task"""
+    task = ai_tasks.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail=f"AI task {task_id} not found or expired")
+    return {"success": True, "task": task}
+
+@app.post("/api/statistics/rebuild")
+async def rebuild_statistics():
+    """Recompute the pre-aggregated statistics from the files table (repair only; normally maintained on write)"""
+    try:
+        await run_db(db.rebuild_file_stats)
+        stats = await run_db(db.get_file_statistics)
+        return {"success": True, "statistics": stats}
+    except Exception as e:
+        logger.error(f"Failed to rebuild statistics: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/files")
 async def get_files(
     path_prefix: str = Query(..., description="Path prefix filter, required parameter, only returns files under this path"),
     file_type: Optional[str] = Query(None, description="File type filter"),
     limit: Optional[int] = Query(None, description="Limit for number of results (no limit if not provided)"),
-    offset: int = Query(0, ge=0)
+    offset: int = Query(0, ge=0, description="Result offset (ignored when cursor is provided)"),
+    cursor: Optional[str] = Query(None, description="Continuation token returned as next_cursor by the previous page")
 ):
     """Get file list (path_prefix is required to ensure data accuracy)"""
     try:
@@ -222,12 +376,17 @@ async def get_files(
         from pathlib import Path
         normalized_path = str(Path(path_prefix).resolve())
         
-        files = db.get_all_files(file_type, normalized_path, limit, offset)
+        try:
+            page = await run_db(db.get_files_page, file_type, normalized_path, limit, offset, cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        total = await run_db(db.count_files, file_type, normalized_path)
         
         return {
             "success": True,
-            "total": len(files),
-            "files": files,
+            "total": total,
+            "files": page["files"],
+            "next_cursor": page["next_cursor"],
             "path_prefix": normalized_path
         }
     
@@ -238,13 +397,103 @@ async def get_files(
         logger.error(f"Error type: {type(e).__name__}, Error details: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _encode_ndjson(rows: List[Dict]) -> bytes:
+    return "".join(json.dumps(row, ensure_ascii=False, default=str) + "\n" for row in rows).encode("utf-8")
+
+def _encode_csv(rows: List[Dict], header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS, extrasaction="ignore")
+    if header:
+        writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue().encode("utf-8")
+
+@app.get("/api/files/export")
+async def export_files(
+    path_prefix: str = Query(..., description="Path prefix filter, required parameter, only exports files under this path"),
+    file_type: Optional[str] = Query(None, description="File type filter"),
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$", description="Output format: ndjson or csv")
+):
+    """Stream every file under a path as NDJSON or CSV (unordered, constant memory)"""
+    if not path_prefix or not path_prefix.strip():
+        raise HTTPException(status_code=400, detail="path_prefix is required")
+    
+    from pathlib import Path
+    normalized_path = str(Path(path_prefix).resolve())
+    batches = db.iter_files(file_type, normalized_path)
+    try:
+        # Fetch the first batch before responding so connection/query errors still return a proper status code
+        first = await run_db(next, batches, None)
+    except Exception as e:
+        logger.error(f"Failed to export file list: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    async def body():
+        try:
+            encode = _encode_csv if export_format == "csv" else _encode_ndjson
+            if export_format == "csv":
+                yield _encode_csv([], header=True)
+            batch = first
+            while batch is not None:
+                yield encode(batch)
+                batch = await run_db(next, batches, None)
+        finally:
+            # Client disconnects close this generator; release the export connection without draining it
+            await run_db(batches.close)
+    
+    media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    filename = f"files.{export_format}"
+    return StreamingResponse(
+        body(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@app.get("/api/duplicates")
+async def get_duplicates(
+    path_prefix: Optional[str] = Query(None, description="Only look for duplicates under this path"),
+    min_size: int = Query(1, ge=1, description="Ignore files smaller than this many bytes"),
+    limit: int = Query(50, ge=1, le=500, description="Number of duplicate groups to return"),
+    offset: int = Query(0, ge=0, description="Group offset")
+):
+    """List groups of identical files (same size and full hash), largest reclaimable space first"""
+    try:
+        normalized_path = str(Path(path_prefix).resolve()) if path_prefix else None
+        result = await run_db(duplicate_finder.find, min_size, normalized_path, limit, offset)
+        return {
+            "success": True,
+            "groups": result["groups"],
+            "count": len(result["groups"]),
+            "summary": result["summary"],
+            "path_prefix": normalized_path
+        }
+    except Exception as e:
+        logger.error(f"Failed to find duplicates: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/duplicates/verify")
+async def verify_duplicates(
+    path_prefix: Optional[str] = Query(None, description="Only verify candidates under this path"),
+    min_size: int = Query(1, ge=1, description="Ignore files smaller than this many bytes"),
+    max_groups: int = Query(settings.DUPLICATE_VERIFY_GROUPS, ge=1, le=10000, description="Maximum number of same-size groups to verify in this call"),
+    before_size: Optional[int] = Query(None, description="Continue from next_before_size returned by the previous call")
+):
+    """Hash same-size candidates that lack a full hash (partial hash first, then full hash) so they can be grouped"""
+    try:
+        normalized_path = str(Path(path_prefix).resolve()) if path_prefix else None
+        stats = await run_duplicates(duplicate_finder.verify_candidates, min_size, normalized_path, max_groups, before_size)
+        return {"success": True, **stats}
+    except Exception as e:
+        logger.error(f"Failed to verify duplicate candidates: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/generate-sql")
 async def generate_sql(
     query: str = Query(..., description="Natural language query")
 ):
     """Generate SQL query from natural language"""
     try:
-        result = ai_service.generate_sql_from_natural_language(query)
+        result = await run_ai(ai_service.generate_sql_from_natural_language, query)
         return {
             "success": True,
             "sql": result.get("sql", ""),
@@ -261,7 +510,7 @@ async def execute_sql(
 ):
     """Execute SQL query"""
     try:
-        results = db.execute_sql(sql)
+        results = await run_db(db.execute_sql, sql)
         return {
             "success": True,
             "results": results,
@@ -274,7 +523,8 @@ async def execute_sql(
 @app.get("/api/directory-tree")
 async def get_directory_tree(
     root_path: str = Query("/", description="Root path to scan directory tree"),
-    max_depth: int = Query(10, ge=1, le=20, description="Maximum depth of directory tree")
+    max_depth: int = Query(1, ge=1, le=20, description="Number of levels to expand; deeper levels are loaded on demand via /api/directory-tree/children"),
+    show_hidden: bool = Query(False, description="Include directories whose names start with a dot")
 ):
     """获取目录树形结构（只扫描目录，不扫描文件）"""
     try:
@@ -314,8 +564,7 @@ async def get_directory_tree(
         
         logger.info(f"获取目录树: {scan_path}, max_depth: {max_depth}")
         
-        scanner = FileScanner()
-        tree = scanner.scan_directory_tree(scan_path, max_depth)
+        tree = await run_io(directory_tree.build_tree, scan_path, max_depth, show_hidden)
         
         if not tree:
             return {
@@ -334,14 +583,34 @@ async def get_directory_tree(
         logger.error(f"获取目录树失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/directory-tree/children")
+async def get_directory_children(
+    path: str = Query("/", description="Directory whose immediate subdirectories are returned"),
+    show_hidden: bool = Query(False, description="Include directories whose names start with a dot")
+):
+    """List one directory's immediate subdirectories, each with a subdir_count/has_children hint (cached, validated by mtime)"""
+    try:
+        result = await run_io(directory_tree.list_children, path, show_hidden)
+        return {"success": True, **result}
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to list directory children: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/health")
 async def health_check():
     """健康检查"""
     try:
-        db.connection.ping(reconnect=True)
-        return {"status": "healthy", "database": "connected"}
+        # 走独立的 IO 线程池，不排在慢查询后面
+        pool = await run_io(db.health_check)
+        return {"status": "healthy", "database": "connected", "pool": pool, "ai_cache": ai_service.cache.metrics(),
+                "query_cache": db.query_cache.metrics()}
     except Exception as e:
-        return {"status": "unhealthy", "database": "disconnected", "error": str(e)}
+        return {"status": "unhealthy", "database": "disconnected", "error": str(e), "pool": db.pool.metrics(),
+                "ai_cache": ai_service.cache.metrics()}
 
 if __name__ == "__main__":
     import uvicorn
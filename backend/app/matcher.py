@@ -0,0 +1,108 @@
+"""
+多词项查询匹配
+"""
+import functools
+import re
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 引号内为短语，其余按空白切分
+_TOKEN_RE = re.compile(r'"([^"]*)"|(\S+)')
+_OR_TOKENS = {'OR', '|'}
+
+def parse_query(query: str) -> List[List[str]]:
+    """把查询解析为析取范式：外层列表之间为 OR，内层列表中的词项为 AND
+
+    空格分隔的词项需要同时出现，大写 OR 或 | 分隔备选，"..." 作为一个整体短语匹配。
+    AND 的优先级高于 OR，例如 a b OR c 表示 (a AND b) OR c。词项不区分大小写。
+    """
+    clauses: List[List[str]] = [[]]
+    for match in _TOKEN_RE.finditer(query):
+        phrase, word = match.groups()
+        if word in _OR_TOKENS:
+            clauses.append([])
+            continue
+        term = (phrase if phrase is not None else word).strip().lower()
+        if term and term not in clauses[-1]:
+            clauses[-1].append(term)
+    clauses = [clause for clause in clauses if clause]
+    if not clauses and query.strip():
+        # 只有 OR 或空短语之类的查询，按原文匹配
+        clauses = [[query.strip().lower()]]
+    return clauses
+
+class QueryMatcher:
+    """编译后的查询：所有词项合并为一个字节正则，一次遍历内容即可得到每个词项是否出现
+
+    正则不带分组和 IGNORECASE，re 可以按首字节集合快速跳过不可能匹配的位置；
+    内容按块转成小写后再匹配，块之间重叠最长词项的长度，跨块的匹配不会丢失。
+    每次匹配后从起始位置的下一个字节继续，重叠出现的不同词项（例如 ab 和 bc 之于 abc）都能找到；
+    同一位置优先匹配最长的词项，被它包含的词项随之记为出现。
+    编译结果只读，可以在多个线程间共享。
+    """
+
+    def __init__(self, clauses: List[List[str]], chunk_size: int = 1024 * 1024):
+        self.clauses = clauses
+        # 长词项在前，同一位置优先匹配最长的
+        self.terms: List[str] = sorted({term for clause in clauses for term in clause}, key=len, reverse=True)
+        index = {term: i for i, term in enumerate(self.terms)}
+        self._clause_sets: List[FrozenSet[int]] = [frozenset(index[term] for term in clause) for clause in clauses]
+        # 词项出现时，被它包含的词项也一定出现
+        self._implied: List[FrozenSet[int]] = [
+            frozenset(j for j, other in enumerate(self.terms) if other in term) for term in self.terms
+        ]
+
+        # 字节的 lower() 只处理 ASCII 字母，非 ASCII 词项额外登记全大写和首字母大写形式
+        self._variants: Dict[bytes, int] = {}
+        for i, term in enumerate(self.terms):
+            for variant in (term, term.upper(), term.title()):
+                self._variants.setdefault(variant.encode('utf-8').lower(), i)
+        variants = sorted(self._variants, key=len, reverse=True)
+        self._pattern = re.compile(b'|'.join(re.escape(variant) for variant in variants)) if variants else None
+        self._max_len = max((len(variant) for variant in variants), default=1)
+        self.chunk_size = max(self._max_len * 2, chunk_size)
+
+    def find_in_text(self, text: str) -> Set[int]:
+        """在短文本（文件名、路径）中出现的词项编号"""
+        text = text.lower()
+        return {i for i, term in enumerate(self.terms) if term in text}
+
+    def is_match(self, found: Set[int]) -> bool:
+        """出现的词项是否满足查询"""
+        return any(clause <= found for clause in self._clause_sets)
+
+    def scan(self, data) -> Tuple[Set[int], int, Optional[Tuple[int, int]]]:
+        """一次遍历 bytes 或 mmap，返回 (出现的词项编号, 匹配次数, 第一处匹配的字节范围)"""
+        found: Set[int] = set()
+        count = 0
+        first_span = None
+        if self._pattern is None:
+            return found, count, first_span
+
+        size = len(data)
+        overlap = self._max_len - 1
+        chunk_start = 0
+        while chunk_start < size:
+            chunk_end = min(size, chunk_start + self.chunk_size)
+            chunk = data[chunk_start:min(size, chunk_end + overlap)].lower()
+            # 起点落在重叠区的匹配留给下一块统计
+            limit = chunk_end - chunk_start
+            pos = 0
+            while True:
+                match = self._pattern.search(chunk, pos)
+                if match is None or match.start() >= limit:
+                    break
+                found |= self._implied[self._variants[match.group()]]
+                count += 1
+                if first_span is None:
+                    first_span = (chunk_start + match.start(), chunk_start + match.end())
+                pos = match.start() + 1
+            chunk_start = chunk_end
+        return found, count, first_span
+
+@functools.lru_cache(maxsize=256)
+def compile_query(query: str) -> QueryMatcher:
+    """解析并编译查询，相同的查询复用同一个匹配器"""
+    return QueryMatcher(parse_query(query))
@@ -0,0 +1,23 @@
+"""
+游标分页
+"""
+import base64
+import json
+from typing import List
+
+def encode_cursor(kind: str, keys: List) -> str:
+    """把排序键编码为不透明的续页游标"""
+    payload = json.dumps({'t': kind, 'k': keys}, separators=(',', ':'), ensure_ascii=False)
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(kind: str, token: str, size: int) -> List:
+    """解码续页游标，游标格式错误或与查询类型不符时抛出 ValueError"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        keys = payload['k']
+        if payload.get('t') != kind or not isinstance(keys, list) or len(keys) != size:
+            raise ValueError
+        return keys
+    except Exception:
+        raise ValueError("无效的分页游标")
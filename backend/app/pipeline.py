@@ -0,0 +1,65 @@
+"""
+扫描入库流水线
+"""
+import logging
+import time
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class BatchWriter:
+    """写入阶段：把扫描产出的文件信息攒成批次写入数据库
+    
+    只持有当前批次的数据，扫描期间已写入的记录即可被查询到。
+    """
+    
+    def __init__(self, database, batch_size: int = 100, indexer=None,
+                 on_flush: Optional[Callable[['BatchWriter'], None]] = None):
+        self.database = database
+        self.batch_size = max(1, batch_size)
+        self.indexer = indexer
+        # 每个批次写入完成后回调，此时已接收的记录全部落库，可用于保存扫描断点
+        self.on_flush = on_flush
+        self.batch: List[Dict] = []
+        self.received_count = 0
+        self.saved_count = 0
+        self.indexed_count = 0
+        self._start_time = time.monotonic()
+    
+    def add(self, file_info: Dict):
+        """加入一条文件信息，批次满时写入数据库"""
+        self.batch.append(file_info)
+        self.received_count += 1
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+    
+    def flush(self):
+        """写入当前批次"""
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, []
+        before = self.saved_count
+        self.saved_count += self.database.insert_files_batch(batch)
+        
+        # 索引阶段：文件行写入后再为其中的文本文件建立倒排记录
+        if self.indexer is not None:
+            try:
+                self.indexed_count += self.indexer.index_files(self.database, batch)
+            except Exception as e:
+                logger.warning(f"建立内容索引失败，跳过本批次: {e}")
+        
+        # 每跨过一千条记录一次日志
+        if self.saved_count // 1000 != before // 1000:
+            elapsed = time.monotonic() - self._start_time
+            logger.info(f"已保存 {self.saved_count}/{self.received_count} 个文件，"
+                        f"{self.saved_count / elapsed if elapsed > 0 else 0:.0f} 文件/秒")
+        
+        if self.on_flush is not None:
+            self.on_flush(self)
+    
+    def drain(self, file_infos) -> int:
+        """消费扫描生成器直到结束，返回成功保存的数量"""
+        for file_info in file_infos:
+            self.add(file_info)
+        self.flush()
+        return self.saved_count
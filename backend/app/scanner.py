@@ -2,27 +2,68 @@
 文件扫描服务
 """
 import os
-import hashlib
+import stat as stat_module
 import mimetypes
+import queue
+import threading
+import time
+from collections import deque
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Callable, FrozenSet, Iterator, List, Dict, Optional, Set, Tuple
 from datetime import datetime
 import logging
-import json
 import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
+from app.hasher import FileHasher, file_hasher
 
 logger = logging.getLogger(__name__)
 
+# files.flags 的位，取代逐行保存的 metadata JSON
+FLAG_SYMLINK = 1
+FLAG_READABLE = 2
+
+# 流式扫描结束标记
+_SCAN_DONE = object()
+
+class _DirDone:
+    """目录处理完成标记：排在该目录所有文件之后进入结果队列"""
+    __slots__ = ('path',)
+    
+    def __init__(self, path: str):
+        self.path = path
+
 class FileScanner:
     # 系统目录列表，这些目录不应该被扫描
     SYSTEM_DIRS = {'/proc', '/sys', '/dev', '/run', '/tmp', '/var/run', '/var/lock'}
     
-    def __init__(self, max_file_size: int = 104857600):
+    def __init__(self, max_file_size: int = 104857600, workers: int = 8, queue_size: int = 10000,
+                 hasher: Optional[FileHasher] = None, max_pending_hashes: int = 256):
         self.max_file_size = max_file_size
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.hasher = hasher or file_hasher
+        self.max_pending_hashes = max(1, max_pending_hashes)
         self.scanned_count = 0
         self.error_count = 0
+        self.dir_count = 0
+        self.unchanged_count = 0
+        self.bytes_count = 0
+        self.files_per_second = 0.0
+        self.completed = False
+        self._known_files: Optional[Dict[str, Dict]] = None
+        self._walk_completed = False
+        # 处理某个目录时出现意外错误，该目录的文件和子目录没有遍历完，本次遍历不算完整
+        self._walk_failed = False
+        # 增量模式下无法读取的目录和出错的条目：其下的已有记录不算已消失，保留旧记录
+        self._skipped_paths: Set[str] = set()
+        # 已发现但文件尚未全部被消费者取走的目录，即遍历前沿；值表示子目录是否已经登记
+        self._pending_dirs: Dict[str, bool] = {}
+        # 断点续扫时子目录已登记过的起始目录，只重新处理其中的文件
+        self._listed_only: Set[str] = set()
+        self._lock = threading.Lock()
+        # 进程的有效用户和组在扫描期间不变，只获取一次，避免每个文件三次系统调用
+        self._euid, self._groups = self._process_credentials()
     
     def _is_system_directory(self, path: Path) -> bool:
         """检查路径是否是系统目录"""
@@ -42,62 +83,33 @@ class FileScanner:
     
     def calculate_file_hash(self, file_path: str) -> str:
         """计算文件哈希值"""
+        return self._hash_now(file_path)[0]
+    
+    def _hash_now(self, file_path: str):
+        """在当前线程中计算哈希，返回 (file_hash, hash_type)，失败时返回 ("", None)"""
         try:
-            hash_md5 = hashlib.md5()
-            with open(file_path, "rb") as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    hash_md5.update(chunk)
-            return hash_md5.hexdigest()
+            return self.hasher.hash_now(file_path)
         except Exception as e:
             logger.warning(f"计算文件哈希失败 {file_path}: {e}")
-            return ""
+            return "", None
     
     def get_file_info(self, file_path: str) -> Optional[Dict]:
         """获取文件信息"""
         try:
             path = Path(file_path)
-            if not path.exists() or not path.is_file():
+            st = path.stat()
+            if not stat_module.S_ISREG(st.st_mode):
                 return None
-            
-            stat = path.stat()
-            file_size = stat.st_size
-            
-            # 跳过过大的文件
-            if file_size > self.max_file_size:
-                logger.warning(f"文件过大，跳过: {file_path} ({file_size} bytes)")
-                return None
-            
-            # 获取MIME类型
-            mime_type, _ = mimetypes.guess_type(str(path))
-            
-            # 判断文件类型
-            file_type = self._classify_file_type(path.suffix, mime_type)
-            
-            # 计算文件哈希（仅对小文件）
-            file_hash = ""
-            if file_size < 10485760:  # 小于10MB的文件才计算哈希
-                file_hash = self.calculate_file_hash(str(path))
-            
-            file_info = {
-                'file_path': str(path.absolute()),
-                'file_name': path.name,
-                'file_size': file_size,
-                'file_type': file_type,
-                'file_extension': path.suffix.lower() if path.suffix else None,
-                'mime_type': mime_type,
-                'created_time': datetime.fromtimestamp(stat.st_ctime),
-                'modified_time': datetime.fromtimestamp(stat.st_mtime),
-                'file_hash': file_hash,
-                'metadata': json.dumps({
-                    'is_symlink': path.is_symlink(),
-                    'is_readable': os.access(str(path), os.R_OK),
-                })
-            }
-            
+            file_info = self._build_file_info(str(path.absolute()), path.name, st, path.is_symlink())
+            if file_info and file_info['file_hash'] is None:
+                file_info['file_hash'], file_info['hash_type'] = self._hash_now(file_info['file_path'])
             return file_info
+        except FileNotFoundError:
+            return None
         except Exception as e:
             logger.error(f"获取文件信息失败 {file_path}: {e}")
-            self.error_count += 1
+            with self._lock:
+                self.error_count += 1
             return None
     
     def _classify_file_type(self, extension: str, mime_type: Optional[str]) -> str:
@@ -133,76 +145,407 @@ class FileScanner:
         
         return "other"
     
-    def scan_directory(self, root_path: str, recursive: bool = True) -> List[Dict]:
-        """扫描目录下的所有文件"""
-        self.scanned_count = 0
-        self.error_count = 0
+    @classmethod
+    def _is_system_path(cls, path_str: str) -> bool:
+        """检查已解析的绝对路径是否属于系统目录（纯字符串比较，不产生系统调用）"""
+        for sys_dir in cls.SYSTEM_DIRS:
+            if path_str == sys_dir or path_str.startswith(sys_dir + '/'):
+                return True
+        return False
+    
+    @staticmethod
+    def _process_credentials() -> Tuple[Optional[int], FrozenSet[int]]:
+        """当前进程的有效用户 ID 和所属组集合（含有效组 ID）；不支持的平台返回 (None, 空集合)"""
+        if not hasattr(os, 'geteuid'):
+            return None, frozenset()
+        return os.geteuid(), frozenset(os.getgroups()) | {os.getegid()}
+    
+    @staticmethod
+    def _is_readable(st: os.stat_result, euid: Optional[int], groups: FrozenSet[int]) -> bool:
+        """根据 stat 结果和 _process_credentials 的结果判断当前进程是否可读，避免对每个文件调用 os.access"""
+        if euid is None or euid == 0:
+            return True
+        if st.st_uid == euid:
+            return bool(st.st_mode & stat_module.S_IRUSR)
+        if st.st_gid in groups:
+            return bool(st.st_mode & stat_module.S_IRGRP)
+        return bool(st.st_mode & stat_module.S_IROTH)
+    
+    def _build_file_info(self, path_str: str, name: str, st: os.stat_result, is_symlink: bool) -> Optional[Dict]:
+        """基于 DirEntry 已缓存的 stat 数据构建文件信息"""
+        file_size = st.st_size
         
-        files = []
-        root = Path(root_path)
+        # 跳过过大的文件
+        if file_size > self.max_file_size:
+            logger.warning(f"文件过大，跳过: {path_str} ({file_size} bytes)")
+            return None
         
-        if not root.exists():
-            raise ValueError(f"路径不存在: {root_path}")
+        _, extension = os.path.splitext(name)
         
-        if not root.is_dir():
-            raise ValueError(f"路径不是目录: {root_path}")
+        # 获取MIME类型
+        mime_type, _ = mimetypes.guess_type(name)
         
-        logger.info(f"开始扫描目录: {root_path}")
+        # 判断文件类型
+        file_type = self._classify_file_type(extension, mime_type)
+        
+        # 小文件一次读取即可完成，直接在遍历线程中计算哈希；
+        # 其余文件 file_hash 留作 None，由 iter_directory 交给哈希进程池
+        file_hash, hash_type = None, None
+        if self.hasher.is_inline(file_size):
+            file_hash, hash_type = self._hash_now(path_str)
+        
+        return {
+            'file_path': path_str,
+            'file_name': name,
+            'file_size': file_size,
+            'file_type': file_type,
+            'file_extension': extension.lower() if extension else None,
+            'mime_type': mime_type,
+            'created_time': datetime.fromtimestamp(st.st_ctime),
+            'modified_time': datetime.fromtimestamp(st.st_mtime),
+            'file_hash': file_hash,
+            'hash_type': hash_type,
+            'flags': (FLAG_SYMLINK if is_symlink else 0) | (FLAG_READABLE if self._is_readable(st, self._euid, self._groups) else 0),
+        }
+    
+    @staticmethod
+    def _is_unchanged(signature: Dict, st: os.stat_result) -> bool:
+        """比较数据库中的 (file_size, modified_time) 与当前 stat 结果
         
+        DATETIME 列只保存到秒（写入时可能四舍五入），因此修改时间允许 1 秒以内的误差。
+        """
+        modified_time = signature.get('modified_time')
+        if signature.get('file_size') != st.st_size or not isinstance(modified_time, datetime):
+            return False
+        return abs(datetime.fromtimestamp(st.st_mtime) - modified_time).total_seconds() < 1
+    
+    def _scan_entries(self, dir_path: str, on_file: Callable[[Dict], None]) -> List[str]:
+        """扫描单个目录，处理其中的文件并返回需要继续遍历的子目录"""
+        subdirs = []
         try:
-            if recursive:
-                # 递归扫描
-                for file_path in root.rglob('*'):
-                    # 跳过系统目录
-                    if self._is_system_directory(file_path.parent):
-                        continue
-                    
+            with os.scandir(dir_path) as it:
+                for entry in it:
                     try:
-                        if file_path.is_file():
-                            file_info = self.get_file_info(str(file_path))
-                            if file_info:
-                                files.append(file_info)
-                                self.scanned_count += 1
-                                
-                                if self.scanned_count % 100 == 0:
-                                    logger.info(f"已扫描 {self.scanned_count} 个文件...")
-                    except PermissionError:
-                        # 权限错误，静默跳过
-                        continue
-                    except Exception as e:
-                        # 其他错误，记录但不中断扫描
-                        logger.debug(f"处理文件失败 {file_path}: {e}")
-                        continue
-            else:
-                # 仅扫描当前目录
-                for file_path in root.iterdir():
-                    # 跳过系统目录
-                    if self._is_system_directory(file_path):
-                        continue
-                    
-                    try:
-                        if file_path.is_file():
-                            file_info = self.get_file_info(str(file_path))
-                            if file_info:
-                                files.append(file_info)
-                                self.scanned_count += 1
+                        # 不跟随目录符号链接，避免 /proc/self/root 之类的循环
+                        if entry.is_dir(follow_symlinks=False):
+                            if not self._is_system_path(entry.path):
+                                subdirs.append(entry.path)
+                            continue
+                        if not entry.is_file():
+                            continue
+                        st = entry.stat()
+                        with self._lock:
+                            self.bytes_count += st.st_size
+                        
+                        # 增量模式：大小和修改时间都未变化的文件直接跳过，不读取内容
+                        known_files = self._known_files
+                        if known_files is not None:
+                            signature = known_files.get(entry.path)
+                            if signature is not None and self._is_unchanged(signature, st):
+                                known_files.pop(entry.path, None)
+                                with self._lock:
+                                    self.unchanged_count += 1
+                                continue
+                        
+                        file_info = self._build_file_info(entry.path, entry.name, st, entry.is_symlink())
+                        if known_files is not None:
+                            # 跳过的文件（例如超过大小上限）也保留旧记录
+                            known_files.pop(entry.path, None)
+                        if file_info:
+                            on_file(file_info)
                     except PermissionError:
                         # 权限错误，静默跳过
+                        self._skip_path(entry.path)
                         continue
                     except Exception as e:
-                        logger.debug(f"处理文件失败 {file_path}: {e}")
-                        continue
+                        # 其他错误（包括异常时间戳导致的 ValueError/OverflowError），记录但不中断扫描
+                        logger.debug(f"处理文件失败 {entry.path}: {e}")
+                        self._skip_path(entry.path)
+                        with self._lock:
+                            self.error_count += 1
+        except PermissionError:
+            logger.debug(f"无权限访问目录: {dir_path}")
+            self._skip_path(dir_path)
+        except OSError as e:
+            logger.debug(f"读取目录失败 {dir_path}: {e}")
+            self._skip_path(dir_path)
+            with self._lock:
+                self.error_count += 1
+        return subdirs
+    
+    def _skip_path(self, path: str):
+        """记录未能读取的路径（文件或目录），增量扫描结束时保留该路径及其下的已有记录"""
+        if self._known_files is not None:
+            with self._lock:
+                self._skipped_paths.add(path)
+    
+    def _keep_skipped(self, known_files: Dict[str, Dict]):
+        """从已消失的候选中移除未能读取的路径及其下的记录；目录一时无法读取（EACCES、EIO）不等于其中的文件已被删除"""
+        if not self._skipped_paths or not known_files:
+            return
+        prefixes = tuple(path.rstrip('/') + '/' for path in self._skipped_paths)
+        for path in [p for p in known_files if p in self._skipped_paths or p.startswith(prefixes)]:
+            del known_files[path]
+    
+    def _next_dirs(self, dir_path: str, subdirs: List[str]) -> List[str]:
+        """一个目录处理完毕：累计目录数，并把新发现的子目录加入遍历前沿
         
-        except PermissionError as e:
-            # 根目录权限错误才记录警告
-            if not self._is_system_directory(root):
-                logger.warning(f"权限不足，跳过: {e}")
+        已在前沿中的目录（断点续扫时的起点）不再重复遍历；
+        断点中已登记过子目录的目录不再向下遍历，它的子目录要么已完成，要么本身就在断点中。
+        """
+        with self._lock:
+            if dir_path in self._listed_only:
+                subdirs = []
+            fresh = [d for d in subdirs if d not in self._pending_dirs]
+            for subdir in fresh:
+                self._pending_dirs[subdir] = False
+            if dir_path in self._pending_dirs:
+                self._pending_dirs[dir_path] = True
+            self.dir_count += 1
+        return fresh
+    
+    def _process_dir(self, dir_path: str, recursive: bool, on_file: Callable[[Dict], None],
+                     on_dir_done: Callable[[str], None]) -> List[str]:
+        """处理一个目录，返回需要继续遍历的新子目录
+        
+        意外错误不会结束遍历线程，但该目录没有处理完，本次遍历标记为不完整，增量扫描不会据此清理记录。
+        """
+        try:
+            subdirs = self._scan_entries(dir_path, on_file)
+            fresh = self._next_dirs(dir_path, subdirs if recursive else [])
+            on_dir_done(dir_path)
+            return fresh
         except Exception as e:
-            logger.error(f"扫描过程中出错: {e}")
+            logger.error(f"处理目录失败 {dir_path}: {e}")
+            with self._lock:
+                self.error_count += 1
+                self._walk_failed = True
+            return []
+    
+    def _walk(self, start_dirs: List[str], recursive: bool, on_file: Callable[[Dict], None],
+              on_dir_done: Callable[[str], None], stop_event: Optional[threading.Event] = None):
+        """使用线程池并行遍历目录树，目录作为任务在线程之间分发
+        
+        每个目录的文件处理完后调用 on_dir_done；子目录在此之前已加入遍历前沿。
+        """
+        stop_event = stop_event or threading.Event()
+        
+        if not recursive or self.workers <= 1:
+            pending = list(start_dirs)
+            while pending and not stop_event.is_set():
+                dir_path = pending.pop()
+                pending.extend(self._process_dir(dir_path, recursive, on_file, on_dir_done))
+            return
+        
+        dir_queue: queue.Queue = queue.Queue()
+        for dir_path in start_dirs:
+            dir_queue.put(dir_path)
+        
+        def worker():
+            while True:
+                dir_path = dir_queue.get()
+                if dir_path is None:
+                    dir_queue.task_done()
+                    return
+                try:
+                    # 已取消时只消耗队列，不再读取目录
+                    if stop_event.is_set():
+                        continue
+                    for subdir in self._process_dir(dir_path, True, on_file, on_dir_done):
+                        dir_queue.put(subdir)
+                finally:
+                    dir_queue.task_done()
+        
+        threads = [threading.Thread(target=worker, name=f"scan-worker-{i}", daemon=True)
+                   for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        dir_queue.join()
+        for _ in threads:
+            dir_queue.put(None)
+        for thread in threads:
+            thread.join()
+    
+    def checkpoint(self) -> Dict[str, List[str]]:
+        """返回当前遍历前沿（文件尚未全部产出的目录）
+        
+        消费者把已取得的文件全部写入数据库后调用，结果可作为 frontier 传给 iter_directory 从断点继续扫描。
+        
+        Returns:
+            {'dirs': 尚未读取、需要完整遍历的目录, 'listed': 已读取并登记了子目录、只需重新处理文件的目录}
+        """
+        with self._lock:
+            return {
+                'dirs': sorted(d for d, listed in self._pending_dirs.items() if not listed),
+                'listed': sorted(d for d, listed in self._pending_dirs.items() if listed),
+            }
+    
+    def iter_directory(self, root_path: str, recursive: bool = True,
+                       known_files: Optional[Dict[str, Dict]] = None,
+                       frontier: Optional[Dict[str, List[str]]] = None,
+                       cancel_event: Optional[threading.Event] = None) -> Iterator[Dict]:
+        """流式扫描目录，遍历线程通过有界队列逐个产出文件信息
+        
+        队列满时遍历线程会阻塞等待消费者，因此内存占用与目录树大小无关。
+        提前关闭生成器会停止遍历。
+        
+        Args:
+            root_path: 扫描根目录
+            recursive: 是否递归扫描子目录
+            known_files: 增量模式下数据库已有记录 {file_path: {'file_size', 'modified_time', 'file_hash'}}。
+                未变化的文件不会产出；遍历中出现过的路径会从字典中移除，
+                无法读取的目录或文件下的路径也会移除（保留旧记录），扫描结束后剩余的即为已消失的文件。
+            frontier: 断点续扫时上一次 checkpoint() 的结果，只从其中的目录开始遍历
+            cancel_event: 设置后生成器尽快结束，即使一段时间内没有文件产出（例如增量扫描全部未变化）
+        """
+        self.scanned_count = 0
+        self.error_count = 0
+        self.dir_count = 0
+        self.unchanged_count = 0
+        self.bytes_count = 0
+        self.files_per_second = 0.0
+        self.completed = False
+        self._walk_completed = False
+        self._walk_failed = False
+        self._skipped_paths = set()
+        
+        root = Path(root_path)
+        
+        if not root.exists():
+            raise ValueError(f"路径不存在: {root_path}")
+        
+        if not root.is_dir():
+            raise ValueError(f"路径不是目录: {root_path}")
         
-        logger.info(f"扫描完成: 成功 {self.scanned_count} 个，错误 {self.error_count} 个")
+        # 只在根目录上解析一次路径，遍历过程中不再跟随符号链接
+        root_str = str(root.resolve())
+        if self._is_system_path(root_str):
+            logger.warning(f"系统目录，跳过扫描: {root_str}")
+            return
         
-        return files
+        if frontier is None:
+            start_dirs = [root_str]
+            listed_only = set()
+        else:
+            # 只接受仍然存在且位于根目录之下的断点目录
+            def usable(d: str) -> bool:
+                return (d == root_str or d.startswith(root_str.rstrip('/') + '/')) and os.path.isdir(d)
+            listed_only = {d for d in frontier.get('listed', []) if usable(d)}
+            start_dirs = [d for d in frontier.get('dirs', []) if usable(d)] + sorted(listed_only)
+        self._listed_only = listed_only
+        self._pending_dirs = {d: d in listed_only for d in start_dirs}
+        
+        logger.info(f"开始扫描目录: {root_str} (workers={self.workers}，起始目录 {len(start_dirs)} 个)")
+        start_time = time.monotonic()
+        
+        results: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        stop_event = threading.Event()
+        
+        def put(item) -> bool:
+            while not stop_event.is_set():
+                try:
+                    results.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def on_file(file_info: Dict):
+            if not put(file_info):
+                return
+            with self._lock:
+                self.scanned_count += 1
+                if self.scanned_count % 10000 == 0:
+                    elapsed = time.monotonic() - start_time
+                    logger.info(f"已扫描 {self.scanned_count} 个文件，{self.dir_count} 个目录，"
+                                f"{self.scanned_count / elapsed if elapsed > 0 else 0:.0f} 文件/秒")
+        
+        def on_dir_done(dir_path: str):
+            put(_DirDone(dir_path))
+        
+        def produce():
+            try:
+                self._walk(start_dirs, recursive, on_file, on_dir_done, stop_event)
+                self._walk_completed = not stop_event.is_set() and not self._walk_failed
+                if known_files is not None:
+                    self._keep_skipped(known_files)
+            except Exception as e:
+                logger.error(f"扫描过程中出错: {e}")
+            finally:
+                put(_SCAN_DONE)
+        
+        self._known_files = known_files
+        producer = threading.Thread(target=produce, name="scan-producer", daemon=True)
+        producer.start()
+        
+        # 哈希阶段：交给进程池的文件和目录完成标记按到达顺序排队，只从队首产出，
+        # 这样目录标记仍然排在它的所有文件之后，遍历前沿保持准确
+        inflight: deque = deque()
+        
+        def head_ready() -> bool:
+            if not inflight:
+                return False
+            future = inflight[0][1]
+            return future is None or future.done() or len(inflight) > self.max_pending_hashes
+        
+        def release(item, future) -> Optional[Dict]:
+            if isinstance(item, _DirDone):
+                # 该目录的文件都已产出，移出遍历前沿
+                with self._lock:
+                    self._pending_dirs.pop(item.path, None)
+                return None
+            if future is not None:
+                self.hasher.apply(item, future)
+            return item
+        
+        try:
+            walk_done = False
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                while head_ready():
+                    file_info = release(*inflight.popleft())
+                    if file_info is not None:
+                        yield file_info
+                try:
+                    item = results.get(timeout=0.05 if inflight else 0.5)
+                except queue.Empty:
+                    continue
+                if item is _SCAN_DONE:
+                    walk_done = True
+                    break
+                future = None
+                if not isinstance(item, _DirDone) and item['file_hash'] is None:
+                    try:
+                        future = self.hasher.submit(item['file_path'])
+                    except Exception as e:
+                        logger.warning(f"提交哈希任务失败 {item['file_path']}: {e}")
+                        item['file_hash'], item['hash_type'] = '', None
+                inflight.append((item, future))
+            
+            # 遍历结束后等待剩余的哈希结果
+            while walk_done and inflight and not (cancel_event is not None and cancel_event.is_set()):
+                file_info = release(*inflight.popleft())
+                if file_info is not None:
+                    yield file_info
+            # 遍历完整结束且所有文件都已产出，才算扫描完成
+            self.completed = walk_done and not inflight and self._walk_completed
+        finally:
+            for _, future in inflight:
+                if future is not None:
+                    future.cancel()
+            stop_event.set()
+            producer.join()
+            self._known_files = None
+            elapsed = time.monotonic() - start_time
+            self.files_per_second = self.scanned_count / elapsed if elapsed > 0 else 0.0
+            logger.info(f"扫描完成: 成功 {self.scanned_count} 个，未变化 {self.unchanged_count} 个，"
+                        f"错误 {self.error_count} 个，目录 {self.dir_count} 个，"
+                        f"耗时 {elapsed:.1f}s，{self.files_per_second:.0f} 文件/秒")
+    
+    def scan_directory(self, root_path: str, recursive: bool = True) -> List[Dict]:
+        """扫描目录下的所有文件"""
+        return list(self.iter_directory(root_path, recursive))
     
     def scan_directory_tree(self, root_path: str, max_depth: int = 10) -> Optional[Dict]:
         """扫描目录树结构（只获取目录，不扫描文件内容）"""
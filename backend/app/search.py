@@ -1,141 +1,210 @@
 """
 搜索服务
 """
+import mmap
 import os
-import re
-from typing import List, Dict, Optional
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, Dict, FrozenSet, Iterator, List, Optional, Tuple
 import logging
+import sys
 from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+from config import settings
+from app.matcher import QueryMatcher, compile_query
+from app.scanner import FileScanner
 
 logger = logging.getLogger(__name__)
 
 class SearchService:
-    def __init__(self):
-        self.text_file_extensions = {'.txt', '.md', '.py', '.js', '.java', '.cpp', '.c', 
+    """不经过数据库，直接在磁盘上搜索一个目录（文件名、路径、内容）
+
+    关键词按 app.matcher 的语法解析（空格为 AND，OR 分隔备选，引号内为短语），每次搜索只编译一次，由各线程共享。
+    遍历在调用线程中用 scandir 完成，路径已满足查询的文件直接产出，不读取内容；
+    其余文本文件交给有界线程池，用 mmap 在原始字节上一次遍历匹配全部词项，只有命中处的上下文片段才解码。
+    路径中出现的词项与内容中出现的词项合并判断，例如 "report 2024" 可以由文件名和内容分别命中。
+    结果边找边产出，找到 max_results 个后停止遍历并取消还在排队的任务。
+    """
+
+    def __init__(self, workers: int = 8, max_file_size: int = 5 * 1024 * 1024, max_results: int = 1000):
+        self.text_file_extensions = {'.txt', '.md', '.py', '.js', '.java', '.cpp', '.c',
                                      '.html', '.css', '.json', '.xml', '.log', '.csv'}
         self.max_content_preview = 200
-    
-    def search_in_file_content(self, file_path: str, keyword: str) -> Optional[Dict]:
-        """在文件内容中搜索关键词"""
+        self.workers = max(1, workers)
+        self.max_file_size = max_file_size
+        self.max_results = max(1, max_results)
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="search")
+            return self._pool
+
+    def _match_content(self, file_path: str, matcher: QueryMatcher,
+                       found_in_path: FrozenSet[int] = frozenset()) -> Optional[Dict]:
+        """用 mmap 在文件的原始字节上匹配，返回匹配次数和第一处匹配的上下文"""
         try:
-            path = Path(file_path)
-            if not path.exists() or not path.is_file():
-                return None
-            
-            # 只搜索文本文件
-            if path.suffix.lower() not in self.text_file_extensions:
-                return None
-            
-            # 检查文件大小（只搜索小于5MB的文件）
-            if path.stat().st_size > 5 * 1024 * 1024:
-                return None
-            
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
-            
-            # 搜索关键词
-            pattern = re.compile(re.escape(keyword), re.IGNORECASE)
-            matches = list(pattern.finditer(content))
-            
-            if matches:
-                # 获取第一个匹配的上下文
-                first_match = matches[0]
-                start = max(0, first_match.start() - 50)
-                end = min(len(content), first_match.end() + 50)
-                preview = content[start:end]
-                
-                return {
-                    'match_count': len(matches),
-                    'content_preview': preview,
-                    'match_score': min(1.0, len(matches) / 10.0)  # 匹配越多分数越高
-                }
-            
-            return None
-        
+            with open(file_path, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                # 空文件无法 mmap
+                if size == 0 or size > self.max_file_size:
+                    return None
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    found, match_count, first_span = matcher.scan(data)
+                    if not match_count or not matcher.is_match(found | found_in_path):
+                        return None
+                    start = max(0, first_span[0] - 50)
+                    end = min(size, first_span[1] + 50)
+                    preview = data[start:end].decode('utf-8', errors='ignore')
+
+            return {
+                'match_count': match_count,
+                'content_preview': preview,
+                'match_score': min(1.0, match_count / 10.0)  # 匹配越多分数越高
+            }
         except Exception as e:
             logger.debug(f"搜索文件内容失败 {file_path}: {e}")
             return None
-    
-    def calculate_relevance_score(self, file_name: str, file_path: str, keyword: str, 
+
+    def search_in_file_content(self, file_path: str, keyword: str) -> Optional[Dict]:
+        """在文件内容中搜索关键词"""
+        # 只搜索文本文件
+        if Path(file_path).suffix.lower() not in self.text_file_extensions:
+            return None
+        return self._match_content(file_path, compile_query(keyword))
+
+    def calculate_relevance_score(self, file_name: str, file_path: str, keyword: str,
                                  content_match: Optional[Dict] = None) -> float:
         """计算文件相关性分数"""
         score = 0.0
-        keyword_lower = keyword.lower()
         file_name_lower = file_name.lower()
         file_path_lower = file_path.lower()
-        
-        # 文件名完全匹配
-        if keyword_lower == file_name_lower:
-            score += 10.0
-        # 文件名包含关键词
-        elif keyword_lower in file_name_lower:
-            score += 5.0
-        
-        # 路径包含关键词
-        if keyword_lower in file_path_lower:
-            score += 2.0
-        
+
+        # 多词项查询按每个词项分别计分
+        for term in compile_query(keyword).terms:
+            # 文件名完全匹配
+            if term == file_name_lower:
+                score += 10.0
+            # 文件名包含关键词
+            elif term in file_name_lower:
+                score += 5.0
+
+            # 路径包含关键词
+            if term in file_path_lower:
+                score += 2.0
+
         # 内容匹配
         if content_match:
             score += content_match.get('match_score', 0.0) * 3.0
-        
+
         return score
-    
-    def search_files(self, keyword: str, search_path: str = None) -> List[Dict]:
-        """搜索文件（文件名、路径、内容）"""
-        results = []
-        
-        # 如果指定了搜索路径，在该路径下搜索
-        if search_path:
-            search_root = Path(search_path)
-            if search_root.exists() and search_root.is_dir():
-                for file_path in search_root.rglob('*'):
-                    if file_path.is_file():
-                        result = self._match_file(file_path, keyword)
-                        if result:
-                            results.append(result)
-        else:
+
+    def search_files(self, keyword: str, search_path: str = None, max_results: Optional[int] = None) -> List[Dict]:
+        """搜索文件（文件名、路径、内容），按相关性分数排序"""
+        if not search_path:
             # 从数据库搜索（由API层处理）
-            pass
-        
-        # 按相关性分数排序
+            return []
+
+        results = list(self.iter_search(keyword, search_path, max_results))
         results.sort(key=lambda x: x.get('relevance_score', 0), reverse=True)
-        
         return results
-    
-    def _match_file(self, file_path: Path, keyword: str) -> Optional[Dict]:
-        """匹配单个文件"""
-        file_name = file_path.name
-        file_path_str = str(file_path)
-        
-        # 检查文件名和路径
-        keyword_lower = keyword.lower()
-        if keyword_lower not in file_name.lower() and keyword_lower not in file_path_str.lower():
-            # 尝试内容搜索
-            content_match = self.search_in_file_content(file_path_str, keyword)
-            if not content_match:
-                return None
-        else:
-            content_match = None
-        
-        # 计算相关性分数
-        relevance_score = self.calculate_relevance_score(
-            file_name, file_path_str, keyword, content_match
-        )
-        
-        if relevance_score > 0:
-            return {
-                'file_path': file_path_str,
-                'file_name': file_name,
-                'file_size': file_path.stat().st_size,
-                'relevance_score': relevance_score,
-                'content_preview': content_match.get('content_preview', '') if content_match else '',
-                'match_count': content_match.get('match_count', 0) if content_match else 0
-            }
-        
-        return None
 
-search_service = SearchService()
+    def iter_search(self, keyword: str, search_path: str, max_results: Optional[int] = None) -> Iterator[Dict]:
+        """在目录下搜索，边找边产出结果（未排序）；找到 max_results 个后停止，目录不存在时不产出"""
+        max_results = max(1, max_results or self.max_results)
+        root = str(Path(search_path).resolve())
+        if not os.path.isdir(root):
+            return
+
+        results = self._search(root, keyword)
+        try:
+            for count, result in enumerate(results, 1):
+                yield result
+                if count >= max_results:
+                    break
+        finally:
+            results.close()
+
+    def _search(self, root: str, keyword: str) -> Iterator[Dict]:
+        matcher = compile_query(keyword)
+        pool = self._get_pool()
+        # 排队的内容匹配任务上限，遍历比读取快时在这里等待，内存不随目录大小增长
+        max_pending = self.workers * 4
+        pending: Deque[Tuple[str, str, int, Future]] = deque()
+        try:
+            for entry in self._walk(root):
+                try:
+                    st = entry.stat()
+                except OSError as e:
+                    logger.debug(f"读取文件信息失败 {entry.path}: {e}")
+                    continue
+
+                # 文件名在路径中，路径满足查询即名称或路径命中
+                found_in_path = frozenset(matcher.find_in_text(entry.path))
+                if matcher.is_match(found_in_path):
+                    yield self._result(entry.path, entry.name, st.st_size, keyword, None)
+                elif (os.path.splitext(entry.name)[1].lower() in self.text_file_extensions
+                      and 0 < st.st_size <= self.max_file_size):
+                    future = pool.submit(self._match_content, entry.path, matcher, found_in_path)
+                    pending.append((entry.path, entry.name, st.st_size, future))
+                yield from self._completed(pending, keyword, max_pending)
+            yield from self._completed(pending, keyword, 0)
+        finally:
+            for _, _, _, future in pending:
+                future.cancel()
+
+    def _completed(self, pending: Deque, keyword: str, max_pending: int) -> Iterator[Dict]:
+        """按提交顺序取出已完成的内容匹配；未完成的任务超过 max_pending 个时等待最早的一个"""
+        while pending and (len(pending) > max_pending or pending[0][3].done()):
+            file_path, file_name, file_size, future = pending.popleft()
+            content_match = future.result()
+            if content_match:
+                yield self._result(file_path, file_name, file_size, keyword, content_match)
+
+    def _result(self, file_path: str, file_name: str, file_size: int, keyword: str,
+                content_match: Optional[Dict]) -> Dict:
+        return {
+            'file_path': file_path,
+            'file_name': file_name,
+            'file_size': file_size,
+            'relevance_score': self.calculate_relevance_score(file_name, file_path, keyword, content_match),
+            'content_preview': content_match.get('content_preview', '') if content_match else '',
+            'match_count': content_match.get('match_count', 0) if content_match else 0
+        }
 
+    def _walk(self, root: str) -> Iterator[os.DirEntry]:
+        """深度优先遍历目录下的文件，不跟随目录符号链接"""
+        # 搜索根目录本身在系统目录中时（例如 /tmp 下）不再跳过系统目录
+        skip_system = not FileScanner._is_system_path(root)
+        stack = [root]
+        while stack:
+            dir_path = stack.pop()
+            try:
+                with os.scandir(dir_path) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if not (skip_system and FileScanner._is_system_path(entry.path)):
+                                    stack.append(entry.path)
+                            elif entry.is_file():
+                                yield entry
+                        except OSError as e:
+                            logger.debug(f"读取目录项失败 {entry.path}: {e}")
+            except OSError as e:
+                logger.debug(f"读取目录失败 {dir_path}: {e}")
 
+    def shutdown(self):
+        """关闭内容匹配线程池"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
 
+search_service = SearchService(
+    workers=settings.LIVE_SEARCH_WORKERS,
+    max_file_size=settings.LIVE_SEARCH_MAX_FILE_SIZE,
+    max_results=settings.LIVE_SEARCH_MAX_RESULTS,
+)
@@ -0,0 +1,525 @@
+"""
+文件变化实时监听
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+import logging
+import sys
+sys.path.append(str(Path(__file__).parent.parent))
+from config import settings
+from app.database import db
+from app.scanner import FileScanner
+from app.pipeline import BatchWriter
+from app.indexer import content_indexer
+from app.jobs import scan_job_manager
+
+logger = logging.getLogger(__name__)
+
+# inotify 事件掩码（linux/inotify.h）
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+
+# 每个目录订阅的事件：内容写入、属性变化、新建、删除、移入移出，以及目录自身被删除或移走
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+
+# struct inotify_event { int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[]; }
+_EVENT = struct.Struct('iIII')
+
+class Inotify:
+    """libc inotify 接口的最小封装"""
+
+    def __init__(self):
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, "实时监听只支持 Linux（inotify）")
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self._libc = libc
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise self._error("inotify_init1")
+
+    @staticmethod
+    def _error(call: str, path: Optional[str] = None) -> OSError:
+        code = ctypes.get_errno()
+        return OSError(code, f"{call}: {os.strerror(code)}", path)
+
+    def add_watch(self, path: str, mask: int) -> int:
+        """监听一个目录，返回 watch 描述符；同一个目录重复添加时返回原描述符"""
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise self._error("inotify_add_watch", path)
+        return wd
+
+    def rm_watch(self, wd: int):
+        """取消监听；目录已被删除时内核已自动移除，忽略错误"""
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self, timeout: float) -> List[Tuple[int, int, str]]:
+        """等待最多 timeout 秒，返回 (wd, mask, name) 列表"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 256 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            wd, mask, _cookie, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+def _path_in(path: str, root_path: str) -> bool:
+    return path == root_path or path.startswith(root_path.rstrip('/') + '/')
+
+class FileWatcher:
+    """基于 inotify 的实时监听：目录中的文件变化直接增量写入 files 表，不需要重新扫描
+
+    每个目录一个 watch。读取线程只把事件记入待处理表，同一路径的多次事件合并为一条；
+    写入线程等路径安静 debounce 秒后（持续写入的文件最多等 max_delay 秒）重新 stat，
+    文件存在则 upsert，不存在则删除记录。新建或移入的目录做一次增量遍历，删除或移出的目录按前缀删除。
+    内核事件队列溢出（或待处理路径超过 max_pending）时无法确定丢了哪些变化，对监听的根目录启动一次增量扫描任务。
+    """
+
+    def __init__(self, database, indexer=None, job_manager=None, debounce: float = 2.0,
+                 max_delay: float = 30.0, max_pending: int = 100000, batch_size: int = 1000):
+        self.database = database
+        self.indexer = indexer
+        self.job_manager = job_manager
+        self.debounce = max(0.1, debounce)
+        self.max_delay = max(self.debounce, max_delay)
+        self.max_pending = max(1, max_pending)
+        self.batch_size = max(1, batch_size)
+        self.scanner = FileScanner(
+            max_file_size=settings.MAX_FILE_SIZE,
+            workers=settings.SCAN_WORKERS,
+            queue_size=settings.SCAN_QUEUE_SIZE,
+            max_pending_hashes=settings.HASH_MAX_PENDING,
+        )
+        self._inotify: Optional[Inotify] = None
+        self._roots: Dict[str, str] = {}
+        self._wd_paths: Dict[int, str] = {}
+        self._path_wds: Dict[str, int] = {}
+        # 待处理路径 {path: [首次事件时间, 最近事件时间]}
+        self._dirty_files: Dict[str, List[float]] = {}
+        self._dirty_dirs: Dict[str, List[float]] = {}
+        self._resync_roots: Set[str] = set()
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self.stats = {
+            'events': 0,
+            'files_updated': 0,
+            'files_deleted': 0,
+            'dirs_synced': 0,
+            'overflows': 0,
+            'watch_limit_reached': False,
+            'last_flush_time': None,
+        }
+
+    @property
+    def available(self) -> bool:
+        return self._inotify is not None
+
+    def _ensure_started(self):
+        """首次监听时创建 inotify 实例和后台线程；系统不支持时抛出 OSError"""
+        with self._start_lock:
+            if self._inotify is not None:
+                return
+            self._inotify = Inotify()
+            self._stop.clear()
+            self._threads = [
+                threading.Thread(target=self._read_loop, name="watcher-read", daemon=True),
+                threading.Thread(target=self._flush_loop, name="watcher-flush", daemon=True),
+            ]
+            for thread in self._threads:
+                thread.start()
+            logger.info("文件实时监听已启动")
+
+    def start(self, root_path: str, sync: bool = True) -> Dict:
+        """开始监听根目录；sync 为 True 时随后做一次增量扫描，补上监听之前发生的变化"""
+        root = Path(root_path)
+        if not root.exists():
+            raise ValueError(f"路径不存在: {root_path}")
+        if not root.is_dir():
+            raise ValueError(f"路径不是目录: {root_path}")
+        root_path = str(root.resolve())
+
+        self._ensure_started()
+        with self._lock:
+            watching = root_path in self._roots
+        if not watching:
+            # 监听的根目录和扫描根目录一一对应，写入时由数据库维护其汇总
+            self.database.register_scan_root(root_path)
+            watches = self._add_tree(root_path)
+            with self._lock:
+                self._roots[root_path] = datetime.now().isoformat()
+            self.database.set_scan_root_watch(root_path, True)
+            logger.info(f"开始监听 {root_path}: {watches} 个目录")
+            if sync:
+                # watch 已经建立，之后的变化不会遗漏，此时再补齐之前的变化
+                with self._lock:
+                    self._resync_roots.add(root_path)
+        return self.get(root_path)
+
+    def stop(self, root_path: str) -> bool:
+        """停止监听根目录，未在监听时返回 False"""
+        root_path = str(Path(root_path).resolve())
+        with self._lock:
+            if self._roots.pop(root_path, None) is None:
+                return False
+            others = list(self._roots)
+            for table in (self._dirty_files, self._dirty_dirs):
+                for path in [p for p in table if _path_in(p, root_path)]:
+                    del table[path]
+            self._resync_roots.discard(root_path)
+        # 仍属于其他监听根目录的子目录保留 watch
+        self._remove_tree(root_path, keep=lambda path: any(_path_in(path, other) for other in others))
+        self.database.set_scan_root_watch(root_path, False)
+        logger.info(f"停止监听 {root_path}")
+        return True
+
+    def restore(self) -> int:
+        """启动时恢复上次进程中开启的监听，返回恢复的根目录数"""
+        restored = 0
+        for root_path in self.database.get_watched_roots():
+            try:
+                # 进程停止期间的变化没有事件，恢复后做一次增量扫描
+                self.start(root_path, sync=True)
+                restored += 1
+            except Exception as e:
+                logger.warning(f"恢复监听 {root_path} 失败: {e}")
+        return restored
+
+    def get(self, root_path: str) -> Optional[Dict]:
+        """单个监听根目录的状态"""
+        with self._lock:
+            since = self._roots.get(root_path)
+            if since is None:
+                return None
+            watches = sum(1 for path in self._path_wds if _path_in(path, root_path))
+            pending = sum(1 for table in (self._dirty_files, self._dirty_dirs)
+                          for path in table if _path_in(path, root_path))
+        return {'root_path': root_path, 'watching_since': since, 'watches': watches, 'pending': pending}
+
+    def list_roots(self) -> Dict:
+        """所有监听根目录的状态和累计计数"""
+        with self._lock:
+            roots = list(self._roots)
+            watches = len(self._wd_paths)
+            pending = len(self._dirty_files) + len(self._dirty_dirs)
+        return {
+            'available': self.available,
+            'roots': [info for info in (self.get(root) for root in roots) if info is not None],
+            'watches': watches,
+            'pending': pending,
+            **self.stats,
+        }
+
+    def shutdown(self, timeout: float = 5.0):
+        """停止后台线程；未写入的变化由下次启动后的增量扫描补齐"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        with self._start_lock:
+            if self._inotify is not None:
+                self._inotify.close()
+                self._inotify = None
+        with self._lock:
+            self._roots.clear()
+            self._wd_paths.clear()
+            self._path_wds.clear()
+            self._dirty_files.clear()
+            self._dirty_dirs.clear()
+            self._resync_roots.clear()
+
+    # ---------------------------------------------------------------
+    # watch 管理
+    # ---------------------------------------------------------------
+
+    def _add_tree(self, root_path: str) -> int:
+        """为目录及其所有子目录添加 watch，返回添加的数量"""
+        added = 0
+        stack = [root_path]
+        while stack:
+            dir_path = stack.pop()
+            if self.scanner._is_system_path(dir_path):
+                continue
+            try:
+                wd = self._inotify.add_watch(dir_path, WATCH_MASK)
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    if not self.stats['watch_limit_reached']:
+                        logger.warning("inotify watch 数量已达上限，其余目录不会被监听，"
+                                       "可调大 /proc/sys/fs/inotify/max_user_watches")
+                    self.stats['watch_limit_reached'] = True
+                    break
+                # 目录已被删除或无权限
+                logger.debug(f"监听目录失败 {dir_path}: {e}")
+                continue
+            with self._lock:
+                old_path = self._wd_paths.get(wd)
+                if old_path is not None and old_path != dir_path:
+                    self._path_wds.pop(old_path, None)
+                self._wd_paths[wd] = dir_path
+                self._path_wds[dir_path] = wd
+            added += 1
+            try:
+                with os.scandir(dir_path) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+            except OSError as e:
+                logger.debug(f"读取目录失败 {dir_path}: {e}")
+        return added
+
+    def _remove_tree(self, root_path: str, keep=None):
+        """取消目录及其子目录的 watch"""
+        with self._lock:
+            removed = [(path, wd) for path, wd in self._path_wds.items()
+                       if _path_in(path, root_path) and not (keep and keep(path))]
+            for path, wd in removed:
+                del self._path_wds[path]
+                self._wd_paths.pop(wd, None)
+        inotify = self._inotify
+        if inotify is not None:
+            for _, wd in removed:
+                inotify.rm_watch(wd)
+
+    # ---------------------------------------------------------------
+    # 事件读取与合并
+    # ---------------------------------------------------------------
+
+    def _read_loop(self):
+        while not self._stop.is_set():
+            try:
+                events = self._inotify.read_events(0.5)
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                logger.error(f"读取 inotify 事件失败: {e}")
+                time.sleep(1)
+                continue
+            for wd, mask, name in events:
+                try:
+                    self._handle_event(wd, mask, name)
+                except Exception as e:
+                    logger.warning(f"处理文件事件失败: {e}")
+
+    @staticmethod
+    def _mark(table: Dict[str, List[float]], path: str):
+        now = time.monotonic()
+        entry = table.get(path)
+        if entry is None:
+            table[path] = [now, now]
+        else:
+            entry[1] = now
+
+    def _overflow(self):
+        """丢失了事件：放弃待处理路径，对所有监听的根目录做增量扫描"""
+        self.stats['overflows'] += 1
+        logger.warning("文件事件过多或队列溢出，将对监听目录做增量扫描")
+        with self._lock:
+            self._dirty_files.clear()
+            self._dirty_dirs.clear()
+            self._resync_roots.update(self._roots)
+
+    def _handle_event(self, wd: int, mask: int, name: str):
+        self.stats['events'] += 1
+        if mask & IN_Q_OVERFLOW:
+            self._overflow()
+            return
+        with self._lock:
+            if mask & IN_IGNORED:
+                # watch 已被内核移除（目录被删除或 rm_watch）
+                path = self._wd_paths.pop(wd, None)
+                if path is not None and self._path_wds.get(path) == wd:
+                    del self._path_wds[path]
+                return
+            directory = self._wd_paths.get(wd)
+            is_root = directory in self._roots
+        if directory is None:
+            return
+
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            # 子目录由父目录的事件处理；根目录本身被删除或移走时按目录同步
+            if is_root:
+                self._remove_tree(directory)
+                with self._lock:
+                    self._mark(self._dirty_dirs, directory)
+            return
+        if not name:
+            return
+
+        path = os.path.join(directory, name)
+        if self.scanner._is_system_path(path):
+            return
+        with self._lock:
+            if any(_path_in(path, root) for root in self._resync_roots):
+                # 即将做增量扫描的根目录下无需逐个记录；事件仍需处理目录的 watch 增减
+                if not mask & IN_ISDIR:
+                    return
+        if mask & IN_ISDIR:
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                self._remove_tree(path)
+            elif mask & (IN_CREATE | IN_MOVED_TO):
+                # 先建立 watch 再同步，目录中随后出现的文件不会遗漏
+                self._add_tree(path)
+            else:
+                return
+            with self._lock:
+                self._mark(self._dirty_dirs, path)
+        else:
+            with self._lock:
+                self._mark(self._dirty_files, path)
+
+        with self._lock:
+            pending = len(self._dirty_files) + len(self._dirty_dirs)
+        if pending > self.max_pending:
+            self._overflow()
+
+    # ---------------------------------------------------------------
+    # 写入数据库
+    # ---------------------------------------------------------------
+
+    def _take_due(self, table: Dict[str, List[float]], now: float) -> List[str]:
+        """取出已安静 debounce 秒或等待超过 max_delay 秒的路径"""
+        due = [path for path, (first, last) in table.items()
+               if now - last >= self.debounce or now - first >= self.max_delay]
+        for path in due:
+            del table[path]
+        return due
+
+    def _flush_loop(self):
+        interval = min(1.0, self.debounce / 2)
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"写入文件变化失败: {e}")
+
+    def flush(self):
+        """把到期的变化写入数据库"""
+        now = time.monotonic()
+        with self._lock:
+            resync = [root for root in self._resync_roots if root in self._roots]
+            self._resync_roots.clear()
+            dirs = self._take_due(self._dirty_dirs, now)
+            files = self._take_due(self._dirty_files, now)
+
+        for root_path in resync:
+            self._resync(root_path)
+
+        # 嵌套的目录只同步最外层
+        synced = []
+        for dir_path in sorted(dirs):
+            if not any(_path_in(dir_path, parent) for parent in synced):
+                synced.append(dir_path)
+        files = [path for path in files if not any(_path_in(path, parent) for parent in synced)]
+
+        try:
+            for dir_path in synced:
+                self._sync_directory(dir_path)
+            self._apply_files(files)
+        except Exception:
+            # 数据库暂时不可用时保留这些路径，下一轮重试
+            with self._lock:
+                for dir_path in synced:
+                    self._mark(self._dirty_dirs, dir_path)
+                for path in files:
+                    self._mark(self._dirty_files, path)
+            raise
+        if synced or files:
+            self.stats['last_flush_time'] = datetime.now().isoformat()
+
+    def _resync(self, root_path: str):
+        """对根目录做增量扫描；有扫描任务管理器时作为可查询进度的扫描任务运行"""
+        try:
+            if self.job_manager is not None:
+                job = self.job_manager.start(root_path, recursive=True, incremental=True)
+                logger.info(f"监听目录 {root_path} 的增量扫描任务: {job['id']}")
+            else:
+                with self._lock:
+                    self._mark(self._dirty_dirs, root_path)
+        except Exception as e:
+            logger.error(f"启动增量扫描失败 {root_path}: {e}")
+
+    def _apply_files(self, paths: List[str]):
+        """重新 stat 变化的文件：存在则 upsert，已消失（或不再是可扫描的文件）则删除记录"""
+        if not paths:
+            return
+        upserts, gone = [], []
+        for path in paths:
+            file_info = self.scanner.get_file_info(path)
+            if file_info is not None:
+                upserts.append(file_info)
+            else:
+                gone.append(path)
+
+        if upserts:
+            writer = BatchWriter(self.database, batch_size=self.batch_size, indexer=self.indexer)
+            self.stats['files_updated'] += writer.drain(upserts)
+        if gone:
+            self.stats['files_deleted'] += self.database.delete_files_by_paths(gone)
+        logger.debug(f"实时监听写入 {len(upserts)} 个文件，删除 {len(gone)} 个")
+
+    def _sync_directory(self, dir_path: str):
+        """同步整个目录：已不存在时按前缀删除记录，否则做一次增量遍历"""
+        self.stats['dirs_synced'] += 1
+        if not os.path.isdir(dir_path) or os.path.islink(dir_path):
+            self.stats['files_deleted'] += self.database.delete_files_by_path_prefix(dir_path)
+            return
+
+        known_files = self.database.get_file_signatures(dir_path)
+        writer = BatchWriter(self.database, batch_size=self.batch_size, indexer=self.indexer)
+        files = self.scanner.iter_directory(dir_path, recursive=True, known_files=known_files)
+        try:
+            self.stats['files_updated'] += writer.drain(files)
+        finally:
+            files.close()
+        if self.scanner.completed and known_files:
+            self.stats['files_deleted'] += self.database.delete_files_by_paths(list(known_files))
+
+file_watcher = FileWatcher(
+    db,
+    indexer=content_indexer,
+    job_manager=scan_job_manager,
+    debounce=settings.WATCH_DEBOUNCE_SECONDS,
+    max_delay=settings.WATCH_MAX_DELAY_SECONDS,
+    max_pending=settings.WATCH_MAX_PENDING,
+    batch_size=settings.SCAN_BATCH_SIZE,
+)
@@ -12,14 +12,65 @@ class Settings(BaseSettings):
     DB_USER: str = os.getenv("DB_USER", "root@sys")
     DB_PASSWORD: str = os.getenv("DB_PASSWORD", "admin@123")
     DB_NAME: str = os.getenv("DB_NAME", "iseek")
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))  # 连接池最大连接数
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # 等待可用连接的超时时间（秒）
+    DB_POOL_HEALTH_CHECK_INTERVAL: float = float(os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", "30"))  # 空闲超过该秒数的连接借出前做健康检查
+    DB_POOL_RECYCLE: float = float(os.getenv("DB_POOL_RECYCLE", "3600"))  # 连接最长存活时间（秒）
     
     # 阿里云大模型配置
     DASHSCOPE_API_KEY: str = os.getenv("DASHSCOPE_API_KEY", "sk-06114d7fbe584c1cbd48d8b6508daa96")
     DASHSCOPE_MODEL: str = os.getenv("DASHSCOPE_MODEL", "qwen-turbo")
+    AI_WORKERS: int = int(os.getenv("AI_WORKERS", "4"))  # 并发大模型请求的线程数
+    AI_TASK_TIMEOUT: float = float(os.getenv("AI_TASK_TIMEOUT", "30"))  # 后台大模型任务的超时时间（秒）
+    AI_TASK_TTL: float = float(os.getenv("AI_TASK_TTL", "600"))  # 大模型任务结果保留时间（秒）
+    AI_CACHE_TTL: float = float(os.getenv("AI_CACHE_TTL", "3600"))  # 大模型响应缓存时间（秒）
+    AI_CACHE_MAX_ENTRIES: int = int(os.getenv("AI_CACHE_MAX_ENTRIES", "1000"))  # 内存中缓存的大模型响应数上限
+    AI_CACHE_PATH: str = os.getenv("AI_CACHE_PATH", "")  # 大模型响应的 SQLite 缓存文件，为空时只缓存在内存中
+    
+    # 接口线程池配置
+    IO_WORKERS: int = int(os.getenv("IO_WORKERS", "4"))  # 目录树等文件系统请求的线程数
+    DUPLICATE_VERIFY_WORKERS: int = int(os.getenv("DUPLICATE_VERIFY_WORKERS", "2"))  # 同时进行的重复候选确认请求数
     
     # 扫描配置
     DEFAULT_SCAN_PATH: str = os.getenv("DEFAULT_SCAN_PATH", "/")
     MAX_FILE_SIZE: int = int(os.getenv("MAX_FILE_SIZE", "104857600"))  # 100MB
+    SCAN_WORKERS: int = int(os.getenv("SCAN_WORKERS", "8"))  # 并行遍历目录的线程数
+    SCAN_QUEUE_SIZE: int = int(os.getenv("SCAN_QUEUE_SIZE", "10000"))  # 扫描结果队列上限
+    SCAN_BATCH_SIZE: int = int(os.getenv("SCAN_BATCH_SIZE", "1000"))  # 每批写入数据库的文件数
+    SCAN_CHECKPOINT_INTERVAL: float = float(os.getenv("SCAN_CHECKPOINT_INTERVAL", "30"))  # 扫描任务保存断点的最短间隔（秒）
+    SCAN_RESUME_ON_STARTUP: bool = os.getenv("SCAN_RESUME_ON_STARTUP", "true").lower() in ("1", "true", "yes")  # 启动时自动续扫中断的任务
+    HASH_ALGORITHM: str = os.getenv("HASH_ALGORITHM", "blake2b")  # blake2b/blake2s/sha256/sha1/md5，安装 xxhash 后可用 xxh3_128/xxh3_64/xxh64
+    HASH_WORKERS: int = int(os.getenv("HASH_WORKERS", "4"))  # 哈希进程池的进程数
+    HASH_CHUNK_SIZE: int = int(os.getenv("HASH_CHUNK_SIZE", "1048576"))  # 哈希读取缓冲区大小（1MB）
+    HASH_INLINE_MAX_SIZE: int = int(os.getenv("HASH_INLINE_MAX_SIZE", "65536"))  # 不超过该大小的文件由遍历线程直接计算哈希
+    HASH_MAX_PENDING: int = int(os.getenv("HASH_MAX_PENDING", "256"))  # 进程池中同时排队的哈希任务上限
+    HASH_PARTIAL_THRESHOLD: int = int(os.getenv("HASH_PARTIAL_THRESHOLD", "0"))  # 超过该大小的文件只哈希开头、结尾和大小，0 表示不启用
+    HASH_PARTIAL_BYTES: int = int(os.getenv("HASH_PARTIAL_BYTES", "1048576"))  # 部分哈希时开头和结尾各读取的字节数
+    DUPLICATE_PARTIAL_BYTES: int = int(os.getenv("DUPLICATE_PARTIAL_BYTES", "65536"))  # 确认重复候选时先比较开头和结尾各多少字节
+    DUPLICATE_VERIFY_GROUPS: int = int(os.getenv("DUPLICATE_VERIFY_GROUPS", "100"))  # 每次确认的相同大小分组数上限
+    WATCH_DEBOUNCE_SECONDS: float = float(os.getenv("WATCH_DEBOUNCE_SECONDS", "2"))  # 实时监听：路径安静多少秒后写入数据库
+    WATCH_MAX_DELAY_SECONDS: float = float(os.getenv("WATCH_MAX_DELAY_SECONDS", "30"))  # 持续变化的文件最多延迟多少秒写入
+    WATCH_MAX_PENDING: int = int(os.getenv("WATCH_MAX_PENDING", "100000"))  # 待处理路径超过该数量时改为增量扫描
+    WATCH_WORKERS: int = int(os.getenv("WATCH_WORKERS", "2"))  # 开启、停止实时监听的线程数（为整棵目录树添加监听可能耗时很长）
+    WATCH_RESTORE_ON_STARTUP: bool = os.getenv("WATCH_RESTORE_ON_STARTUP", "true").lower() in ("1", "true", "yes")  # 启动时恢复之前开启的监听
+    DIR_CACHE_TTL: float = float(os.getenv("DIR_CACHE_TTL", "30"))  # 目录树缓存的最长有效期（秒），目录修改时间变化时立即失效
+    DIR_CACHE_MAX_ENTRIES: int = int(os.getenv("DIR_CACHE_MAX_ENTRIES", "10000"))  # 目录树缓存的目录数上限
+    LIVE_SEARCH_WORKERS: int = int(os.getenv("LIVE_SEARCH_WORKERS", "8"))  # 实时搜索读取文件内容的线程数，也是同时进行的实时搜索请求数上限
+    LIVE_SEARCH_MAX_FILE_SIZE: int = int(os.getenv("LIVE_SEARCH_MAX_FILE_SIZE", "5242880"))  # 实时搜索读取内容的文件大小上限（5MB）
+    LIVE_SEARCH_MAX_RESULTS: int = int(os.getenv("LIVE_SEARCH_MAX_RESULTS", "1000"))  # 实时搜索找到该数量的结果后停止
+    INDEX_MAX_FILE_SIZE: int = int(os.getenv("INDEX_MAX_FILE_SIZE", "5242880"))  # 建立内容索引的文件大小上限（5MB）
+    INDEX_MAX_TERMS_PER_FILE: int = int(os.getenv("INDEX_MAX_TERMS_PER_FILE", "500"))  # 每个文件保留的高频词项数
+    BM25_K1: float = float(os.getenv("BM25_K1", "1.2"))  # 内容相关性 BM25 的词频饱和参数
+    BM25_B: float = float(os.getenv("BM25_B", "0.75"))  # 内容相关性 BM25 的文档长度归一化参数
+    COUNT_CACHE_TTL: float = float(os.getenv("COUNT_CACHE_TTL", "60"))  # 列表/搜索总数的缓存时间（秒）
+    QUERY_CACHE_TTL: float = float(os.getenv("QUERY_CACHE_TTL", "300"))  # 文件列表/搜索/统计结果的最长缓存时间（秒），写入时按路径提前失效
+    QUERY_CACHE_MAX_ENTRIES: int = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "512"))  # 查询结果缓存的条目数上限
+    QUERY_CACHE_MAX_ROWS: int = int(os.getenv("QUERY_CACHE_MAX_ROWS", "200000"))  # 查询结果缓存的总行数上限
+    EXPORT_FETCH_SIZE: int = int(os.getenv("EXPORT_FETCH_SIZE", "1000"))  # 流式导出每次从服务端游标读取的行数
+    SEARCH_COUNT_LIMIT: int = int(os.getenv("SEARCH_COUNT_LIMIT", "10000"))  # 搜索结果超过该数量时只返回估计总数
+    DIRECTORY_CACHE_SIZE: int = int(os.getenv("DIRECTORY_CACHE_SIZE", "100000"))  # 内存中缓存的目录路径 → 目录 ID 数量
+    DIRECTORY_BACKFILL_BATCH: int = int(os.getenv("DIRECTORY_BACKFILL_BATCH", "5000"))  # 为旧记录回填 dir_id 时每批处理的文件数
+    DB_BATCH_SIZE: int = int(os.getenv("DB_BATCH_SIZE", "500"))  # 单条多行 upsert 语句的行数
     
     class Config:
         env_file = ".env"
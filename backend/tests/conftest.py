@@ -0,0 +1,7 @@
+"""
+测试配置：让测试可以像应用一样导入 config 和 app 包
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -0,0 +1,70 @@
+"""
+查询结果缓存
+"""
+from app.cache import QueryCache
+
+def test_get_returns_missing_then_value():
+    cache = QueryCache()
+    assert cache.get('k') is QueryCache.MISSING
+    cache.set('k', [1], scope=None, rows=1, generation=cache.generation())
+    assert cache.get('k') == [1]
+
+def test_set_is_dropped_after_invalidation_during_query():
+    cache = QueryCache()
+    generation = cache.generation()
+    cache.invalidate('/data/a')
+    cache.set('k', 'stale', scope='/data/b', rows=1, generation=generation)
+    assert cache.get('k') is QueryCache.MISSING
+
+def test_invalidate_path_removes_overlapping_and_unscoped_entries():
+    cache = QueryCache()
+    generation = cache.generation()
+    cache.set('parent', 1, scope='/data', rows=1, generation=generation)
+    cache.set('child', 2, scope='/data/a/b', rows=1, generation=generation)
+    cache.set('sibling', 3, scope='/data/ab', rows=1, generation=generation)
+    cache.set('other', 4, scope='/srv', rows=1, generation=generation)
+    cache.set('search', 5, scope=None, rows=1, generation=generation)
+
+    cache.invalidate('/data/a')
+
+    assert cache.get('parent') is QueryCache.MISSING
+    assert cache.get('child') is QueryCache.MISSING
+    assert cache.get('search') is QueryCache.MISSING
+    assert cache.get('sibling') == 3
+    assert cache.get('other') == 4
+
+def test_invalidate_unscoped_keeps_scoped_entries():
+    cache = QueryCache()
+    generation = cache.generation()
+    cache.set('list', 1, scope='/data', rows=1, generation=generation)
+    cache.set('search', 2, scope=None, rows=1, generation=generation)
+    cache.invalidate_unscoped()
+    assert cache.get('list') == 1
+    assert cache.get('search') is QueryCache.MISSING
+    assert cache.generation() == generation + 1
+
+def test_invalidate_all():
+    cache = QueryCache()
+    cache.set('list', 1, scope='/data', rows=1, generation=cache.generation())
+    cache.invalidate()
+    assert cache.get('list') is QueryCache.MISSING
+    assert cache.metrics()['rows'] == 0
+
+def test_row_limit_evicts_least_recently_used():
+    cache = QueryCache(maxsize=10, max_rows=10)
+    generation = cache.generation()
+    cache.set('a', 'a', scope=None, rows=4, generation=generation)
+    cache.set('b', 'b', scope=None, rows=4, generation=generation)
+    cache.get('a')
+    cache.set('c', 'c', scope=None, rows=4, generation=generation)
+    assert cache.get('b') is QueryCache.MISSING
+    assert cache.get('a') == 'a'
+    assert cache.get('c') == 'c'
+    # 超过总行数上限的结果不缓存
+    cache.set('big', 'big', scope=None, rows=11, generation=generation)
+    assert cache.get('big') is QueryCache.MISSING
+
+def test_entries_expire_after_ttl():
+    cache = QueryCache(ttl=-1)
+    cache.set('k', 1, scope=None, rows=1, generation=cache.generation())
+    assert cache.get('k') is QueryCache.MISSING
@@ -0,0 +1,23 @@
+"""
+索引词项切分
+"""
+from app.indexer import tokenize
+
+def test_tokenize_cjk_bigrams():
+    assert tokenize('年度报告') == ['年度', '度报', '报告']
+
+def test_tokenize_single_cjk_character_is_kept():
+    assert tokenize('表') == ['表']
+
+def test_tokenize_mixed_text():
+    terms = tokenize('Q3 财务报告 Final')
+    assert terms[:2] == ['q3', 'final']
+    assert sorted(terms[2:]) == sorted(['财务', '务报', '报告'])
+
+def test_tokenize_kana_and_hangul():
+    assert tokenize('テスト') == ['テス', 'スト']
+    assert tokenize('한국어') == ['한국', '국어']
+
+def test_tokenize_query_matches_indexed_terms():
+    # 查询关键词使用同一个函数切分，其词项是文档词项的子集
+    assert set(tokenize('财务报告')) <= set(tokenize('2024 年财务报告汇总'))
@@ -0,0 +1,49 @@
+"""
+多词项查询解析和匹配
+"""
+from app.matcher import QueryMatcher, parse_query
+
+def test_parse_query_and_binds_tighter_than_or():
+    assert parse_query('a b OR c') == [['a', 'b'], ['c']]
+    assert parse_query('a | b') == [['a'], ['b']]
+
+def test_parse_query_phrases_case_and_duplicates():
+    assert parse_query('"Hello World" foo FOO') == [['hello world', 'foo']]
+
+def test_parse_query_only_operators_falls_back_to_raw_text():
+    assert parse_query('OR') == [['or']]
+    assert parse_query('   ') == []
+
+def test_scan_finds_term_spanning_chunk_boundary():
+    matcher = QueryMatcher([['needle']], chunk_size=16)
+    data = b'x' * 13 + b'NEEDLE' + b'x' * 40
+    found, count, first_span = matcher.scan(data)
+    assert found == {0}
+    assert count == 1
+    assert first_span == (13, 19)
+
+def test_scan_counts_match_in_overlap_once():
+    # 重叠区按最长词项取 7 字节，短词项会完整落在重叠区内，只能在一个块中计数
+    matcher = QueryMatcher([['abcdefgh'], ['ab']], chunk_size=16)
+    found, count, _ = matcher.scan(b'ab' * 20)
+    assert found == {matcher.terms.index('ab')}
+    assert count == 20
+
+def test_scan_overlapping_and_contained_terms():
+    matcher = QueryMatcher(parse_query('abc bc OR zzz'), chunk_size=8)
+    found, _, _ = matcher.scan(b'-' * 7 + b'abc' + b'-' * 20)
+    assert {matcher.terms[i] for i in found} == {'abc', 'bc'}
+    assert matcher.is_match(found)
+
+def test_scan_non_ascii_terms_across_chunks():
+    matcher = QueryMatcher([['报告']], chunk_size=8)
+    data = 'x' * 7 + '年度报告'
+    found, count, first_span = matcher.scan(data.encode('utf-8'))
+    assert found == {0}
+    assert count == 1
+    assert data.encode('utf-8')[first_span[0]:first_span[1]].decode('utf-8') == '报告'
+
+def test_scan_requires_all_terms_of_a_clause():
+    matcher = QueryMatcher(parse_query('alpha beta'), chunk_size=8)
+    found, _, _ = matcher.scan(b'alpha only' * 5)
+    assert not matcher.is_match(found)
@@ -0,0 +1,37 @@
+"""
+游标分页
+"""
+import base64
+import json
+
+import pytest
+
+from app.pagination import decode_cursor, encode_cursor
+
+def test_cursor_round_trip():
+    keys = ['2024-01-02T03:04:05', 42]
+    token = encode_cursor('files', keys)
+    assert '=' not in token
+    assert decode_cursor('files', token, 2) == keys
+
+def test_cursor_round_trip_non_ascii_and_nested():
+    keys = [1.5, 7, {'idf': {'报告': 0.3}, 'avgdl': 12.0}]
+    assert decode_cursor('search', encode_cursor('search', keys), 3) == keys
+
+def _raw(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii')
+
+@pytest.mark.parametrize('token', [
+    '',
+    'not a cursor',
+    '!!!',
+    base64.urlsafe_b64encode(b'\xff\xfe').decode('ascii'),
+    _raw([1, 2]),
+    _raw({'t': 'files'}),
+    _raw({'t': 'files', 'k': 'abc'}),
+    _raw({'t': 'files', 'k': [1]}),
+    _raw({'t': 'search', 'k': [1, 2]}),
+])
+def test_decode_rejects_malformed_cursor(token):
+    with pytest.raises(ValueError):
+        decode_cursor('files', token, 2)
@@ -0,0 +1,82 @@
+"""
+增量扫描：未变化的文件不产出，遍历中没有出现的已有记录即为已消失的文件
+"""
+import os
+
+import pytest
+
+from app.scanner import FileScanner
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch):
+    # 临时目录通常位于 /tmp，扫描器默认把它当作系统目录跳过
+    monkeypatch.setattr(FileScanner, 'SYSTEM_DIRS', set())
+    root = tmp_path.resolve() / 'root'
+    (root / 'sub').mkdir(parents=True)
+    (root / 'a.txt').write_text('alpha')
+    (root / 'sub' / 'b.txt').write_text('beta')
+    (root / 'sub' / 'c.txt').write_text('gamma')
+    return root
+
+def _scan(root, known_files=None, recursive=True):
+    scanner = FileScanner(workers=2)
+    files = list(scanner.iter_directory(str(root), recursive=recursive, known_files=known_files))
+    return scanner, files
+
+def _signatures(files):
+    return {f['file_path']: {'file_size': f['file_size'], 'modified_time': f['modified_time'],
+                             'file_hash': f['file_hash']} for f in files}
+
+def test_full_scan_reports_all_files(tree):
+    scanner, files = _scan(tree)
+    assert {os.path.relpath(f['file_path'], tree) for f in files} == {
+        'a.txt', os.path.join('sub', 'b.txt'), os.path.join('sub', 'c.txt')}
+    assert scanner.completed
+
+def test_incremental_scan_detects_vanished_and_new_files(tree):
+    _, files = _scan(tree)
+    known_files = _signatures(files)
+    known_files[str(tree / 'gone.txt')] = {'file_size': 1, 'modified_time': None, 'file_hash': None}
+    (tree / 'sub' / 'b.txt').unlink()
+    (tree / 'new.txt').write_text('new')
+
+    scanner, files = _scan(tree, known_files)
+
+    assert scanner.completed
+    assert [f['file_path'] for f in files] == [str(tree / 'new.txt')]
+    assert scanner.unchanged_count == 2
+    assert set(known_files) == {str(tree / 'gone.txt'), str(tree / 'sub' / 'b.txt')}
+
+def test_incremental_scan_reports_modified_file(tree):
+    _, files = _scan(tree)
+    known_files = _signatures(files)
+    (tree / 'a.txt').write_text('alpha, longer')
+
+    _, files = _scan(tree, known_files)
+
+    assert [f['file_path'] for f in files] == [str(tree / 'a.txt')]
+    assert known_files == {}
+
+@pytest.mark.skipif(hasattr(os, 'geteuid') and os.geteuid() == 0, reason='root 可以读取任何目录')
+def test_incremental_scan_keeps_records_under_unreadable_directory(tree):
+    _, files = _scan(tree)
+    known_files = _signatures(files)
+    os.chmod(tree / 'sub', 0)
+    try:
+        scanner, files = _scan(tree, known_files)
+    finally:
+        os.chmod(tree / 'sub', 0o755)
+    assert files == []
+    assert known_files == {}
+
+def test_non_recursive_scan_leaves_subdirectory_records_alone(tree):
+    _, files = _scan(tree)
+    known_files = {path: sig for path, sig in _signatures(files).items()
+                   if os.path.dirname(path) == str(tree)}
+    (tree / 'a.txt').unlink()
+
+    scanner, files = _scan(tree, known_files, recursive=False)
+
+    assert files == []
+    assert scanner.completed
+    assert set(known_files) == {str(tree / 'a.txt')}
@@ -6,6 +6,16 @@ CREATE DATABASE IF NOT EXISTS iseek DEFAULT CHARACTER SET utf8mb4 COLLATE utf8mb
 
 USE iseek;
 
+-- 文件种类字典：扩展名、MIME 类型和文件类型的组合只保存一次
+CREATE TABLE IF NOT EXISTS file_kinds (
+    id INT UNSIGNED PRIMARY KEY AUTO_INCREMENT,
+    kind_key CHAR(32) NOT NULL COMMENT '(file_type, file_extension, mime_type) 的 MD5',
+    file_type VARCHAR(100) COMMENT '文件类型',
+    file_extension VARCHAR(50) COMMENT '文件扩展名',
+    mime_type VARCHAR(200) COMMENT 'MIME类型',
+    UNIQUE KEY uk_kind_key (kind_key)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='文件种类字典表';
+
 -- 文件信息表
 CREATE TABLE IF NOT EXISTS files (
     id BIGINT PRIMARY KEY AUTO_INCREMENT,
@@ -14,17 +24,25 @@ CREATE TABLE IF NOT EXISTS files (
     file_size BIGINT NOT NULL COMMENT '文件大小（字节）',
     file_type VARCHAR(100) COMMENT '文件类型（image/video/document等）',
     file_extension VARCHAR(50) COMMENT '文件扩展名',
-    mime_type VARCHAR(200) COMMENT 'MIME类型',
+    mime_type VARCHAR(200) COMMENT 'MIME类型（旧记录或 kind_id 为空的记录；其余通过 kind_id 查 file_kinds）',
+    kind_id INT UNSIGNED COMMENT '文件种类ID（file_kinds）',
+    flags TINYINT UNSIGNED NOT NULL DEFAULT 0 COMMENT '标志位：1 符号链接，2 可读',
+    dir_id BIGINT COMMENT '所在目录ID（directories）',
     created_time DATETIME COMMENT '文件创建时间',
     modified_time DATETIME COMMENT '文件修改时间',
-    file_hash VARCHAR(64) COMMENT '文件MD5哈希值',
-    metadata TEXT COMMENT '文件元数据（JSON格式）',
+    file_hash VARCHAR(64) COMMENT '文件哈希值（算法见 hash_type）',
+    hash_type VARCHAR(32) COMMENT '哈希算法，部分哈希带 -partial 后缀',
+    metadata TEXT COMMENT '文件元数据（JSON格式，旧记录；新记录使用 flags）',
     scan_time DATETIME DEFAULT CURRENT_TIMESTAMP COMMENT '扫描时间',
     INDEX idx_file_path (file_path(255)),
+    INDEX idx_dir_id (dir_id),
     INDEX idx_file_name (file_name(255)),
     INDEX idx_file_type (file_type),
     INDEX idx_scan_time (scan_time),
-    INDEX idx_file_size (file_size)
+    INDEX idx_file_size (file_size),
+    INDEX idx_size_hash (file_size, file_hash),
+    FULLTEXT INDEX ft_file_name (file_name) WITH PARSER ngram,
+    FULLTEXT INDEX ft_file_path (file_path) WITH PARSER ngram
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='文件信息表';
 
 -- 搜索索引表
@@ -32,6 +50,7 @@ CREATE TABLE IF NOT EXISTS file_index (
     id BIGINT PRIMARY KEY AUTO_INCREMENT,
     file_id BIGINT NOT NULL COMMENT '文件ID',
     keyword VARCHAR(500) NOT NULL COMMENT '关键词',
+    term_freq INT DEFAULT 0 COMMENT '词项在文件中出现的次数',
     content_preview TEXT COMMENT '内容预览',
     match_score FLOAT DEFAULT 0.0 COMMENT '匹配分数',
     created_time DATETIME DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
@@ -41,6 +60,77 @@ CREATE TABLE IF NOT EXISTS file_index (
     INDEX idx_match_score (match_score)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='文件搜索索引表';
 
+-- 目录表（只增不删，ID 保持稳定）
+CREATE TABLE IF NOT EXISTS directories (
+    id BIGINT PRIMARY KEY AUTO_INCREMENT,
+    path VARCHAR(2000) NOT NULL COMMENT '目录完整路径',
+    path_hash CHAR(32) NOT NULL COMMENT '路径的 MD5',
+    parent_id BIGINT COMMENT '上级目录ID，根目录为空',
+    depth SMALLINT NOT NULL DEFAULT 0 COMMENT '目录深度，/ 为 0',
+    UNIQUE KEY uk_path_hash (path_hash),
+    INDEX idx_parent_id (parent_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='目录表';
+
+-- 目录祖先表（闭包表，每个目录的全部祖先，含自身）
+CREATE TABLE IF NOT EXISTS directory_ancestors (
+    ancestor_id BIGINT NOT NULL COMMENT '祖先目录ID',
+    dir_id BIGINT NOT NULL COMMENT '目录ID',
+    PRIMARY KEY (ancestor_id, dir_id),
+    INDEX idx_dir_id (dir_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='目录祖先表';
+
+-- 内容索引文档长度表（BM25 长度归一化）
+CREATE TABLE IF NOT EXISTS file_index_docs (
+    file_id BIGINT PRIMARY KEY COMMENT '文件ID',
+    doc_length INT NOT NULL DEFAULT 0 COMMENT '文件的词项总数',
+    FOREIGN KEY (file_id) REFERENCES files(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='内容索引文档长度表';
+
+-- 扫描根目录汇总表
+CREATE TABLE IF NOT EXISTS scan_roots (
+    id BIGINT PRIMARY KEY AUTO_INCREMENT,
+    root_path VARCHAR(2000) NOT NULL COMMENT '扫描根目录',
+    path_hash CHAR(32) NOT NULL COMMENT '根目录路径的MD5，用于唯一索引',
+    file_count BIGINT NOT NULL DEFAULT 0 COMMENT '根目录下的文件数',
+    total_bytes BIGINT NOT NULL DEFAULT 0 COMMENT '根目录下的文件总字节数',
+    last_scan_time DATETIME COMMENT '最近一次扫描完成时间',
+    watch_enabled BOOLEAN NOT NULL DEFAULT FALSE COMMENT '是否实时监听文件变化',
+    UNIQUE KEY uk_path_hash (path_hash)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='扫描根目录汇总表';
+
+-- 文件统计汇总表（随文件写入增量维护，/api/statistics 直接读取）
+CREATE TABLE IF NOT EXISTS file_stats (
+    dimension VARCHAR(20) NOT NULL COMMENT '统计维度: total/type/extension/size',
+    dim_key VARCHAR(100) NOT NULL COMMENT '维度取值: 文件类型、扩展名或大小区间',
+    file_count BIGINT NOT NULL DEFAULT 0 COMMENT '文件数',
+    total_bytes BIGINT NOT NULL DEFAULT 0 COMMENT '文件总字节数',
+    PRIMARY KEY (dimension, dim_key)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='文件统计汇总表';
+
+-- 扫描任务表
+CREATE TABLE IF NOT EXISTS scan_jobs (
+    id BIGINT PRIMARY KEY AUTO_INCREMENT,
+    root_path VARCHAR(2000) NOT NULL COMMENT '扫描根目录',
+    recursive_scan BOOLEAN NOT NULL DEFAULT TRUE COMMENT '是否递归扫描',
+    incremental BOOLEAN NOT NULL DEFAULT FALSE COMMENT '是否增量扫描',
+    status VARCHAR(20) NOT NULL COMMENT '任务状态：pending/running/completed/failed/cancelled/interrupted',
+    dirs_scanned BIGINT NOT NULL DEFAULT 0 COMMENT '已处理目录数',
+    files_scanned BIGINT NOT NULL DEFAULT 0 COMMENT '已遍历文件数（含未变化的文件）',
+    files_saved BIGINT NOT NULL DEFAULT 0 COMMENT '已写入文件数',
+    files_deleted BIGINT NOT NULL DEFAULT 0 COMMENT '已删除的旧记录数',
+    bytes_scanned BIGINT NOT NULL DEFAULT 0 COMMENT '已遍历文件总字节数',
+    error_count BIGINT NOT NULL DEFAULT 0 COMMENT '错误数',
+    files_per_second DOUBLE NOT NULL DEFAULT 0 COMMENT '扫描速率',
+    frontier LONGTEXT COMMENT '遍历前沿（JSON目录列表），用于断点续扫',
+    error_message TEXT COMMENT '失败原因',
+    created_time DATETIME DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+    started_time DATETIME COMMENT '开始时间',
+    finished_time DATETIME COMMENT '结束时间',
+    checkpoint_time DATETIME COMMENT '最近一次保存断点的时间',
+    INDEX idx_status (status),
+    INDEX idx_created_time (created_time)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='扫描任务表';
+
 -- 统计记录表
 CREATE TABLE IF NOT EXISTS statistics (
     id BIGINT PRIMARY KEY AUTO_INCREMENT,
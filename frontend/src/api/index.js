@@ -6,21 +6,114 @@ const api = axios.create({
 })
 
 // 扫描目录
-export const scanDirectory = async (path, recursive = true, forceRescan = false) => {
+export const scanDirectory = async (path, recursive = true, forceRescan = false, incremental = false) => {
   const response = await api.post('/scan', null, {
-    params: { path, recursive, force_rescan: forceRescan },
+    params: { path, recursive, force_rescan: forceRescan, incremental },
   })
   return response.data
 }
 
+// 扫描任务列表
+export const getScanJobs = async (status = null, limit = 20) => {
+  const params = { limit }
+  if (status) {
+    params.status = status
+  }
+  const response = await api.get('/scan/jobs', { params })
+  return response.data
+}
+
+// 扫描任务进度
+export const getScanJob = async (jobId) => {
+  const response = await api.get(`/scan/jobs/${jobId}`)
+  return response.data
+}
+
+// 取消扫描任务
+export const cancelScanJob = async (jobId) => {
+  const response = await api.post(`/scan/jobs/${jobId}/cancel`)
+  return response.data
+}
+
+// 从断点继续扫描任务
+export const resumeScanJob = async (jobId) => {
+  const response = await api.post(`/scan/jobs/${jobId}/resume`)
+  return response.data
+}
+
+// 实时监听目录，文件变化直接更新索引
+export const startWatch = async (path, sync = true) => {
+  const response = await api.post('/watch', null, { params: { path, sync } })
+  return response.data
+}
+
+// 停止监听目录
+export const stopWatch = async (path) => {
+  const response = await api.delete('/watch', { params: { path } })
+  return response.data
+}
+
+// 监听中的目录和计数
+export const getWatches = async () => {
+  const response = await api.get('/watch')
+  return response.data
+}
+
 // 搜索文件
-export const searchFiles = async (keyword, limit = 100, offset = 0) => {
-  const response = await api.get('/search', {
-    params: { keyword, limit, offset },
-  })
+// cursor 为上一页返回的 next_cursor，提供时忽略 offset
+export const searchFiles = async (keyword, limit = 100, offset = 0, cursor = null) => {
+  const params = { keyword, limit, offset }
+  if (cursor) {
+    params.cursor = cursor
+  }
+  const response = await api.get('/search', { params })
   return response.data
 }
 
+// 实时搜索磁盘目录（不使用索引），结果按 NDJSON 逐行返回，每收到一条调用一次 onResult
+export const searchLive = async (keyword, path, onResult, limit = null, signal = undefined) => {
+  const params = new URLSearchParams({ keyword, path })
+  if (limit !== null) {
+    params.append('limit', limit)
+  }
+  const response = await fetch(`${api.defaults.baseURL}/search/live?${params.toString()}`, { signal })
+  if (!response.ok) {
+    const error = await response.json().catch(() => ({}))
+    throw new Error(error.detail || `Live search failed: ${response.status}`)
+  }
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  for (;;) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+    const lines = buffer.split('\n')
+    buffer = lines.pop()
+    lines.filter(Boolean).forEach((line) => onResult(JSON.parse(line)))
+  }
+  if (buffer.trim()) {
+    onResult(JSON.parse(buffer))
+  }
+}
+
+// 大模型后台任务状态
+export const getAITask = async (taskId) => {
+  const response = await api.get(`/ai/tasks/${taskId}`)
+  return response.data
+}
+
+// 轮询大模型后台任务直到结束，返回任务信息（status 为 completed/failed/timeout）
+export const waitForAITask = async (taskId, intervalMs = 1000) => {
+  for (;;) {
+    const { task } = await getAITask(taskId)
+    if (task.status !== 'pending' && task.status !== 'running') {
+      return task
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs))
+  }
+}
+
 // 获取统计信息
 export const getStatistics = async () => {
   const response = await api.get('/statistics')
@@ -28,7 +121,7 @@ export const getStatistics = async () => {
 }
 
 // 获取文件列表（pathPrefix 现在是必需的）
-export const getFiles = async (pathPrefix, fileType = null, limit = null, offset = 0) => {
+export const getFiles = async (pathPrefix, fileType = null, limit = null, offset = 0, cursor = null) => {
   if (!pathPrefix) {
     throw new Error('pathPrefix is required')
   }
@@ -42,10 +135,45 @@ export const getFiles = async (pathPrefix, fileType = null, limit = null, offset
   if (limit !== null) {
     params.limit = limit
   }
+  if (cursor) {
+    params.cursor = cursor
+  }
   const response = await api.get('/files', { params })
   return response.data
 }
 
+// 文件导出地址（流式 NDJSON/CSV，由浏览器直接下载，不经过 axios 缓冲）
+export const getFilesExportUrl = (pathPrefix, fileType = null, format = 'csv') => {
+  const params = new URLSearchParams({ path_prefix: pathPrefix, format })
+  if (fileType) {
+    params.append('file_type', fileType)
+  }
+  return `${api.defaults.baseURL}/files/export?${params.toString()}`
+}
+
+// 重复文件分组
+export const getDuplicates = async (pathPrefix = null, minSize = 1, limit = 50, offset = 0) => {
+  const params = { min_size: minSize, limit, offset }
+  if (pathPrefix) {
+    params.path_prefix = pathPrefix
+  }
+  const response = await api.get('/duplicates', { params })
+  return response.data
+}
+
+// 确认缺少完整哈希的重复候选；beforeSize 为上一次返回的 next_before_size
+export const verifyDuplicates = async (pathPrefix = null, minSize = 1, beforeSize = null) => {
+  const params = { min_size: minSize }
+  if (pathPrefix) {
+    params.path_prefix = pathPrefix
+  }
+  if (beforeSize !== null) {
+    params.before_size = beforeSize
+  }
+  const response = await api.post('/duplicates/verify', null, { params })
+  return response.data
+}
+
 // 生成SQL查询
 export const generateSQL = async (query) => {
   const response = await api.post('/generate-sql', null, {
@@ -68,11 +196,19 @@ export const healthCheck = async () => {
   return response.data
 }
 
-// 获取目录树
-export const getDirectoryTree = async (rootPath = '/', maxDepth = 10) => {
+// 获取目录树（默认只展开一层，更深的层级用 getDirectoryChildren 按需加载）
+export const getDirectoryTree = async (rootPath = '/', maxDepth = 1) => {
   const response = await api.get('/directory-tree', {
     params: { root_path: rootPath, max_depth: maxDepth },
   })
   return response.data
 }
 
+// 获取一个目录的直接子目录
+export const getDirectoryChildren = async (path) => {
+  const response = await api.get('/directory-tree/children', {
+    params: { path },
+  })
+  return response.data
+}
+
@@ -16,7 +16,7 @@ import {
   ScanOutlined,
   ReloadOutlined,
 } from '@ant-design/icons'
-import { getDirectoryTree, scanDirectory } from '../api'
+import { getDirectoryTree, getDirectoryChildren, scanDirectory } from '../api'
 import '../App.css'
 
 const { Title, Text } = Typography
@@ -38,7 +38,7 @@ function DirectoryTreePage({ onNavigate }) {
   const loadDirectoryTree = async () => {
     setLoading(true)
     try {
-      const response = await getDirectoryTree('/', 10)
+      const response = await getDirectoryTree('/', 1)
       if (response.success) {
         const formattedTree = formatTreeData([response.tree])
         setTreeData(formattedTree)
@@ -98,14 +98,39 @@ function DirectoryTreePage({ onNavigate }) {
         key: key,
         path: node.path,
         icon: <FolderOutlined />,
-        children: node.children && node.children.length > 0
-          ? formatTreeData(node.children, key)
-          : undefined,
+        // has_children 为 null 表示无法预先判断，保留展开按钮
+        isLeaf: node.has_children === false,
+        children: node.children ? formatTreeData(node.children, key) : undefined,
       }
       return formattedNode
     })
   }
 
+  // 展开节点时再加载它的子目录
+  const onLoadData = async (treeNode) => {
+    if (treeNode.children) {
+      return
+    }
+    try {
+      const response = await getDirectoryChildren(treeNode.path)
+      const children = formatTreeData(response.children || [], treeNode.key)
+      setTreeData((nodes) => replaceChildren(nodes, treeNode.key, children))
+    } catch (error) {
+      message.error('Failed to load directory: ' + error.message)
+    }
+  }
+
+  const replaceChildren = (nodes, key, children) =>
+    nodes.map((node) => {
+      if (node.key === key) {
+        return { ...node, children, isLeaf: children.length === 0 }
+      }
+      if (node.children) {
+        return { ...node, children: replaceChildren(node.children, key, children) }
+      }
+      return node
+    })
+
   const handleNodeSelect = (path) => {
     setSelectedPath(path)
     message.info(`Selected path: ${path}`)
@@ -298,6 +323,7 @@ function DirectoryTreePage({ onNavigate }) {
                 onExpand={onExpand}
                 expandedKeys={expandedKeys}
                 autoExpandParent={autoExpandParent}
+                loadData={onLoadData}
                 treeData={displayTreeData}
                 style={{
                   color: '#000000',
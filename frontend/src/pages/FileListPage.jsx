@@ -22,9 +22,10 @@ import {
   SyncOutlined,
   HomeOutlined,
   FolderOutlined,
-  FolderOpenOutlined
+  FolderOpenOutlined,
+  DownloadOutlined
 } from '@ant-design/icons'
-import { getFiles, scanDirectory, getDirectoryTree } from '../api'
+import { getFiles, getFilesExportUrl, scanDirectory, getDirectoryTree, getDirectoryChildren, getScanJob } from '../api'
 import '../App.css'
 
 const { Title, Text } = Typography
@@ -84,6 +85,29 @@ function FileListPage({ onNavigate }) {
     }
   }
 
+  // 轮询扫描任务进度，任务结束后刷新文件列表
+  const pollScanJob = (jobId) => {
+    const timer = setInterval(async () => {
+      try {
+        const response = await getScanJob(jobId)
+        const job = response.job
+        if (job.status !== 'running' && job.status !== 'pending') {
+          clearInterval(timer)
+          loadFiles()
+          setScanning(false)
+          if (job.status === 'completed') {
+            message.success(`Scan completed: ${job.files_saved} files saved`)
+          } else {
+            message.warning(`Scan ${job.status}${job.error_message ? ': ' + job.error_message : ''}`)
+          }
+        }
+      } catch (error) {
+        clearInterval(timer)
+        setScanning(false)
+      }
+    }, 3000)
+  }
+
   const handleScan = async (forceRescan = false) => {
     if (!searchPath.trim()) {
       message.warning('Please enter the path to scan')
@@ -103,10 +127,14 @@ function FileListPage({ onNavigate }) {
           setScanning(false)
         } else if (response.status === 'processing') {
           message.info(response.message || 'Scan task started, processing in background...')
-          setTimeout(() => {
-            loadFiles()
-            setScanning(false)
-          }, 3000)
+          if (response.job_id) {
+            pollScanJob(response.job_id)
+          } else {
+            setTimeout(() => {
+              loadFiles()
+              setScanning(false)
+            }, 3000)
+          }
         } else {
           message.success(response.message || 'Scan completed')
           loadFiles()
@@ -140,7 +168,7 @@ function FileListPage({ onNavigate }) {
   const loadDirectoryTree = async () => {
     setTreeLoading(true)
     try {
-      const response = await getDirectoryTree('/', 10)
+      const response = await getDirectoryTree('/', 1)
       if (response.success && response.tree) {
         const treeNode = convertTreeData(response.tree)
         if (treeNode) {
@@ -169,10 +197,11 @@ function FileListPage({ onNavigate }) {
       key: key,
       path: node.path,
       icon: <FolderOutlined />,
-      children: []
+      // has_children 为 null 表示无法预先判断，保留展开按钮
+      isLeaf: node.has_children === false,
     }
 
-    if (node.children && node.children.length > 0) {
+    if (node.children) {
       treeNode.children = node.children
         .map((child) => convertTreeData(child, key))
         .filter(Boolean)
@@ -181,6 +210,33 @@ function FileListPage({ onNavigate }) {
     return treeNode
   }
 
+  // 展开节点时再加载它的子目录
+  const handleTreeLoadData = async (treeNode) => {
+    if (treeNode.children) {
+      return
+    }
+    try {
+      const response = await getDirectoryChildren(treeNode.path)
+      const children = (response.children || [])
+        .map((child) => convertTreeData(child, treeNode.key))
+        .filter(Boolean)
+      setTreeData((nodes) => replaceTreeChildren(nodes, treeNode.key, children))
+    } catch (error) {
+      message.error('Failed to load directory: ' + error.message)
+    }
+  }
+
+  const replaceTreeChildren = (nodes, key, children) =>
+    nodes.map((node) => {
+      if (node.key === key) {
+        return { ...node, children, isLeaf: children.length === 0 }
+      }
+      if (node.children) {
+        return { ...node, children: replaceTreeChildren(node.children, key, children) }
+      }
+      return node
+    })
+
   // 处理树节点选择
   const handleTreeSelect = (selectedKeys, info) => {
     if (selectedKeys.length > 0) {
@@ -390,6 +446,18 @@ function FileListPage({ onNavigate }) {
               <Option value="archive">Archive</Option>
               <Option value="other">Other</Option>
             </Select>
+            <Button
+              icon={<DownloadOutlined />}
+              href={currentScanPath ? getFilesExportUrl(currentScanPath, fileType) : undefined}
+              disabled={!currentScanPath}
+              style={{
+                background: '#ffffff',
+                borderColor: '#d9d9d9',
+                color: '#000000',
+              }}
+            >
+              Export CSV
+            </Button>
           </div>
         </div>
       </div>
@@ -438,6 +506,7 @@ function FileListPage({ onNavigate }) {
             selectedKeys={selectedKeys}
             onSelect={handleTreeSelect}
             onExpand={handleTreeExpand}
+            loadData={handleTreeLoadData}
             treeData={treeData}
             style={{ background: '#ffffff' }}
           />
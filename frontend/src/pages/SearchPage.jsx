@@ -20,7 +20,7 @@ import {
   FileTextOutlined,
   HomeOutlined
 } from '@ant-design/icons'
-import { searchFiles, getFiles } from '../api'
+import { searchFiles, getFiles, waitForAITask } from '../api'
 import '../App.css'
 
 const { Title, Text, Paragraph } = Typography
@@ -48,6 +48,9 @@ function SearchPage({ onNavigate }) {
         setTotal(response.total || 0)
         setAiEnhancement(response.ai_enhancement)
         message.success(`Found ${response.total} related files`)
+        if (!response.ai_enhancement && response.ai_task_id) {
+          loadAiEnhancement(response.ai_task_id)
+        }
       } else {
         message.error('Search failed')
       }
@@ -58,6 +61,18 @@ function SearchPage({ onNavigate }) {
     }
   }
 
+  // AI 增强在后台生成，完成后再显示
+  const loadAiEnhancement = async (taskId) => {
+    try {
+      const task = await waitForAITask(taskId)
+      if (task.status === 'completed') {
+        setAiEnhancement(task.result)
+      }
+    } catch (error) {
+      // AI 增强失败不影响搜索结果
+    }
+  }
+
   const handleKeyPress = (e) => {
     if (e.key === 'Enter') {
       handleSearch()
@@ -20,7 +20,7 @@ import {
   HomeOutlined
 } from '@ant-design/icons'
 import ReactECharts from 'echarts-for-react'
-import { getStatistics, generateSQL, executeSQL } from '../api'
+import { getStatistics, generateSQL, executeSQL, waitForAITask } from '../api'
 import '../App.css'
 
 const { Title, Text } = Typography
@@ -56,6 +56,9 @@ function StatisticsPage({ onNavigate }) {
         setSqlQueries(response.sql_queries || [])
         setCharts(response.charts || [])
         setInsights(response.insights || [])
+        if (response.ai_task_id && response.ai_status !== 'completed') {
+          loadAiResult(response.ai_task_id)
+        }
       } else {
         message.error('Failed to get statistics')
       }
@@ -66,6 +69,20 @@ function StatisticsPage({ onNavigate }) {
     }
   }
 
+  // AI 生成的查询和图表在后台完成后替换默认内容
+  const loadAiResult = async (taskId) => {
+    try {
+      const task = await waitForAITask(taskId)
+      if (task.status === 'completed' && task.result) {
+        setSqlQueries(task.result.sql_queries || [])
+        setCharts(task.result.charts || [])
+        setInsights(task.result.insights || [])
+      }
+    } catch (error) {
+      // 保留默认的查询和图表
+    }
+  }
+
   const handleGenerateSQL = async () => {
     if (!naturalLanguageQuery.trim()) {
       message.warning('Please enter a query in natural language')